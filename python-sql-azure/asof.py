@@ -0,0 +1,179 @@
+import bisect
+import threading
+import time
+
+from tables import TABLES
+
+# Point-in-time ("as of") lookups over the versioned tables. Every write to the BOM, routings or
+# workcentres adds a row stamped with its *_last_updated time, so the version of an entity valid
+# at time t is the row (or rows) with the latest timestamp <= t. The rows of each table are kept
+# grouped by entity and sorted by timestamp, which turns that lookup into a binary search.
+# Rows without a timestamp are never valid, like in the SQL they replace (MAX() skips NULLs).
+# The indexes are loaded once and then kept in step by the write handlers, row by row.
+
+
+class VersionIndex:
+    # Rows (dicts) of one table per key column value, sorted by the timestamp column. Changes
+    # swap in a new entry for the one key they touch, lookups never see a half-changed one.
+
+    def __init__(self, table, key, timestamp):
+        self.table = table
+        self.key = key
+        self.timestamp = timestamp
+        self.id = TABLES[table].key
+        # key -> ([timestamp, ...] ascending and distinct, [[row, ...], ...] stamped with each of them)
+        self._versions = {}
+        # id of every indexed row, upper case like the database compares them -> its key
+        self._keys = {}
+
+    def load(self, rows):
+        grouped = {}
+        for row in rows:
+            moment = row[self.timestamp]
+            if moment is None:
+                continue
+            grouped.setdefault(row[self.key], {}).setdefault(moment, []).append(row)
+        versions = {}
+        keys = {}
+        for key, stamped in grouped.items():
+            times = sorted(stamped)
+            versions[key] = (times, [stamped[moment] for moment in times])
+            keys.update((row[self.id].upper(), key) for version in stamped.values() for row in version)
+        self._versions = versions  # swapped in one go, lookups never see a half-loaded index
+        self._keys = keys
+
+    def add(self, row):
+        # Adds a row written after the load; a row already indexed under its id is replaced
+        self.remove(row[self.id])
+        moment = row[self.timestamp]
+        if moment is None:
+            return
+        key = row[self.key]
+        times, rows = self._versions.get(key, ([], []))
+        times, rows = list(times), list(rows)
+        i = bisect.bisect_left(times, moment)
+        if i < len(times) and times[i] == moment:
+            rows[i] = rows[i] + [row]
+        else:
+            times.insert(i, moment)
+            rows.insert(i, [row])
+        self._versions[key] = (times, rows)
+        self._keys[row[self.id].upper()] = key
+
+    def update(self, id_, **values):
+        self._rewrite(id_, lambda row: {**row, **values})
+
+    def remove(self, id_):
+        self._rewrite(id_, lambda row: None)
+        self._keys.pop(id_.upper(), None)
+
+    def _rewrite(self, id_, change):
+        # Swaps in the versions of id_'s key with the row id_ replaced by change(row), or
+        # dropped when that is None
+        key = self._keys.get(id_.upper())
+        if key is None:
+            return
+        times, rows = [], []
+        for moment, version in zip(*self._versions[key]):
+            version = [change(row) if row[self.id].upper() == id_.upper() else row for row in version]
+            version = [row for row in version if row is not None]
+            if version:
+                times.append(moment)
+                rows.append(version)
+        if times:
+            self._versions[key] = (times, rows)
+        else:
+            del self._versions[key]
+
+    def as_of(self, key, moment):
+        # Rows of the latest version of key at moment, [] when there was none yet
+        entry = self._versions.get(key)
+        if entry is None or moment is None:
+            return []
+        times, rows = entry
+        i = bisect.bisect_right(times, moment)
+        return rows[i - 1] if i else []
+
+    def history(self, key, moment=None):
+        # Every row of key stamped at or before moment (all of them when moment is None), oldest first
+        entry = self._versions.get(key)
+        if entry is None:
+            return []
+        times, rows = entry
+        i = len(times) if moment is None else bisect.bisect_right(times, moment)
+        return [row for version in rows[:i] for row in version]
+
+
+class AsOfIndex:
+    # Version indexes of the BOM (per parent part), routings (per BOM row) and workcentres.
+    # Writes through this process are applied with add, set_status and remove once committed; a
+    # table is only read again every ttl seconds, to notice writes made by other processes.
+
+    tables = ["BOM$", "Routings$", "Workcentre$"]
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded = {}  # table -> monotonic time
+        self.bom = VersionIndex("BOM$", "part_id", "BOM_last_updated")
+        self.routings = VersionIndex("Routings$", "BOM_id", "routings_last_update")
+        self.workcentres = VersionIndex("Workcentre$", "workcentre_id", "workcentre_last_updated")
+        self._indexes = {index.table: index for index in (self.bom, self.routings, self.workcentres)}
+
+    def refresh(self, connection):
+        with self._lock:
+            now = time.monotonic()
+            for index in self._indexes.values():
+                loaded = self._loaded.get(index.table)
+                if loaded is not None and now - loaded < self.ttl:
+                    continue
+                columns = [column for column, _ in TABLES[index.table].columns]
+                cursor = connection.cursor()
+                cursor.execute(f"SELECT {', '.join(columns)} FROM dbo.{index.table}")
+                index.load([dict(zip(columns, row)) for row in cursor.fetchall()])
+                self._loaded[index.table] = now
+
+    # The changes take the lock a reload holds, so a change is either already in the rows a
+    # reload reads or applied on top of them
+
+    def add(self, table, *rows):
+        # rows are value tuples in the column order of tables.TABLES
+        columns = [column for column, _ in TABLES[table].columns]
+        with self._lock:
+            for row in rows:
+                self._indexes[table].add(dict(zip(columns, row)))
+
+    def set_status(self, table, status, *ids):
+        with self._lock:
+            for id_ in ids:
+                self._indexes[table].update(id_, status=status)
+
+    def remove(self, table, id_):
+        with self._lock:
+            self._indexes[table].remove(id_)
+
+    def resolve(self, part_id, moment):
+        # (BOM row, routing row, workcentre row) triples of part_id valid at moment: the latest
+        # BOM version of the part, the latest routing version of each of its rows and the latest
+        # version of each routing's workcentre, each taken at moment
+        for bom in self.bom.as_of(part_id, moment):
+            for routing in self.routings.as_of(bom["BOM_id"], moment):
+                for workcentre in self.workcentres.as_of(routing["workcentre_id"], moment):
+                    yield bom, routing, workcentre
+
+    def structure(self, part_id, moment):
+        # The BOM of part_id as it stood at moment: per child, the latest row stamped at or
+        # before moment, with the routing and workcentre versions valid at the same time
+        lines = {}
+        for bom in self.bom.history(part_id, moment):
+            lines[bom["child_id"]] = bom
+        return [
+            (
+                bom,
+                [
+                    (routing, self.workcentres.as_of(routing["workcentre_id"], moment))
+                    for routing in self.routings.as_of(bom["BOM_id"], moment)
+                ],
+            )
+            for bom in lines.values()
+        ]
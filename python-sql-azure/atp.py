@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from tables import operation_hours
+
+# Available-to-promise / capable-to-promise answers for new orders, from projections that are
+# built once and then kept up to date order by order:
+#   - committed demand of every part: the open orders plus, through the active BOM, whatever
+#     their parents cannot cover from stock (lot-for-lot netting over the whole horizon)
+#   - workcentre load: hours of the open orders' routings per workcentre and due date
+# A check then only walks the BOM below the ordered part, no MRP run is needed.
+
+
+class Promising:
+    # Rebuilt when the BOM, routings, parts or workcentres change (or every ttl seconds, to pick up
+    # orders written by other processes). Orders created or deleted through this process are
+    # applied incrementally with add_order and remove_order.
+
+    tables = ["BOM$", "Routings$", "Part_Master_Records$", "Workcentre$"]
+
+    def __init__(self, bom_graph, hours_per_day=8, days_per_week=5, ttl=300):
+        self.bom_graph = bom_graph
+        self.hours_per_day = hours_per_day
+        self.days_per_week = days_per_week
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._versions = None
+        self._checked_at = 0
+        self.inventory = {}
+        self.lead_times = {}
+        self.children = {}                 # part_id -> [(child_id, child_qty, row lead time)]
+        self.operations = {}               # part_id -> [(workcentre_id, setup minutes, run minutes per unit)]
+        self.orders = {}                   # order_id -> (part_id, part_qty, due_date)
+        self.independent = Counter()       # part_id -> quantity on open orders
+        self.gross = Counter()             # part_id -> independent plus dependent demand
+        self.load = defaultdict(Counter)   # workcentre_id -> {date: hours}
+
+    def refresh(self, connection, versions):
+        with self._lock:
+            now = time.monotonic()
+            if versions == self._versions and now - self._checked_at < self.ttl:
+                return
+            self._load(connection)
+            self._versions = versions
+            self._checked_at = now
+
+    def _load(self, connection):
+        self.bom_graph.refresh(connection)
+        lines, llc = self.bom_graph.active_structure()
+        cursor = connection.cursor()
+
+        cursor.execute("SELECT part_id, inventory, lead_time FROM dbo.Part_Master_Records$")
+        parts = cursor.fetchall()
+        self.inventory = {part_id: max(inventory or 0, 0) for part_id, inventory, _ in parts}
+        self.lead_times = {part_id: lead_time or 0 for part_id, _, lead_time in parts}
+
+        cursor.execute("SELECT BOM_id, workcentre_id, setup_time, runtime FROM dbo.Routings$ WHERE status = 'active'")
+        routings = defaultdict(list)
+        for BOM_id, workcentre_id, setup_time, runtime in cursor.fetchall():
+            routings[BOM_id].append((workcentre_id, setup_time or 0, runtime or 0))
+
+        self.children = defaultdict(list)
+        self.operations = defaultdict(list)
+        for line in lines:
+            self.operations[line.part_id].extend(routings.get(line.BOM_id, ()))
+            if llc.get(line.child_id, 0) <= llc.get(line.part_id, 0):
+                continue  # closes a cycle
+            lead_time = line.child_leadtime if line.child_leadtime is not None else self.lead_times.get(line.child_id, 0)
+            self.children[line.part_id].append((line.child_id, line.child_qty or 0, lead_time or 0))
+
+        cursor.execute("SELECT order_id, part_id, part_qty, due_date FROM dbo.Orders$ WHERE status = 'processing'")
+        self.orders = {}
+        self.independent = Counter()
+        self.load = defaultdict(Counter)
+        for order_id, part_id, part_qty, due_date in cursor.fetchall():
+            self.orders[order_id] = (part_id, part_qty or 0, due_date)
+            self.independent[part_id] += part_qty or 0
+            self._add_load(part_id, part_qty or 0, due_date, 1)
+
+        # Gross demand level by level, parents before children
+        self.gross = Counter(self.independent)
+        for part in sorted(self.children, key=lambda p: llc.get(p, 0)):
+            shortage = self._shortage(part, self.gross[part])
+            if shortage:
+                for child_id, child_qty, _ in self.children[part]:
+                    self.gross[child_id] += shortage * child_qty
+
+    def _shortage(self, part_id, gross):
+        return max(gross - self.inventory.get(part_id, 0), 0)
+
+    def _add_demand(self, part_id, qty):
+        # Changes the demand for a part and passes the change in its shortage on to the children
+        stack = [(part_id, qty)]
+        while stack:
+            part, qty = stack.pop()
+            before = self._shortage(part, self.gross[part])
+            self.gross[part] += qty
+            change = self._shortage(part, self.gross[part]) - before
+            if change:
+                stack.extend((child_id, change * child_qty) for child_id, child_qty, _ in self.children.get(part, ()))
+
+    def _add_load(self, part_id, qty, due_date, sign):
+        if due_date is None:
+            return
+        for workcentre_id, setup, run in self.operations.get(part_id, ()):
+            self.load[workcentre_id][due_date.date()] += sign * operation_hours(setup, run, qty)
+
+    def add_order(self, order_id, part_id, qty, due_date):
+        with self._lock:
+            if order_id in self.orders:
+                return
+            self.orders[order_id] = (part_id, qty or 0, due_date)
+            self.independent[part_id] += qty or 0
+            self._add_demand(part_id, qty or 0)
+            self._add_load(part_id, qty or 0, due_date, 1)
+
+    def remove_order(self, order_id):
+        with self._lock:
+            order = self.orders.pop(order_id, None)
+            if order is None:
+                return
+            part_id, qty, due_date = order
+            self.independent[part_id] -= qty
+            self._add_demand(part_id, -qty)
+            self._add_load(part_id, qty, due_date, -1)
+
+    def _supply_days(self, part_id, qty, lead_time):
+        # Days until qty of part_id can be available: none when the uncommitted stock covers it,
+        # otherwise its lead time plus the longest supply time of the children it is made from
+        shortage = qty - max(self.inventory.get(part_id, 0) - self.gross[part_id], 0)
+        if shortage <= 0:
+            return 0
+        below = max(
+            (self._supply_days(child_id, shortage * child_qty, child_lead_time) for child_id, child_qty, child_lead_time in self.children.get(part_id, ())),
+            default=0,
+        )
+        return lead_time + below
+
+    def _working_days(self, start, end):
+        days = 0
+        day = start
+        while day <= end:
+            days += day.weekday() < self.days_per_week
+            day += timedelta(days=1)
+        return days
+
+    def check(self, part_id, qty, order_date, due_date):
+        with self._lock:
+            available = max(self.inventory.get(part_id, 0) - self.gross[part_id], 0)
+            supply_days = self._supply_days(part_id, qty, self.lead_times.get(part_id, 0))
+            earliest = order_date + timedelta(days=supply_days)
+
+            # Hours the order needs against the hours left between order and due date
+            required = Counter()
+            for workcentre_id, setup, run in self.operations.get(part_id, ()):
+                required[workcentre_id] += operation_hours(setup, run, qty)
+            window_hours = self._working_days(order_date.date(), due_date.date()) * self.hours_per_day
+            capacity = []
+            for workcentre_id, hours in sorted(required.items(), key=lambda item: str(item[0])):
+                booked = sum(h for day, h in self.load.get(workcentre_id, {}).items() if order_date.date() <= day <= due_date.date())
+                capacity.append({"workcentre_id": workcentre_id, "required_hours": hours, "free_hours": max(window_hours - booked, 0)})
+
+            return {
+                "part_id": part_id,
+                "part_qty": qty,
+                "due_date": due_date.isoformat(),
+                "promisable": earliest <= due_date and all(c["required_hours"] <= c["free_hours"] for c in capacity),
+                "available_qty": available,
+                "shortage": max(qty - available, 0),
+                "supply_lead_time": supply_days,
+                "earliest_date": earliest.isoformat(),
+                "capacity": capacity,
+            }
@@ -0,0 +1,185 @@
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from tables import TABLES, read_csv
+
+try:
+    import pyodbc
+except ImportError:  # only needed for the SQL Server backend
+    pyodbc = None
+
+# DB-API exception classes of every driver that may be in use, for use in except clauses
+_drivers = [sqlite3] + ([pyodbc] if pyodbc is not None else [])
+Error = tuple(driver.Error for driver in _drivers)
+DatabaseError = tuple(driver.DatabaseError for driver in _drivers)
+IntegrityError = tuple(driver.IntegrityError for driver in _drivers)
+OperationalError = tuple(driver.OperationalError for driver in _drivers)
+InterfaceError = tuple(driver.InterfaceError for driver in _drivers)
+
+
+class SqlServerBackend:
+    # Azure SQL / SQL Server through pyodbc, the production backend
+    name = "sqlserver"
+
+    def __init__(self, connection_string):
+        if pyodbc is None:
+            raise RuntimeError("pyodbc is required for the sqlserver backend")
+        if not connection_string:
+            raise RuntimeError("AZURE_SQL_CONNECTIONSTRING is not set")
+        self.connection_string = connection_string
+
+    def connect(self):
+        return pyodbc.connect(self.connection_string)
+
+    def set_query_timeout(self, connection, seconds):
+        connection.timeout = int(seconds + 0.999) if seconds else 0
+
+    def cancel(self, connection, cursors):
+        for cursor in cursors:
+            try:
+                cursor.cancel()
+            except pyodbc.Error:
+                pass
+
+    # Dialect helpers, so queries can be written once for every backend
+
+    def top(self, query, n):
+        return re.sub(r"^\s*SELECT\b", f"SELECT TOP {int(n)}", query, count=1, flags=re.I)
+
+    def id_number(self, column, prefix_length):
+        return f"CAST(SUBSTRING({column}, {prefix_length + 1}, LEN({column})-{prefix_length}) AS INT)"
+
+    def returning(self, query, column):
+        # UPDATE ... that also returns the new value of column for the updated rows
+        return re.sub(r"\s+WHERE\b", f" OUTPUT inserted.{column} WHERE", query, count=1, flags=re.I)
+
+    def ensure_id_table(self, connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute("""
+            IF OBJECT_ID('dbo.Id_Blocks$', 'U') IS NULL
+            CREATE TABLE dbo.Id_Blocks$ (entity NVARCHAR(64) NOT NULL PRIMARY KEY, next_value INT NOT NULL)
+            """)
+            connection.commit()
+        except pyodbc.Error:
+            connection.rollback()  # created by another process in the meantime
+
+    def executemany(self, cursor, query, rows):
+        # The rows go to the server as one parameter array instead of one round trip per row
+        cursor.fast_executemany = True
+        cursor.executemany(query, rows)
+
+    def ensure_tables(self, connection):
+        pass  # the schema of the Azure SQL database is managed there
+
+
+class SqliteBackend:
+    # Embedded stand-in for offline profiling and load tests. The tables live in a database
+    # attached as "dbo" so the dbo.<table>$ names used by the queries work unchanged.
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._deadlines = {}
+        self._lock = threading.Lock()
+
+    def connect(self):
+        connection = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        connection.execute("ATTACH DATABASE ? AS dbo", (self.path,))
+        connection.execute("PRAGMA dbo.journal_mode=WAL")
+        connection.execute("PRAGMA busy_timeout=30000")
+        connection.set_progress_handler(lambda: self._past_deadline(connection), 10000)
+        return connection
+
+    def set_query_timeout(self, connection, seconds):
+        with self._lock:
+            if seconds:
+                self._deadlines[id(connection)] = time.monotonic() + seconds
+            else:
+                self._deadlines.pop(id(connection), None)
+
+    def cancel(self, connection, cursors):
+        connection.interrupt()
+
+    def _past_deadline(self, connection):
+        deadline = self._deadlines.get(id(connection))
+        return 1 if deadline is not None and time.monotonic() > deadline else 0
+
+    def top(self, query, n):
+        return f"{query.rstrip()} LIMIT {int(n)}"
+
+    def id_number(self, column, prefix_length):
+        return f"CAST(SUBSTR({column}, {prefix_length + 1}) AS INTEGER)"
+
+    def returning(self, query, column):
+        return f"{query.rstrip()} RETURNING {column}"
+
+    def ensure_id_table(self, connection):
+        connection.execute("CREATE TABLE IF NOT EXISTS dbo.Id_Blocks$ (entity TEXT PRIMARY KEY, next_value INTEGER NOT NULL)")
+        connection.commit()
+
+    def executemany(self, cursor, query, rows):
+        cursor.executemany(query, rows)
+
+    def _create_table(self, connection, table):
+        # NOCASE matches the case-insensitive collation of the SQL Server database
+        columns = ", ".join(
+            f"{name} {sql_type}" + (" COLLATE NOCASE" if sql_type == "TEXT" else "")
+            for name, sql_type in table.columns
+        )
+        connection.execute(f"CREATE TABLE IF NOT EXISTS dbo.{table.name} ({columns})")
+        connection.execute(f"CREATE INDEX IF NOT EXISTS dbo.{table.name[:-1]}_key ON {table.name} ({table.key})")
+
+    def ensure_tables(self, connection):
+        for table in TABLES.values():
+            self._create_table(connection, table)
+        connection.commit()
+
+    def seed(self, data_dir, force=False):
+        # Create the five tables and bulk load them from the ESA Showcase CSV exports, when the
+        # database does not have them yet or force is set (they are dropped first). The check
+        # and the load run in one write transaction, so of several worker processes starting
+        # on the same file only the first one loads it and the others find it loaded.
+        connection = self.connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            cursor = connection.execute(f"SELECT COUNT(*) FROM dbo.sqlite_master WHERE type = 'table' AND name IN ({', '.join('?' * len(TABLES))})", list(TABLES))
+            loaded = cursor.fetchone()[0] == len(TABLES)
+            if loaded and not force:
+                connection.rollback()
+                return
+            for table in TABLES.values():
+                placeholders = ", ".join("?" for _ in table.columns)
+                connection.execute(f"DROP TABLE IF EXISTS dbo.{table.name}")
+                self._create_table(connection, table)
+                connection.executemany(f"INSERT INTO dbo.{table.name} VALUES ({placeholders})", read_csv(table, data_dir))
+            # The id counters start over from the seeded rows (see ids.py)
+            connection.execute("DROP TABLE IF EXISTS dbo.Id_Blocks$")
+            connection.commit()
+        finally:
+            connection.close()
+
+
+# Store datetimes in the same sortable text form the sqlite TIMESTAMP converter reads back
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+
+
+def create_backend(name, seed=True):
+    # An SQLite database is loaded from the CSV files when it is new, and loaded again on every
+    # start with SQLITE_RESEED=1; seed=False opens it as it is
+    if name == "sqlserver":
+        return SqlServerBackend(os.getenv("AZURE_SQL_CONNECTIONSTRING"))
+    if name == "sqlite":
+        path = os.getenv("SQLITE_PATH", os.path.join(tempfile.gettempdir(), "mso.sqlite3"))
+        data_dir = os.getenv("SEED_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+        backend = SqliteBackend(path)
+        if seed:
+            backend.seed(data_dir, force=os.getenv("SQLITE_RESEED", "0") == "1")
+        return backend
+    raise ValueError(f"Unknown DB_BACKEND {name!r}, expected 'sqlserver' or 'sqlite'")
@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Throughput of the order details endpoints, one request per order against the batch endpoint,
+# in process through the FastAPI test client. Runs on the SQLite backend seeded from the
+# showcase CSV files unless DB_BACKEND says otherwise.
+#   cd python-sql-azure
+#   python benchmarks/order_details_benchmark.py --orders 500
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.gettempdir(), "mso-benchmark.sqlite3"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from main import app, pool  # noqa: E402
+
+
+def best_of(repeat, fn):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None or elapsed < best else best
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the single and batch order details endpoints")
+    parser.add_argument("--orders", type=int, default=500, help="number of orders to fetch")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per variant, the best one is reported")
+    args = parser.parse_args()
+
+    client = TestClient(app)
+    # The most recent orders, so that the date range variant fetches (about) the same ones
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT order_id, order_date FROM dbo.Orders$ WHERE order_date IS NOT NULL ORDER BY order_date DESC, order_id")
+        orders = cursor.fetchall()[:args.orders]
+    order_ids = [order_id for order_id, _ in orders]
+    date_range = {"from_date": orders[-1][1].isoformat(), "to_date": orders[0][1].isoformat()}
+    print(f"{len(order_ids)} orders")
+
+    def single():
+        for order_id in order_ids:
+            client.get(f"/orderdetailsfull/{order_id}").json()
+
+    def batch():
+        client.post("/orderdetailsfull:batch", json={"order_ids": order_ids}).json()
+
+    def batch_stream():
+        with client.stream("POST", "/orderdetailsfull:batch", params={"stream": True}, json={"order_ids": order_ids}) as response:
+            for _ in response.iter_lines():
+                pass
+
+    def batch_range():
+        client.post("/orderdetailsfull:batch", json=date_range).json()
+
+    for name, fn in [("single", single), ("batch", batch), ("batch stream", batch_stream), ("batch date range", batch_range)]:
+        elapsed = best_of(args.repeat, fn)
+        print(f"{name:>16}: {elapsed:.3f}s  {len(order_ids) / elapsed:,.0f} orders/s")
+
+
+if __name__ == "__main__":
+    main()
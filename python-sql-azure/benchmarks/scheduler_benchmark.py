@@ -0,0 +1,72 @@
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+# Times the order scheduler on the showcase data without a database. The open orders are
+# repeated (each copy a week later) until there are --orders of them.
+#   cd python-sql-azure
+#   python benchmarks/scheduler_benchmark.py --orders 5000
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import scheduler  # noqa: E402
+from bom_graph import BomLine  # noqa: E402
+from tables import TABLES, read_csv  # noqa: E402
+
+
+def load(data_dir):
+    def rows(table, *columns):
+        names = [name for name, _ in TABLES[table].columns]
+        return [tuple(row[names.index(column)] for column in columns) for row in read_csv(TABLES[table], data_dir)]
+
+    orders = rows("Orders$", "order_id", "part_id", "part_qty", "order_date", "due_date", "status")
+    orders = [order[:5] for order in orders if (order[5] or "").lower() == "processing"]
+    routings = rows("Routings$", "routing_id", "BOM_id", "operations_sequence", "workcentre_id", "setup_time", "runtime", "status")
+    routings = [routing[:6] for routing in routings if (routing[6] or "").lower() == "active"]
+    lines = [BomLine(*row) for row in rows("BOM$", *BomLine._fields)]
+    workcentres = rows("Workcentre$", "workcentre_id", "capacity")
+    return orders, lines, routings, workcentres
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the order scheduler on the showcase data")
+    parser.add_argument("--orders", type=int, default=5000, help="number of open orders to schedule")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per rule, the best one is reported")
+    parser.add_argument("--data-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    args = parser.parse_args()
+
+    orders, lines, routings, workcentres = load(args.data_dir)
+    scaled = []
+    for copy in range(-(-args.orders // len(orders))):
+        shift = timedelta(weeks=copy)
+        scaled.extend(
+            (f"{order_id}-{copy}", part_id, qty, order_date and order_date + shift, due_date and due_date + shift)
+            for order_id, part_id, qty, order_date, due_date in orders
+        )
+    scaled = scaled[:args.orders]
+
+    calendar = scheduler.WorkingCalendar()
+    print(f"{len(scaled)} orders")
+    for rule in scheduler.RULES:
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            jobs = scheduler.build_jobs(scaled, lines, routings, workcentres, calendar)
+            built = time.perf_counter()
+            gantt = scheduler.schedule(jobs, rule)
+            scheduled = time.perf_counter()
+            report = scheduler.report(jobs, gantt, calendar)
+            reported = time.perf_counter()
+            timings = (built - started, scheduled - built, reported - scheduled, reported - started)
+            best = timings if best is None or timings[-1] < best[-1] else best
+        summary = report["summary"]
+        print(
+            f"{rule:>4}: {summary['operations']} operations, {summary['late_orders']} late | "
+            f"build {best[0]:.3f}s  schedule {best[1]:.3f}s  report {best[2]:.3f}s  total {best[3]:.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+
+BomLine = namedtuple("BomLine", ["BOM_id", "part_id", "child_id", "child_qty", "child_leadtime", "status"])
+
+
+def is_active(status):
+    # Statuses are compared case-insensitively, like the database collation does
+    return status is not None and status.lower() == "active"
+
+
+def _bits(mask):
+    # Indexes of the set bits of an int, lowest first
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _components(successors):
+    # Strongly connected components of the graph with successors[v] the list of v's successors
+    # (nodes numbered 0..n-1), by an iterative Tarjan. They come out children first.
+    n = len(successors)
+    order, low, on_stack, stack, components = [None] * n, [0] * n, [False] * n, [], []
+    counter = 0
+    for root in range(n):
+        if order[root] is not None:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, i = work.pop()
+            if i == 0:
+                order[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                on_stack[v] = True
+            if i < len(successors[v]):
+                work.append((v, i + 1))
+                w = successors[v][i]
+                if order[w] is None:
+                    work.append((w, 0))
+                elif on_stack[w]:
+                    low[v] = min(low[v], order[w])
+                continue
+            if low[v] == order[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component.append(w)
+                    if w == v:
+                        break
+                components.append(component)
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[v])
+    return components
+
+
+class Reachability:
+    # Transitive closure of a directed graph, kept as one bitset (a Python int) of descendants and
+    # one of ancestors per node, so "does x reach y" is a single bit test.
+    # Adding an edge updates the closure in place. Removing the last copy of an edge can break
+    # paths anywhere, so it marks the closure stale and the next query does a bulk rebuild.
+    # Cycles are tolerated (the data has a part listed as its own child): the rebuild works on
+    # strongly connected components.
+
+    def __init__(self):
+        self.children = defaultdict(Counter)  # node -> {child: number of edges}
+        self.parents = defaultdict(Counter)   # node -> {parent: number of edges}
+        self._index = {}
+        self._nodes = []
+        self._descendants = []
+        self._ancestors = []
+        self._llc = None
+        self._stale = False
+
+    def _node(self, node):
+        i = self._index.get(node)
+        if i is None:
+            i = self._index[node] = len(self._nodes)
+            self._nodes.append(node)
+            self._descendants.append(0)
+            self._ancestors.append(0)
+        return i
+
+    def add_edge(self, parent, child):
+        self.children[parent][child] += 1
+        self.parents[child][parent] += 1
+        self._llc = None
+        if self.children[parent][child] > 1 or self._stale:
+            return
+
+        p, c = self._node(parent), self._node(child)
+        upstream = self._ancestors[p] | (1 << p)
+        downstream = self._descendants[c] | (1 << c)
+        for a in _bits(upstream):
+            self._descendants[a] |= downstream
+        for d in _bits(downstream):
+            self._ancestors[d] |= upstream
+
+    def remove_edge(self, parent, child):
+        edges = self.children[parent]
+        if edges[child] <= 0:
+            return
+        edges[child] -= 1
+        self.parents[child][parent] -= 1
+        if edges[child] == 0:
+            del edges[child]
+            del self.parents[child][parent]
+            self._stale = True
+            self._llc = None
+
+    def rebuild(self):
+        # Bulk rebuild: condense strongly connected components (emitted children first), then OR
+        # the closure of each component into its parents.
+        self._index = {}
+        self._nodes = []
+        self._descendants = []
+        self._ancestors = []
+        for node in list(self.children) + list(self.parents):
+            self._node(node)
+
+        n = len(self._nodes)
+        successors = [[self._index[c] for c in self.children.get(node, ())] for node in self._nodes]
+        components = _components(successors)
+
+        for component in components:
+            members = 0
+            for v in component:
+                members |= 1 << v
+            reach = 0
+            for v in component:
+                for w in successors[v]:
+                    reach |= (1 << w) | self._descendants[w]
+            for v in component:
+                self._descendants[v] = reach
+        for v in range(n):
+            for d in _bits(self._descendants[v]):
+                self._ancestors[d] |= 1 << v
+        self._stale = False
+
+    def _fresh(self):
+        if self._stale:
+            self.rebuild()
+
+    def reaches(self, source, target):
+        # True when there is a path of at least one edge from source to target
+        self._fresh()
+        s, t = self._index.get(source), self._index.get(target)
+        if s is None or t is None:
+            return False
+        return bool(self._descendants[s] >> t & 1)
+
+    def descendants(self, node):
+        self._fresh()
+        i = self._index.get(node)
+        return [] if i is None else sorted(self._nodes[d] for d in _bits(self._descendants[i]))
+
+    def ancestors(self, node):
+        self._fresh()
+        i = self._index.get(node)
+        return [] if i is None else sorted(self._nodes[a] for a in _bits(self._ancestors[i]))
+
+    def reach_among(self, nodes):
+        # {node: [the other nodes of nodes it reaches]}, one bitset AND per node
+        self._fresh()
+        indexed = {self._index[node]: node for node in nodes if node in self._index}
+        mask = 0
+        for i in indexed:
+            mask |= 1 << i
+        return {node: [indexed[j] for j in _bits(self._descendants[i] & mask) if j != i] for i, node in indexed.items()}
+
+    def low_level_codes(self):
+        # Low-level code of every node: the deepest level it appears at below any top-level
+        # part, so a node is always planned after all of its parents. Edges inside a cycle
+        # are ignored.
+        if self._llc is not None:
+            return self._llc
+        self._fresh()
+        llc = {}
+        indegree = {}
+        for node, i in self._index.items():
+            indegree[node] = sum(1 for p in self.parents.get(node, ()) if not self.on_cycle(p, node))
+        ready = [node for node, degree in indegree.items() if degree == 0]
+        for node in ready:
+            llc[node] = 0
+        while ready:
+            node = ready.pop()
+            for child in self.children.get(node, ()):
+                if self.on_cycle(node, child):
+                    continue
+                llc[child] = max(llc.get(child, 0), llc[node] + 1)
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+        self._llc = llc
+        return llc
+
+    def on_cycle(self, parent, child):
+        # The edge parent -> child lies on a cycle when child reaches parent (or it is a self loop)
+        return parent == child or self.reaches(child, parent)
+
+
+class BomGraph:
+    # Process-resident adjacency index over every row of dbo.BOM$.
+    # It is loaded once, updated in place by the handlers that write BOM rows, and reloaded when a
+    # cheap fingerprint query shows the table was changed by someone else (checked at most once
+    # every ttl seconds). Cycle checks then only walk the part's reachable subgraph in memory.
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._checked_at = 0
+        self.lines = {}                # BOM_id -> BomLine
+        self.lines_by_part = defaultdict(dict)  # part_id -> {BOM_id: BomLine}
+        self.lines_by_child = defaultdict(dict)  # child_id -> {BOM_id: BomLine}, the where-used index
+        self._child_rows = {}          # part_id -> memoized single-level explosion, cleared on every change
+        self._explosions = {}          # (part_id, depth) -> memoized explosion of one unit, likewise
+        self.all = Reachability()      # every row, used for cycle checks
+        self.active = Reachability()   # active rows only, the current product structure
+
+    def refresh(self, connection):
+        # Make sure the index reflects the database, call before reading it in a request
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded and now - self._checked_at < self.ttl:
+                return
+            if not self._loaded or self._fingerprint_from_db(connection) != self._fingerprint():
+                self._load(connection)
+            self._checked_at = now
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def _fingerprint_from_db(self, connection):
+        cursor = connection.cursor()
+        cursor.execute("""
+        SELECT COUNT(*), MAX(BOM_id), SUM(CASE WHEN status = 'active' THEN 1 ELSE 0 END)
+        FROM dbo.BOM$
+        """)
+        count, max_id, active = cursor.fetchone()
+        return (count, max_id, active or 0)
+
+    def _fingerprint(self):
+        active = sum(1 for line in self.lines.values() if is_active(line.status))
+        return (len(self.lines), max(self.lines, default=None), active)
+
+    def _load(self, connection):
+        cursor = connection.cursor()
+        cursor.execute("SELECT BOM_id, part_id, child_id, child_qty, child_leadtime, status FROM dbo.BOM$")
+        self.lines = {}
+        self.lines_by_part = defaultdict(dict)
+        self.lines_by_child = defaultdict(dict)
+        self._child_rows = {}
+        self._explosions = {}
+        self.all = Reachability()
+        self.active = Reachability()
+        for row in cursor.fetchall():
+            line = BomLine(*row)
+            self.lines[line.BOM_id] = line
+            self.lines_by_part[line.part_id][line.BOM_id] = line
+            self.lines_by_child[line.child_id][line.BOM_id] = line
+            self.all.children[line.part_id][line.child_id] += 1
+            self.all.parents[line.child_id][line.part_id] += 1
+            if is_active(line.status):
+                self.active.children[line.part_id][line.child_id] += 1
+                self.active.parents[line.child_id][line.part_id] += 1
+        # One bulk closure build instead of inserting the rows edge by edge
+        self.all.rebuild()
+        self.active.rebuild()
+        self._loaded = True
+
+    def _add(self, line):
+        self.lines[line.BOM_id] = line
+        self.lines_by_part[line.part_id][line.BOM_id] = line
+        self.lines_by_child[line.child_id][line.BOM_id] = line
+        self._child_rows = {}
+        self._explosions = {}
+        self.all.add_edge(line.part_id, line.child_id)
+        if is_active(line.status):
+            self.active.add_edge(line.part_id, line.child_id)
+
+    def _remove(self, BOM_id):
+        line = self.lines.pop(BOM_id, None)
+        if line is None:
+            return None
+        del self.lines_by_part[line.part_id][line.BOM_id]
+        del self.lines_by_child[line.child_id][line.BOM_id]
+        self._child_rows = {}
+        self._explosions = {}
+        self.all.remove_edge(line.part_id, line.child_id)
+        if is_active(line.status):
+            self.active.remove_edge(line.part_id, line.child_id)
+        return line
+
+    # Incremental maintenance, called by the handlers once their transaction has committed
+
+    def add_line(self, line):
+        with self._lock:
+            self._remove(line.BOM_id)
+            self._add(line)
+
+    def remove_line(self, BOM_id):
+        with self._lock:
+            self._remove(BOM_id)
+
+    def set_status(self, BOM_id, status):
+        with self._lock:
+            line = self.lines.get(BOM_id)
+            if line is not None:
+                self._remove(BOM_id)
+                self._add(line._replace(status=status))
+
+    # Queries
+
+    def would_create_cycle(self, part_id, child_id):
+        # Adding part_id -> child_id closes a cycle when part_id is reachable from child_id
+        with self._lock:
+            return part_id == child_id or self.all.reaches(child_id, part_id)
+
+    def batch_cycles(self, edges):
+        # Positions of the (part_id, child_id) edges of a batch that would lie on a cycle once the
+        # whole batch is added, [] when none does. The parts the batch touches form a small graph
+        # of the existing paths between them plus the batch's edges; an edge is on a cycle when
+        # both its ends are in the same strongly connected component of it.
+        with self._lock:
+            nodes = sorted({node for edge in edges for node in edge})
+            index = {node: i for i, node in enumerate(nodes)}
+            successors = [[] for _ in nodes]
+            for node, reached in self.all.reach_among(nodes).items():
+                successors[index[node]].extend(index[other] for other in reached)
+            for part_id, child_id in edges:
+                successors[index[part_id]].append(index[child_id])
+
+            component = {}
+            for number, members in enumerate(_components(successors)):
+                for i in members:
+                    component[nodes[i]] = number
+            return [
+                position for position, (part_id, child_id) in enumerate(edges)
+                if part_id == child_id or component[part_id] == component[child_id]
+            ]
+
+    def ancestors(self, part_id, include_inactive=False):
+        with self._lock:
+            return (self.all if include_inactive else self.active).ancestors(part_id)
+
+    def descendants(self, part_id, include_inactive=False):
+        with self._lock:
+            return (self.all if include_inactive else self.active).descendants(part_id)
+
+    def active_structure(self):
+        # Consistent snapshot of the active rows and their low-level codes, for planning runs
+        with self._lock:
+            lines = [line for line in self.lines.values() if is_active(line.status)]
+            return lines, dict(self.active.low_level_codes())
+
+    def child_rows(self, part_id):
+        # Single-level explosion of the active BOM below part_id, as a tuple of
+        # (BOM_id, child_id, child_qty) rows. Rows on a cycle are left out, so that exploding
+        # through them ends. Memoized per part until the next change.
+        with self._lock:
+            rows = self._child_rows.get(part_id)
+            if rows is None:
+                rows = []
+                for BOM_id in sorted(self.lines_by_part.get(part_id, ())):
+                    line = self.lines_by_part[part_id][BOM_id]
+                    if is_active(line.status) and not self.active.on_cycle(part_id, line.child_id):
+                        rows.append((BOM_id, line.child_id, line.child_qty or 0))
+                rows = self._child_rows[part_id] = tuple(rows)
+            return rows
+
+    def explode(self, part_id, qty=1, depth=None):
+        # Multi-level explosion of the active BOM below qty of part_id, generating
+        # (level, BOM_id, parent_id, child_id, child_qty, extended_qty) rows in depth-first order,
+        # down to depth levels (all of them when None).
+        for level, BOM_id, parent_id, child_id, child_qty, extended in self._explode(part_id, depth):
+            yield level, BOM_id, parent_id, child_id, child_qty, extended * qty
+
+    def _explode(self, part_id, depth):
+        # The explosion of one unit of part_id, generated while it is walked. A walk that runs to
+        # the end is memoized, so a sub-assembly is walked once (per depth left below it) and
+        # every further occurrence, in this request or a later one, replays its rows scaled by
+        # the quantity it is used in. The lock is not held between rows, so a long stream sees
+        # BOM changes made while it runs; its rows are then not memoized.
+        memo = self._explosions
+        rows = memo.get((part_id, depth))
+        if rows is not None:
+            yield from rows
+            return
+
+        rows = []
+        for BOM_id, child_id, child_qty in self.child_rows(part_id):
+            row = (1, BOM_id, part_id, child_id, child_qty, child_qty)
+            rows.append(row)
+            yield row
+            if depth is None or depth > 1:
+                for level, sub_BOM_id, parent_id, sub_child_id, sub_child_qty, extended in self._explode(child_id, None if depth is None else depth - 1):
+                    row = (level + 1, sub_BOM_id, parent_id, sub_child_id, sub_child_qty, extended * child_qty)
+                    rows.append(row)
+                    yield row
+        with self._lock:
+            if memo is self._explosions:
+                memo[(part_id, depth)] = tuple(rows)
+
+    def is_referenced(self, part_id):
+        # True when any BOM row, active or not, uses the part as parent or child
+        with self._lock:
+            return bool(self.lines_by_part.get(part_id)) or bool(self.lines_by_child.get(part_id))
+
+    def where_used(self, part_id, full=False):
+        # Active BOM rows that consume part_id, as (level, BOM_id, parent_id, child_id, child_qty)
+        # rows. With full=True every chain is followed up to the top-level parts, depth-first.
+        def users(child_id):
+            return sorted(line for line in self.lines_by_child.get(child_id, {}).values() if is_active(line.status))
+
+        with self._lock:
+            rows = []
+            stack = [(1, iter(users(part_id)), (part_id,))]
+            while stack:
+                level, lines, path = stack[-1]
+                line = next(lines, None)
+                if line is None:
+                    stack.pop()
+                    continue
+                rows.append((level, line.BOM_id, line.part_id, line.child_id, line.child_qty))
+                if full and line.part_id not in path:
+                    stack.append((level + 1, iter(users(line.part_id)), path + (line.part_id,)))
+            return rows
+
+    def top_level_parents(self, part_id):
+        # Parts at the top of the active structure (used by nobody) that consume part_id
+        with self._lock:
+            return [p for p in self.active.ancestors(part_id) if not self.active.parents.get(p)]
@@ -0,0 +1,135 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+# Parsing and validation of bulk uploads. A whole upload is read into one frame and every check
+# runs on whole columns; rows are only looked at one by one to report the ones that failed.
+
+CSV_TYPES = ("text/csv", "application/csv")
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+class BulkFormatError(ValueError):
+    pass
+
+
+def read_rows(body, content_type):
+    # Frame of the uploaded rows: a JSON array of objects, NDJSON (one object per line) or CSV
+    # with a header line. CSV values are kept as text, the checks convert them.
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+    if media_type in CSV_TYPES:
+        try:
+            return pd.read_csv(io.BytesIO(body), dtype=str, keep_default_na=False, na_values=[""])
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+            raise BulkFormatError(f"Invalid CSV: {e}")
+
+    if media_type in NDJSON_TYPES:
+        records = []
+        for number, line in enumerate(body.decode("utf-8").splitlines(), start=1):
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except ValueError as e:
+                    raise BulkFormatError(f"Invalid JSON on line {number}: {e}")
+    elif media_type == "application/json":
+        try:
+            records = json.loads(body or b"[]")
+        except ValueError as e:
+            raise BulkFormatError(f"Invalid JSON: {e}")
+        if not isinstance(records, list):
+            raise BulkFormatError("Expected a JSON array of objects")
+    else:
+        raise BulkFormatError(f"Unsupported content type {media_type}, expected application/json, application/x-ndjson or text/csv")
+
+    if not all(isinstance(record, dict) for record in records):
+        raise BulkFormatError("Every row must be a JSON object")
+    return pd.DataFrame.from_records(records)
+
+
+def require_columns(frame, columns):
+    missing = [column for column in columns if column not in frame.columns]
+    if missing and len(frame):
+        raise BulkFormatError(f"Missing columns: {', '.join(missing)}")
+
+
+def collect_errors(checks):
+    # {row position: [messages]} from (failed mask, message) pairs
+    errors = {}
+    for failed, message in checks:
+        for position in np.flatnonzero(np.asarray(failed, dtype=bool)):
+            errors.setdefault(int(position), []).append(message)
+    return errors
+
+
+def text(frame, column):
+    # Stripped text column, missing (or blank) values as <NA>
+    if column not in frame.columns:
+        return pd.Series(pd.NA, index=frame.index, dtype="string")
+    values = frame[column].astype("string").str.strip()
+    return values.mask(values == "")
+
+
+def timestamps(frame, column):
+    # ISO 8601 dates and times (a space instead of the T is fine), anything else as NaT. Times
+    # with a UTC offset are converted to UTC, times without one are kept as they are, also when
+    # both kinds are mixed in one column.
+    if column not in frame.columns:
+        return pd.Series(pd.NaT, index=frame.index, dtype="datetime64[ns]")
+    values = frame[column]
+    if values.dtype == object or pd.api.types.is_string_dtype(values):
+        values = values.astype("string").str.strip()
+    return pd.to_datetime(values, errors="coerce", format="ISO8601", utc=True).dt.tz_convert(None)
+
+
+def integers(frame, column):
+    # Whole numbers, anything else as NaN
+    if column not in frame.columns:
+        return pd.Series(np.nan, index=frame.index)
+    values = pd.to_numeric(frame[column], errors="coerce").astype(float)
+    return values.where(values == values.round())
+
+
+def datetimes(values):
+    # Plain datetime objects for the database driver (not pandas Timestamps)
+    return values.to_numpy(dtype="datetime64[us]").astype(object).tolist()
+
+
+def canonical_ids(values, known_ids):
+    # Ids matched case-insensitively, like the database collation, and written the way the
+    # referenced table has them; unknown ids become <NA>
+    canonical = {known.upper(): known for known in known_ids if known is not None}
+    return values.str.upper().map(canonical).astype("string")
+
+
+def validate_orders(frame, part_ids, now):
+    # (rows, errors) for an orders upload: rows has part_id, part_qty, order_date, due_date and
+    # order_last_updated for every row that passed, indexed by its position in the upload
+    require_columns(frame, ["part_id", "part_qty", "order_date", "due_date"])
+    part_id = text(frame, "part_id")
+    known_part_id = canonical_ids(part_id, part_ids)
+    part_qty = integers(frame, "part_qty")
+    order_date = timestamps(frame, "order_date")
+    due_date = timestamps(frame, "due_date")
+    last_updated = timestamps(frame, "order_last_updated")
+    has_last_updated = text(frame, "order_last_updated").notna()
+
+    errors = collect_errors([
+        (part_id.isna(), "part_id is required"),
+        (part_id.notna() & known_part_id.isna(), "part_id does not exist"),
+        (part_qty.isna(), "part_qty must be a whole number"),
+        (order_date.isna(), "order_date must be an ISO 8601 date and time"),
+        (due_date.isna(), "due_date must be an ISO 8601 date and time"),
+        (order_date.notna() & due_date.notna() & (order_date >= due_date), "order_date must be before due_date"),
+        (has_last_updated & last_updated.isna(), "order_last_updated must be an ISO 8601 date and time"),
+    ])
+
+    rows = pd.DataFrame({
+        "part_id": known_part_id,
+        "part_qty": part_qty,
+        "order_date": order_date,
+        "due_date": due_date,
+        "order_last_updated": last_updated.fillna(pd.Timestamp(now)),
+    }).reset_index(drop=True)
+    return rows.drop(index=list(errors)), errors
@@ -0,0 +1,48 @@
+import threading
+import time
+from collections import Counter
+
+
+class ResultCache:
+    # Results of expensive read-only computations, each remembered together with the version of
+    # every table it was computed from. The write handlers bump a table's version once their
+    # transaction has committed, which makes every result that read that table stale. Changes
+    # made outside this process are picked up when an entry is older than ttl seconds.
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._versions = Counter()   # table name -> number of committed writes seen
+        self._entries = {}           # key -> (versions, computed_at, value)
+
+    def _current(self, tables):
+        return tuple(self._versions[table] for table in tables)
+
+    def versions(self, tables):
+        # Token that changes whenever one of the tables is written
+        with self._lock:
+            return self._current(tables)
+
+    def changed(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+    def get(self, key, tables, compute):
+        # Cached value for key, or compute() when a table in tables changed since it was stored.
+        # The versions are read before computing, so a write that commits while compute() runs
+        # leaves the new entry stale instead of hiding the write.
+        with self._lock:
+            versions = self._current(tables)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == versions and time.monotonic() - entry[1] < self.ttl:
+                return entry[2]
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (versions, time.monotonic(), value)
+        return value
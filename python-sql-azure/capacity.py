@@ -0,0 +1,59 @@
+import pandas as pd
+
+from mrp import bucket_start, fetch_frame
+from tables import operation_hours
+
+# Workcentre load of the open orders: every order runs the active routings of its part's active
+# BOM rows, and the hours they need are summed per workcentre and time bucket in one group-by.
+
+ROUTING_COLUMNS = ["BOM_id", "workcentre_id", "setup_time", "runtime"]
+WORKCENTRE_COLUMNS = ["workcentre_id", "workcentre_name", "capacity", "capacity_unit", "status"]
+LOAD_COLUMNS = [
+    "workcentre_id", "workcentre_name", "bucket", "operations", "units", "required_hours", "available_hours",
+    "utilization", "capacity", "capacity_unit", "capacity_utilization",
+]
+
+
+def load_routings(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT BOM_id, workcentre_id, setup_time, runtime FROM dbo.Routings$ WHERE status = 'active'")
+    return fetch_frame(cursor, ROUTING_COLUMNS)
+
+
+def load_workcentres(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT workcentre_id, workcentre_name, capacity, capacity_unit, status FROM dbo.Workcentre$")
+    return fetch_frame(cursor, WORKCENTRE_COLUMNS)
+
+
+def workcentre_load(orders, bom, routings, workcentres, bucket="day", hours_per_day=8, days_per_week=5):
+    # Required hours per workcentre and bucket of the due date. setup_time is taken once per
+    # order and runtime once per unit (minutes, see tables.py). utilization compares the hours with the
+    # working hours of the bucket, capacity_utilization compares the units with what the
+    # workcentre's capacity (units per hour) gets through in those hours.
+    #   orders: mrp.ORDER_COLUMNS, the open orders
+    #   bom:    mrp.BOM_COLUMNS, active rows only
+    operations = (
+        orders.dropna(subset=["due_date"])
+        .merge(bom[["BOM_id", "part_id"]], on="part_id")
+        .merge(routings, on="BOM_id")
+    )
+    qty = operations["part_qty"].astype(float).fillna(0)
+    operations = operations.assign(
+        bucket=bucket_start(pd.to_datetime(operations["due_date"]), bucket),
+        units=qty,
+        hours=operation_hours(operations["setup_time"].astype(float).fillna(0), operations["runtime"].astype(float).fillna(0), qty),
+    )
+
+    load = (
+        operations.groupby(["workcentre_id", "bucket"], sort=True)
+        .agg(operations=("hours", "size"), units=("units", "sum"), required_hours=("hours", "sum"))
+        .reset_index()
+        .merge(workcentres.drop(columns="status"), on="workcentre_id", how="left")
+    )
+    available = hours_per_day * (days_per_week if bucket == "week" else 1)
+    load["available_hours"] = float(available)
+    load["utilization"] = load["required_hours"] / available
+    load["capacity"] = load["capacity"].astype(float).where(load["capacity"] > 0)
+    load["capacity_utilization"] = load["units"] / (load["capacity"] * available)
+    return load[LOAD_COLUMNS]
@@ -0,0 +1,93 @@
+import typing
+from datetime import date, datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for the columnar exports
+    pa = None
+    pq = None
+
+available = pa is not None
+
+FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def arrow_type(annotation):
+    # Optional[X] and Union[X, None] map to the type of X, every Arrow column is nullable anyway
+    if typing.get_origin(annotation) is typing.Union:
+        annotation = next(arg for arg in typing.get_args(annotation) if arg is not type(None))
+    if annotation is datetime:
+        return pa.timestamp("us")
+    if annotation is date:
+        return pa.date32()
+    if annotation is bool:
+        return pa.bool_()
+    if annotation is int:
+        return pa.int64()
+    if annotation is float:
+        return pa.float64()
+    return pa.string()
+
+
+def arrow_schema(model, columns):
+    # Column types come from the Pydantic model that describes the table
+    return pa.schema([pa.field(column, arrow_type(model.model_fields[column].annotation)) for column in columns])
+
+
+class _ChunkSink:
+    # File-like object the Arrow writers write into, drained after every record batch
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_columnar(pool, backend, query, schema, fmt="arrow", chunk_size=5000, timeout=None):
+    # Generator that streams a query result as an Arrow IPC stream or a Parquet file. Every
+    # fetchmany chunk becomes one record batch (one row group for Parquet) straight from the
+    # cursor, so memory stays bounded by the chunk size.
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+        write = writer.write_batch
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    with pool.connection() as connection:
+        backend.set_query_timeout(connection, timeout)
+        cursor = connection.cursor()
+        cursor.execute(query)
+        backend.set_query_timeout(connection, None)
+
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            arrays = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(schema)]
+            write(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,40 @@
+from collections import defaultdict
+
+from rollup import BomRollup
+from tables import operation_hours
+
+# Rolled-up standard cost of every part over the active BOM:
+#   leaf parts (no active BOM rows): unit_cost from the part master
+#   assemblies: sum of child_qty x rolled cost of the child (material) plus, for every active
+#   routing of its active BOM rows, the hours of setup_time + runtime x cost_rate_h of the
+#   workcentre (labour, see tables.py for the unit of the routing times)
+
+
+class CostRollup(BomRollup):
+    # Own input: unit_cost. Line input: (child_qty, labour cost of the row's routings).
+    # Result: (material_cost, labour_cost, rolled_cost).
+
+    tables = ["BOM$", "Routings$", "Part_Master_Records$", "Workcentre$"]
+
+    def load(self, connection, lines):
+        cursor = connection.cursor()
+        cursor.execute("SELECT part_id, unit_cost FROM dbo.Part_Master_Records$")
+        unit_costs = {part_id: unit_cost for part_id, unit_cost in cursor.fetchall()}
+
+        cursor.execute("SELECT workcentre_id, cost_rate_h FROM dbo.Workcentre$")
+        rates = {workcentre_id.upper(): rate or 0 for workcentre_id, rate in cursor.fetchall() if workcentre_id}
+
+        cursor.execute("SELECT BOM_id, workcentre_id, setup_time, runtime FROM dbo.Routings$ WHERE status = 'active'")
+        labour = defaultdict(float)
+        for BOM_id, workcentre_id, setup_time, runtime in cursor.fetchall():
+            rate = rates.get((workcentre_id or "").upper(), 0)
+            labour[BOM_id] += operation_hours(setup_time or 0, runtime or 0) * rate
+
+        return unit_costs, {line.BOM_id: (line.child_qty or 0, labour[line.BOM_id]) for line in lines}
+
+    def combine(self, part_id, unit_cost, children):
+        if not children:
+            return (unit_cost or 0, 0, unit_cost or 0)
+        material = sum(qty * cost[2] for _, (qty, _), cost in children)
+        labour = sum(line_labour for _, (_, line_labour), _ in children)
+        return (material, labour, material + labour)
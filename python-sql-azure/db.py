@@ -0,0 +1,266 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from fastapi import HTTPException
+
+from backends import Error, InterfaceError, OperationalError
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class ConnectionPool:
+    # Thread-safe pool of DB-API connections created by the connect callable.
+    # Connections are checked out per request, health checked when they have been idle for a
+    # while, replaced transparently when they turn out to be dead, and closed again once they
+    # sit idle for longer than idle_timeout (never dropping below min_size).
+
+    def __init__(self, connect, min_size=1, max_size=10, idle_timeout=300,
+                 checkout_timeout=30, health_check_interval=30):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: min_size must be <= max_size and max_size >= 1")
+
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Condition()
+        self._idle = []  # (connection, last_used) pairs, most recently used last
+        self._size = 0
+        self._closed = False
+
+        for _ in range(min_size):
+            self._idle.append((self.connect(), time.monotonic()))
+            self._size += 1
+
+        self._reaper = threading.Thread(target=self._reap, name="db-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reserve the slot now and connect outside the lock
+                    self._size += 1
+                    connection, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No database connection available within {self.checkout_timeout}s")
+                self._lock.wait(remaining)
+
+        try:
+            if connection is None:
+                return self.connect()
+            if time.monotonic() - last_used > self.health_check_interval and not self._is_healthy(connection):
+                self._close_quietly(connection)
+                return self.connect()
+            return connection
+        except Exception:
+            self._discard_slot()
+            raise
+
+    def release(self, connection, broken=False):
+        if not broken:
+            try:
+                # Never hand out a connection with a transaction still open
+                connection.rollback()
+            except Error:
+                broken = True
+
+        if broken or self._closed:
+            self._close_quietly(connection)
+            self._discard_slot()
+            return
+
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        broken = False
+        try:
+            yield connection
+        except OperationalError + InterfaceError:
+            broken = True
+            raise
+        finally:
+            self.release(connection, broken=broken)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+    def _discard_slot(self):
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+
+    def _is_healthy(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Error:
+            return False
+
+    def _close_quietly(self, connection):
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    def _reap(self):
+        interval = max(1, min(self.idle_timeout, 60))
+        while not self._closed:
+            time.sleep(interval)
+            now = time.monotonic()
+            expired = []
+            with self._lock:
+                # Oldest connections sit at the front of the idle list
+                while (self._idle and self._size - len(expired) > self.min_size
+                       and now - self._idle[0][1] > self.idle_timeout):
+                    expired.append(self._idle.pop(0)[0])
+                self._size -= len(expired)
+            for connection in expired:
+                self._close_quietly(connection)
+
+
+class CancellableConnection:
+    # Wraps a pooled connection so that the cursors opened on it can be cancelled from another
+    # thread while a query is executing.
+
+    def __init__(self, connection, backend):
+        self._connection = connection
+        self._backend = backend
+        self._cursors = []
+        self._lock = threading.Lock()
+        self.cancelled = False
+
+    def cursor(self):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled("Query was cancelled")
+            cursor = self._connection.cursor()
+            self._cursors.append(cursor)
+            return cursor
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            cursors = list(self._cursors)
+        self._backend.cancel(self._connection, cursors)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class QueryHandle:
+    # Lets the event loop cancel work that may not have checked out its connection yet
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.connection = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def attach(self, connection):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled("Query was cancelled before it started")
+            self.connection = CancellableConnection(connection, self.backend)
+            return self.connection
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            connection = self.connection
+        if connection is not None:
+            connection.cancel()
+
+
+class AsyncDatabase:
+    # Runs blocking database work on a bounded thread pool so that async handlers never block the
+    # event loop. Each call gets a pooled connection, a per-query timeout and is cancelled when the
+    # client disconnects before the work has finished.
+
+    def __init__(self, pool, backend, max_workers=None, timeout=30, poll_interval=0.25):
+        self.pool = pool
+        self.backend = backend
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or pool.max_size, thread_name_prefix="db")
+
+    async def run(self, fn, *args, request=None, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        handle = QueryHandle(self.backend)
+
+        def work():
+            with self.pool.connection() as connection:
+                # Server-side query timeout, the cancel below covers everything else
+                self.backend.set_query_timeout(connection, timeout)
+                return fn(handle.attach(connection), *args)
+
+        loop = asyncio.get_running_loop()
+        future = asyncio.wrap_future(self._executor.submit(work), loop=loop)
+        deadline = loop.time() + timeout if timeout else None
+
+        while True:
+            wait_for = self.poll_interval
+            if deadline is not None:
+                wait_for = min(wait_for, deadline - loop.time())
+
+            if wait_for > 0:
+                done, _ = await asyncio.wait({future}, timeout=wait_for)
+                if done:
+                    return future.result()
+
+            if deadline is not None and loop.time() >= deadline:
+                self._abandon(handle, future)
+                raise HTTPException(status_code=504, detail=f"Database query timed out after {timeout}s")
+
+            if request is not None and await request.is_disconnected():
+                self._abandon(handle, future)
+                raise HTTPException(status_code=499, detail="Client closed request")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _abandon(self, handle, future):
+        handle.cancel()
+        # The worker still finishes (and returns its connection) in the background
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
@@ -0,0 +1,120 @@
+import threading
+
+from backends import IntegrityError
+
+# Hi/lo allocation of the generated keys (B001, R001, P001, O0001, WC001). The next free number of
+# every table is kept in dbo.Id_Blocks$; a process reserves a block of numbers with one atomic
+# UPDATE ... OUTPUT/RETURNING and hands them out from memory until the block is used up. Blocks
+# never overlap, so processes sharing the database never generate the same id, and no insert has
+# to look up the highest id or check that its id is free. Numbers of a block that a process did
+# not use (or of a write that was rolled back) are skipped, ids are unique but not gapless.
+# The counters are created by initialize() at startup, never during a request: starting a counter
+# reads the whole table, which would wait on the locks of a write transaction still open on the
+# request's own connection.
+
+# table -> (prefix, digits, key column); numbers past the digits simply get longer, like before
+ID_FORMATS = {
+    "BOM$": ("B", 3, "BOM_id"),
+    "Routings$": ("R", 3, "routing_id"),
+    "Part_Master_Records$": ("P", 3, "part_id"),
+    "Orders$": ("O", 4, "order_id"),
+    "Workcentre$": ("WC", 3, "workcentre_id"),
+}
+
+
+class IdAllocator:
+    # Reservations run on a connection of their own and commit at once, independent of the
+    # transaction of the write that asked for the id (which may still roll back).
+
+    def __init__(self, backend, block_size=20):
+        self.backend = backend
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._connection = None
+        self._blocks = {}  # table -> [next number, end of the block (exclusive)]
+
+    def initialize(self):
+        # Create the counters that do not exist yet, each starting after the highest id in its table
+        with self._lock:
+            connection = self._connect()
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT entity FROM dbo.Id_Blocks$")
+                existing = {entity for entity, in cursor.fetchall()}
+                for table in ID_FORMATS:
+                    if table not in existing:
+                        self._initialize(cursor, table)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+    def next_id(self, table):
+        return self.next_ids(table, 1)[0]
+
+    def next_ids(self, table, count):
+        # count new ids for table, in increasing order
+        prefix, digits, _ = ID_FORMATS[table]
+        numbers = []
+        with self._lock:
+            block = self._blocks.setdefault(table, [0, 0])
+            while len(numbers) < count:
+                if block[0] == block[1]:
+                    size = max(self.block_size, count - len(numbers))
+                    start = self._reserve(table, size)
+                    block[:] = [start, start + size]
+                take = min(block[1] - block[0], count - len(numbers))
+                numbers.extend(range(block[0], block[0] + take))
+                block[0] += take
+        return [f"{prefix}{str(number).zfill(digits)}" for number in numbers]
+
+    def _reserve(self, table, size):
+        # First number of a new block of size numbers
+        try:
+            return self._reserve_on(self._connect(), table, size)
+        except Exception:
+            # A broken connection is replaced once, the reservation itself is atomic
+            self._close()
+            return self._reserve_on(self._connect(), table, size)
+
+    def _reserve_on(self, connection, table, size):
+        cursor = connection.cursor()
+        # The row is locked by the update until the commit, concurrent reservations queue up on it
+        reserve = self.backend.returning("UPDATE dbo.Id_Blocks$ SET next_value = next_value + ? WHERE entity = ?", "next_value")
+        try:
+            cursor.execute(reserve, (size, table))
+            row = cursor.fetchone()
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        if row is None:
+            raise RuntimeError(f"No id counter for {table}, IdAllocator.initialize() was not called")
+        return row[0] - size
+
+    def _initialize(self, cursor, table):
+        # The counter of a table starts after the highest id already in it
+        prefix, _, column = ID_FORMATS[table]
+        number = self.backend.id_number(column, len(prefix))
+        try:
+            cursor.execute(
+                f"INSERT INTO dbo.Id_Blocks$ (entity, next_value) "
+                f"SELECT ?, COALESCE(MAX({number}), 0) + 1 FROM dbo.{table} WHERE {column} LIKE ?",
+                (table, f"{prefix}%"),
+            )
+        except IntegrityError:
+            pass  # another process initialized it first
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = self.backend.connect()
+            self.backend.ensure_id_table(self._connection)
+        return self._connection
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from db import QueryHandle
+
+# In-process background jobs for computations too heavy to run inside a request. Jobs run on
+# their own small thread pool, each with its own pooled connection, so at most max_workers
+# connections and threads are ever busy with them and the request handlers keep theirs.
+# A job is identified by a fingerprint of its kind, its parameters and the versions of the
+# tables it reads: submitting the same job again returns the one that is queued, running or
+# finished (until ttl seconds after it finished) instead of computing it twice.
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+
+# What a job produces: an in-memory body, or a file on disk (path) for large results
+JobOutput = namedtuple("JobOutput", ["media_type", "body", "path", "filename"], defaults=(None, None, None))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    # State of one job as shown by the API; the job function reports progress through it
+
+    def __init__(self, kind, params, fingerprint):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.fingerprint = fingerprint
+        self.status = QUEUED
+        self.progress_fraction = 0.0
+        self.message = None
+        self.error = None
+        self.output = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.finished = None          # monotonic time, for expiry
+        self.cancel_requested = False
+        self.future = None
+        self.handle = None            # QueryHandle of the running job
+        self.temporary_paths = []
+
+    def progress(self, fraction, message=None):
+        # Called by the job function between steps; also the point where a cancel takes effect
+        if self.cancel_requested:
+            raise JobCancelled("Job was cancelled")
+        self.progress_fraction = min(max(float(fraction), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+    def output_path(self, suffix):
+        # Temporary file for a large result, deleted together with the job
+        descriptor, path = tempfile.mkstemp(prefix=f"job-{self.job_id}-", suffix=suffix)
+        os.close(descriptor)
+        self.temporary_paths.append(path)
+        return path
+
+    def info(self):
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "progress": self.progress_fraction,
+            "message": self.message,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(timespec="seconds"),
+            "started_at": self.started_at and self.started_at.isoformat(timespec="seconds"),
+            "finished_at": self.finished_at and self.finished_at.isoformat(timespec="seconds"),
+        }
+
+
+class JobQueue:
+    # Bounded queue of jobs: at most max_workers run at a time and at most max_queued wait,
+    # further submissions raise QueueFull. Job functions are registered per kind with the tables
+    # they read and are called as fn(connection, job, **params).
+
+    def __init__(self, pool, backend, versions, max_workers=2, max_queued=100, ttl=3600, timeout=None):
+        self.pool = pool
+        self.backend = backend
+        self.versions = versions      # tables -> version token, see ResultCache.versions
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.timeout = timeout
+        self.kinds = {}               # kind -> (fn, tables)
+        self._jobs = {}               # job_id -> Job
+        self._by_fingerprint = {}     # fingerprint -> Job
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    def register(self, kind, tables, fn):
+        self.kinds[kind] = (fn, tables)
+
+    def fingerprint(self, kind, params):
+        _, tables = self.kinds[kind]
+        key = json.dumps([kind, params, self.versions(tables)], sort_keys=True, default=str)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def submit(self, kind, params):
+        # (job, reused): reused is True when an identical job was already known
+        fingerprint = self.fingerprint(kind, params)
+        with self._lock:
+            self._purge()
+            job = self._by_fingerprint.get(fingerprint)
+            if job is not None and job.status in (QUEUED, RUNNING, SUCCEEDED):
+                return job, True
+            if sum(job.status == QUEUED for job in self._jobs.values()) >= self.max_queued:
+                raise QueueFull(f"Too many queued jobs (at most {self.max_queued})")
+            job = Job(kind, params, fingerprint)
+            self._jobs[job.job_id] = job
+            self._by_fingerprint[fingerprint] = job
+            job.future = self._executor.submit(self._run, job)
+            return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            self._purge()
+            return sorted(self._jobs.values(), key=lambda job: job.created_at)
+
+    def cancel(self, job_id):
+        # A queued job never starts; a running job stops at its next progress() call, or at
+        # once when it is waiting on a query. Returns the job, None when it is unknown.
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in (QUEUED, RUNNING):
+                return job
+            job.cancel_requested = True
+            if job.future.cancel():
+                self._finish(job, CANCELLED)
+                return job
+            handle = job.handle
+        if handle is not None:
+            handle.cancel()
+        return job
+
+    def _run(self, job):
+        with self._lock:
+            if job.cancel_requested:
+                self._finish(job, CANCELLED)
+                return
+            job.status = RUNNING
+            job.started_at = datetime.now()
+            job.handle = QueryHandle(self.backend)
+        fn, _ = self.kinds[job.kind]
+        try:
+            with self.pool.connection() as connection:
+                self.backend.set_query_timeout(connection, self.timeout)
+                output = fn(job.handle.attach(connection), job, **job.params)
+        except Exception as e:
+            with self._lock:
+                if job.cancel_requested:
+                    self._finish(job, CANCELLED)
+                else:
+                    job.error = getattr(e, "detail", None) or str(e) or type(e).__name__
+                    self._finish(job, FAILED)
+            return
+        with self._lock:
+            if job.cancel_requested:
+                # Cancelled after its last progress() call, the result is dropped all the same
+                self._finish(job, CANCELLED)
+                return
+            job.output = output
+            job.progress_fraction = 1.0
+            self._finish(job, SUCCEEDED)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = datetime.now()
+        job.finished = time.monotonic()
+        job.handle = None
+        if status != SUCCEEDED:
+            self._remove_files(job)
+
+    def _purge(self):
+        # Forget finished jobs ttl seconds after they finished
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and now - job.finished > self.ttl:
+                del self._jobs[job_id]
+                if self._by_fingerprint.get(job.fingerprint) is job:
+                    del self._by_fingerprint[job.fingerprint]
+                self._remove_files(job)
+
+    def _remove_files(self, job):
+        for path in job.temporary_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        job.temporary_paths = []
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
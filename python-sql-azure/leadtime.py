@@ -0,0 +1,33 @@
+from rollup import BomRollup
+
+# Cumulative (critical path) lead time of every part over the active BOM. A part's planned order
+# is released lead_time days before it is due and its children are due at that release, each
+# taking the lead time on its BOM row (child_leadtime, or the child's own lead_time when the row
+# has none). The cumulative lead time is the longest such chain down to a purchased part:
+#   cumulative(P) = lead_time(P) + below(P)
+#   below(P) = max over the BOM rows of P of (row lead time + below(child)), 0 for a leaf
+
+
+class LeadTimeRollup(BomRollup):
+    # Own input: lead_time. Line input: the row's effective lead time.
+    # Result: (cumulative_lead_time, below, driving path below the part as ((child_id, lead time), ...)).
+
+    tables = ["BOM$", "Part_Master_Records$"]
+
+    def load(self, connection, lines):
+        cursor = connection.cursor()
+        cursor.execute("SELECT part_id, lead_time FROM dbo.Part_Master_Records$")
+        lead_times = {part_id: lead_time for part_id, lead_time in cursor.fetchall()}
+
+        line_lead_times = {}
+        for line in lines:
+            lead_time = line.child_leadtime if line.child_leadtime is not None else lead_times.get(line.child_id)
+            line_lead_times[line.BOM_id] = lead_time or 0
+        return lead_times, line_lead_times
+
+    def combine(self, part_id, lead_time, children):
+        below, path = 0, ()
+        for child_id, line_lead_time, (_, child_below, child_path) in children:
+            if line_lead_time + child_below > below:
+                below, path = line_lead_time + child_below, ((child_id, line_lead_time),) + child_path
+        return ((lead_time or 0) + below, below, path)
@@ -1,119 +1,204 @@
+import csv
 import datetime
 from dotenv import load_dotenv 
 import os 
-import pyodbc 
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import StreamingResponse
-import pandas as pd
+from fastapi import FastAPI, HTTPException, Body, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, Response, StreamingResponse
 import json
 import requests
-from io import StringIO
-from pydantic import BaseModel
 from datetime import date, datetime
-from typing import List, Optional
-
-# Global counter for Workcentre ID (this part need to change to get the highest workcentre ID then +1 to it)
-workcentre_counter = 5
-bom_counter = 470
-order_counter = 1000
-part_counter = 145  
-routing_counter = 913
-
-class WorkCentre(BaseModel):
-    workcentre_name: str
-    capacity_unit: str
-    cost_rate_h: float
-    workcentre_description: str
-    capacity: int
-    workcentre_last_updated: datetime
-    workcentre_id: str = None
-    status: str = None
-    
-class Order(BaseModel):
-    order_id: str = None
-    part_id: str
-    part_qty: int
-    order_date: datetime
-    due_date: datetime
-    order_last_updated: datetime
-    status: str = None
-
-class BOM(BaseModel):
-    BOM_id: Optional[str] = None
-    part_id: str
-    child_id: str
-    child_qty: float
-    child_leadtime: float
-    BOM_last_updated: datetime
-    status: str = None
-    process_description: Optional[str] = None
-    setup_time: Optional[int] = None
-    runtime: Optional[int] = None
-    routing_id: Optional[str] = None 
-    operations_sequence: Optional[int] = None 
-    workcentre_id: Optional[str] = None 
-    
-class Routing(BaseModel):
-    routing_id: str = None 
-    BOM_id: str
-    operations_sequence: int
-    workcentre_id: str
-    process_description: Optional[str] = None
-    setup_time: Optional[int] = None
-    runtime: Optional[int] = None
-    routings_last_update: datetime
-    status: str = None 
-
-class Part(BaseModel):
-    part_id: str = None
-    part_name: str
-    inventory: int
-    POM: str
-    UOM: str
-    part_description: str
-    unit_cost: float
-    lead_time: int
-    part_last_updated: datetime
-    status: str = None
+from typing import Optional
+from asof import AsOfIndex
+from atp import Promising
+from backends import DatabaseError, IntegrityError, create_backend
+from bom_graph import BomGraph, BomLine
+from cache import ResultCache
+import bulk
+import capacity
+import columnar
+from costs import CostRollup
+import mrp
+import scenarios
+from db import AsyncDatabase, ConnectionPool
+from ids import IdAllocator
+import jobs
+from leadtime import LeadTimeRollup
+from models import BOM, BomImport, Order, OrderDetailsBatch, Part, Routing, ScenarioRequest, WorkCentre
+import scheduler
+from streaming import stream_csv
+from tables import TABLES
+
  
 load_dotenv() 
-connection_string = os.getenv("AZURE_SQL_CONNECTIONSTRING") 
+
+# Storage backend: "sqlserver" (Azure SQL, the default) or "sqlite" (local stand-in seeded from the CSV files)
+backend = create_backend(os.getenv("DB_BACKEND", "sqlserver"))
  
-# Establish the database connection 
-connection = pyodbc.connect(connection_string) 
-cursor = connection.cursor() 
+# Pool of database connections, every request checks out its own connection and cursor
+pool = ConnectionPool(
+    backend.connect,
+    min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+    max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+    idle_timeout=float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300")),
+    checkout_timeout=float(os.getenv("DB_POOL_CHECKOUT_TIMEOUT", "30")),
+    health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30")),
+)
+
+# Blocking database work runs on a bounded thread pool, off the event loop
+database = AsyncDatabase(
+    pool,
+    backend,
+    max_workers=int(os.getenv("DB_MAX_WORKERS", "0")) or None,
+    timeout=float(os.getenv("DB_QUERY_TIMEOUT", "30")),
+)
+
+# New BOM, routing, part, order and workcentre ids, reserved from the database ID_BLOCK_SIZE at a time
+id_allocator = IdAllocator(backend, block_size=int(os.getenv("ID_BLOCK_SIZE", "20")))
+id_allocator.initialize()
+
+# In-memory index of the BOM table used for cycle checks, rechecked against the database every BOM_CACHE_TTL seconds
+bom_graph = BomGraph(ttl=float(os.getenv("BOM_CACHE_TTL", "30")))
+
+# Computed results (workcentre load, ...) kept until a table they read is written, or for at most RESULT_CACHE_TTL seconds
+results = ResultCache(ttl=float(os.getenv("RESULT_CACHE_TTL", "300")))
+
+# Rolled-up part costs and cumulative lead times, recomputed for the parts whose inputs changed
+cost_rollup = CostRollup(bom_graph, ttl=float(os.getenv("RESULT_CACHE_TTL", "300")))
+lead_time_rollup = LeadTimeRollup(bom_graph, ttl=float(os.getenv("RESULT_CACHE_TTL", "300")))
+
+# Working hours of a workcentre per day and working days per week, the available capacity of a time bucket
+workcentre_hours_per_day = float(os.getenv("WORKCENTRE_HOURS_PER_DAY", "8"))
+workcentre_days_per_week = int(os.getenv("WORKCENTRE_DAYS_PER_WEEK", "5"))
+
+# Committed demand and workcentre load of the open orders, for available-to-promise checks
+promising = Promising(bom_graph, workcentre_hours_per_day, workcentre_days_per_week, ttl=float(os.getenv("RESULT_CACHE_TTL", "300")))
+
+# Version history of the BOM, routings and workcentres for point-in-time lookups
+as_of_index = AsOfIndex(ttl=float(os.getenv("RESULT_CACHE_TTL", "300")))
+
+# Persistent net-change MRP state per bucket size, kept current by the write handlers
+net_change_plans = {bucket: mrp.NetChangePlan(bom_graph, bucket, ttl=float(os.getenv("RESULT_CACHE_TTL", "300"))) for bucket in mrp.BUCKETS}
+
+# Working hours the scheduler plans operations in, starting at WORKCENTRE_DAY_START o'clock
+scheduling_calendar = scheduler.WorkingCalendar(
+    workcentre_hours_per_day,
+    workcentre_days_per_week,
+    float(os.getenv("WORKCENTRE_DAY_START", "8")),
+)
+
+# Process pool the what-if scenarios are evaluated in, SCENARIO_WORKERS processes (0: one per CPU)
+scenario_pool = scenarios.ScenarioPool(int(os.getenv("SCENARIO_WORKERS", "0")) or None)
+
+# Background jobs for the heavy computations: JOB_WORKERS run at a time on their own threads and
+# connections, at most JOB_QUEUE_SIZE wait, results are kept for JOB_RESULT_TTL seconds and every
+# query of a job may run for JOB_QUERY_TIMEOUT seconds (0: no limit)
+job_queue = jobs.JobQueue(
+    pool,
+    backend,
+    results.versions,
+    max_workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_queued=int(os.getenv("JOB_QUEUE_SIZE", "100")),
+    ttl=float(os.getenv("JOB_RESULT_TTL", "3600")),
+    timeout=float(os.getenv("JOB_QUERY_TIMEOUT", "0")) or None,
+)
+
+# Page size used when a client does not send $top, and the largest page a client can ask for
+max_page_size = int(os.getenv("ODATA_MAX_PAGE_SIZE", "1000"))
+
+# Number of rows fetched from the cursor per chunk of a streamed export
+export_chunk_size = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+# Values per IN (...) list, well below the 2100 parameters SQL Server allows per statement
+in_list_size = 1000
+
+# Rows per executemany call of a bulk insert, and the query timeout of a bulk request
+bulk_chunk_size = int(os.getenv("BULK_CHUNK_SIZE", "5000"))
+bulk_timeout = float(os.getenv("BULK_QUERY_TIMEOUT", "300"))
  
 # FastAPI instance 
 app = FastAPI() 
 print("Server Running") 
  
-# Helper function to execute a query and return results as a list of dictionaries 
-def execute_query(query: str):
-    cursor.execute(query)
-    data = cursor.fetchall()
+# Helper function to fetch one page of a table as a list of dictionaries.
+# Keyset pagination: rows are ordered by the key column and each page starts after the last key of
+# the previous one, so every page is a single index seek no matter how deep into the table it is.
+def execute_page_query(connection, table: str, key: str, top: int, skiptoken: Optional[str]):
+    query = f"SELECT * FROM dbo.{table}"
+    params = ()
+    if skiptoken is not None:
+        query += f" WHERE {key} > ?"
+        params = (skiptoken,)
+    # Fetch one extra row to find out whether there is a next page
+    query = backend.top(f"{query} ORDER BY {key}", top + 1)
+
+    cursor = connection.cursor()
+    cursor.execute(query, params)
     columns = [column[0] for column in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchmany(top + 1)]
+    return rows[:top], len(rows) > top
 
-    # Create a list of dictionaries, each representing a row
-    rows = []
-    for row in data:
-        row_dict = {columns[i]: row[i] for i in range(len(columns))}
-        rows.append(row_dict)
+# Returns a page in the OData format Power Apps understands, {"value": [...], "@odata.nextLink": ...}
+async def get_page(request: Request, table: str, key: str, top: Optional[int], skiptoken: Optional[str]):
+    top = min(top or max_page_size, max_page_size)
+    rows, has_more = await database.run(execute_page_query, table, key, top, skiptoken, request=request)
 
-    # Return the result in the desired format
     result = {"value": rows}
-
-    print(type(result))
+    if has_more:
+        next_link = request.url.include_query_params(**{"$top": top, "$skiptoken": rows[-1][key]})
+        result["@odata.nextLink"] = str(next_link)
     return result
+
+# Query parameter datetimes as naive local time, like the timestamps in the database; a value
+# with a UTC offset is converted to the server's local time first
+def local_time(value: Optional[datetime]):
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone().replace(tzinfo=None)
+
+# Encodes dictionaries as newline delimited JSON, a few hundred lines per chunk
+def ndjson_lines(items, batch_size=500):
+    batch = []
+    for item in items:
+        batch.append(json.dumps(item, default=str))
+        if len(batch) >= batch_size:
+            yield "\n".join(batch) + "\n"
+            batch = []
+    if batch:
+        yield "\n".join(batch) + "\n"
+
+# JSON response for a large computed frame, {**summary, "value": [rows]}. The rows are encoded by
+# pandas in one go instead of one by one by FastAPI; date columns are written as YYYY-MM-DD.
+def frame_response(summary: dict, frame, date_columns=()):
+    frame = frame.assign(**{column: frame[column].to_numpy(dtype="datetime64[D]").astype(str) for column in date_columns})
+    body = json.dumps(summary)[:-1] + (", " if summary else "") + '"value": ' + frame.to_json(orient="records") + "}"
+    return Response(body, media_type="application/json")
+
+# Streams the result of a query as a CSV download, gzip encoded when the client accepts it
+def csv_response(request: Request, query: str, filename: str):
+    compress = "gzip" in request.headers.get("accept-encoding", "")
+    output = stream_csv(pool, backend, query, chunk_size=export_chunk_size, timeout=database.timeout, compress=compress)
+    response = StreamingResponse(output, media_type="text/csv")
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    response.headers["Vary"] = "Accept-Encoding"
+    if compress:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
  
 @app.get("/BOM") 
-async def get_bom(): 
-    query = "SELECT * FROM dbo.BOM$" 
-    return execute_query(query) 
+async def get_bom(request: Request, top: Optional[int] = Query(None, alias="$top", ge=1), skiptoken: Optional[str] = Query(None, alias="$skiptoken")): 
+    return await get_page(request, "BOM$", "BOM_id", top, skiptoken)
 
-@app.post("/BOM")
-async def create_bom(bom: BOM):
+# The part ids the way the part master has them, None for the ones it does not have. The database
+# compares ids case-insensitively, the in-memory BOM index compares them as they are.
+def canonical_part_ids(cursor, *part_ids):
+    rows = select_in(cursor, "SELECT part_id FROM dbo.Part_Master_Records$ WHERE part_id IN ({values})", set(part_ids))
+    canonical = {part_id.upper(): part_id for part_id, in rows}
+    return [canonical.get(part_id.upper()) for part_id in part_ids]
 
-    global bom_counter
+def create_bom_blocking(connection, bom: BOM):
+
+    cursor = connection.cursor()
 
     error_messages = {
         "connection_unavailable": "Database connection is not available",
@@ -133,6 +218,11 @@ async def create_bom(bom: BOM):
         if cursor is None:
             return {"error": error_messages["cursor_uninitialized"]}
 
+        part_id, child_id = canonical_part_ids(cursor, bom.part_id, bom.child_id)
+        if part_id is None or child_id is None:
+            return HTTPException(status_code=400, detail="part_id and/or child_id doesn't exist")
+        bom.part_id, bom.child_id = part_id, child_id
+
         check_bom_query = """
         SELECT BOM_id FROM dbo.BOM$
         WHERE part_id = ? AND child_id = ?
@@ -143,72 +233,19 @@ async def create_bom(bom: BOM):
         if existing_bom:
             return HTTPException(status_code=400, detail="part_id and child_id already belong to the same BOM_id and cannot be added.")
         
-        cursor.execute("SELECT part_id, child_id FROM dbo.BOM$")
-        all_bom_entries = cursor.fetchall()
-        
-        bom_dict = {}
-        for part_id, child_id in all_bom_entries:
-            if part_id in bom_dict:
-                bom_dict[part_id].append(child_id)
-            else:
-                bom_dict[part_id] = [child_id]
-
-        # Function to check for circular dependency using DFS
-        def has_circular_dependency(new_child_id, old_part_id, visited=None):
-            if visited is None:
-                visited = set()
-            if new_child_id in visited:
-                return False
-            visited.add(new_child_id)
-            children = bom_dict.get(new_child_id, [])
-            for child in children:
-                if child == old_part_id:
-                    return True
-                if has_circular_dependency(child, old_part_id, visited):
-                    return True
-            visited.remove(new_child_id)
-            return False
-
-        # Check for circular dependency
-        if has_circular_dependency(bom.child_id, bom.part_id):
+        # Check for circular dependency against the in-memory BOM index
+        bom_graph.refresh(connection)
+        if bom_graph.would_create_cycle(bom.part_id, bom.child_id):
             return HTTPException(status_code=400, detail="Action cannot be completed: this item can't exist as both a parent and a child.")
-        
-        check_parts_query = "SELECT COUNT(*) FROM dbo.Part_Master_Records$ WHERE part_id = ? OR part_id = ?"
-        cursor.execute(check_parts_query, (bom.part_id, bom.child_id))
-        count = cursor.fetchone()[0]
 
-        if count < 2:
-            return HTTPException(status_code=400, detail="part_id and/or child_id doesn't exist")
-
-        # Fetch the latest BOM_id from the database
-        query = "SELECT TOP 1 BOM_id FROM dbo.BOM$ ORDER BY BOM_id DESC"
-        cursor.execute(query)
-        result = cursor.fetchone()
-
-        if result:
-            latest_bom_id = result[0]  # e.g., "B470"
-            # Extract the integer part of the BOM_id
-            bom_counter = int(latest_bom_id[1:])  # Ignore the "B" prefix
-        else:
-            bom_counter = 0  # Default to 0 if no records are found
-
-        # Increment the counter for the new BOM_id
-        bom_counter += 1
-        BOM_id = f"B{str(bom_counter).zfill(3)}"
-        bom.BOM_id = BOM_id
+        # Reserve the new BOM_id once the request is valid and before the first write, see
+        # update_bom_blocking
+        bom.BOM_id = id_allocator.next_id("BOM$")
         bom.status ="active"
 
         current_datetime = datetime.now()
         bom.BOM_last_updated = current_datetime
 
-        # Check if BOM_id already exists
-        check_query = "SELECT COUNT(*) FROM dbo.BOM$ WHERE bom_id = ?"
-        cursor.execute(check_query, (bom.BOM_id,))
-        count = cursor.fetchone()[0]
-
-        if count > 0:
-            return HTTPException(status_code=400, detail="bom_id already exists and cannot be added")
-        
         previous_bom_query = """
         SELECT BOM_id 
         FROM dbo.BOM$ 
@@ -229,12 +266,12 @@ async def create_bom(bom: BOM):
             """
             cursor.execute(update_bom_status_query, (previous_bom_id,))
         
-            workcentre_query = """
-            SELECT TOP 1 routing_id
+            workcentre_query = backend.top("""
+            SELECT routing_id
             FROM dbo.Routings$ 
             WHERE BOM_id = ? 
             ORDER BY routing_id DESC
-            """
+            """, 1)
             cursor.execute(workcentre_query, (previous_bom_id,))
             workcentre_result = cursor.fetchone()
 
@@ -266,22 +303,40 @@ async def create_bom(bom: BOM):
         ))
         connection.commit()
 
+        # Keep the in-memory BOM and as-of indexes in step with the committed rows
+        if previous_bom_result:
+            bom_graph.set_status(previous_bom_id, "NA")
+            as_of_index.set_status("BOM$", "NA", previous_bom_id)
+            if workcentre_result:
+                as_of_index.set_status("Routings$", "NA", previous_routing_id)
+        bom_graph.add_line(BomLine(bom.BOM_id, bom.part_id, bom.child_id, bom.child_qty, bom.child_leadtime, bom.status))
+        as_of_index.add("BOM$", (bom.BOM_id, bom.part_id, bom.child_id, bom.child_qty, bom.child_leadtime, bom.BOM_last_updated, bom.status))
+        results.changed("BOM$", "Routings$")
+        for plan in net_change_plans.values():
+            plan.bom_changed()
+
         response = {
             "message": "BOM and Routing created successfully",
             "data": bom
         }
         return response    
 
-    except pyodbc.IntegrityError:
+    except IntegrityError:
+        connection.rollback()
         return {"error": error_messages["integrity_error"]}
-    except pyodbc.DatabaseError as e:
+    except DatabaseError as e:
+        connection.rollback()
         return {"error": f"{error_messages['database_error']}: {str(e)}"}
     except Exception as e:
+        connection.rollback()
         return {"error": f"{error_messages['unexpected_error']}: {str(e)}"}
 
+@app.post("/BOM")
+async def create_bom(bom: BOM, request: Request):
+    return await database.run(create_bom_blocking, bom, request=request)
 
-@app.delete("/bom/{BOM_id}")
-async def delete_bom(BOM_id: str):
+def delete_bom_blocking(connection, BOM_id: str):
+    cursor = connection.cursor()
 
     error_messages = {
         "connection_unavailable": "Database connection is not available",
@@ -319,6 +374,11 @@ async def delete_bom(BOM_id: str):
         
         # Commit the transaction
         connection.commit()
+        bom_graph.remove_line(BOM_id)
+        as_of_index.remove("BOM$", BOM_id)
+        results.changed("BOM$")
+        for plan in net_change_plans.values():
+            plan.bom_changed()
 
         # If no exceptions, return success response
         response = {
@@ -327,46 +387,30 @@ async def delete_bom(BOM_id: str):
         }
         return response
 
-    except pyodbc.IntegrityError:
+    except IntegrityError:
         raise HTTPException(status_code=400, detail=error_messages["integrity_error"])
-    except pyodbc.DatabaseError:
+    except DatabaseError:
         raise HTTPException(status_code=500, detail=error_messages["database_error"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{error_messages['unexpected_error']}: {str(e)}")
 
-@app.put("/BOM/{BOM_id}")
-async def update_bom(BOM_id: str, bom: BOM):
+@app.delete("/bom/{BOM_id}")
+async def delete_bom(BOM_id: str, request: Request):
+    return await database.run(delete_bom_blocking, BOM_id, request=request)
+
+def update_bom_blocking(connection, BOM_id: str, bom: BOM):
+    cursor = connection.cursor()
+
     try:
-        # Fetch all existing BOM entries
-        cursor.execute("SELECT part_id, child_id FROM dbo.BOM$")
-        all_bom_entries = cursor.fetchall()
-        
-        # Create a dictionary to map part_id to its children
-        bom_dict = {}
-        for part_id, child_id in all_bom_entries:
-            if part_id in bom_dict:
-                bom_dict[part_id].append(child_id)
-            else:
-                bom_dict[part_id] = [child_id]
-
-        # Function to check for circular dependency using DFS
-        def has_circular_dependency(new_child_id, old_part_id, visited=None):
-            if visited is None:
-                visited = set()
-            if new_child_id in visited:
-                return False
-            visited.add(new_child_id)
-            children = bom_dict.get(new_child_id, [])
-            for child in children:
-                if child == old_part_id:
-                    return True
-                if has_circular_dependency(child, old_part_id, visited):
-                    return True
-            visited.remove(new_child_id)
-            return False
-
-        # Check for circular dependency
-        if has_circular_dependency(bom.child_id, bom.part_id):
+        # The BOM index is keyed by the ids the way the part master has them
+        part_id, child_id = canonical_part_ids(cursor, bom.part_id, bom.child_id)
+        if part_id is None or child_id is None:
+            raise HTTPException(status_code=400, detail="part_id and/or child_id doesn't exist")
+        bom.part_id, bom.child_id = part_id, child_id
+
+        # Check for circular dependency against the in-memory BOM index
+        bom_graph.refresh(connection)
+        if bom_graph.would_create_cycle(bom.part_id, bom.child_id):
             raise HTTPException(status_code=400, detail="Action cannot be completed: this item can't exist as both a parent and a child.")
 
         # Check if the BOM_id exists and its status
@@ -379,7 +423,12 @@ async def update_bom(BOM_id: str, bom: BOM):
 
         if existing_bom[0] != 'active':
             raise HTTPException(status_code=400, detail="The BOM entry is not active or already updated.")
-        
+
+        # Reserve the new BOM_id once the request is valid, so a refused one uses up no id, and
+        # before the first write: the reservation commits on a connection of its own, which must
+        # not wait on (or, on SQLite, outdate the snapshot of) this transaction
+        new_BOM_id = id_allocator.next_id("BOM$")
+
         # Update status of the existing BOM entry to 'NA'
         update_status_query = """
         UPDATE dbo.BOM$
@@ -391,19 +440,7 @@ async def update_bom(BOM_id: str, bom: BOM):
         if cursor.rowcount == 0:
             raise HTTPException(status_code=500, detail=f"Unable to update status for BOM_id {BOM_id}")
         
-        # Generate a new BOM_id
-        last_id_query = "SELECT TOP 1 BOM_id FROM dbo.BOM$ ORDER BY CAST(SUBSTRING(BOM_id, 2, LEN(BOM_id)-1) AS INT) DESC"
-        cursor.execute(last_id_query)
-        last_id_row = cursor.fetchone()
-
-        if not last_id_row:
-            new_BOM_id = "B001"
-        else:
-            last_id = last_id_row[0]
-            prefix, number = last_id[0], int(last_id[1:])
-            new_BOM_id = f"{prefix}{str(number + 1).zfill(3)}"
-
-        # Insert the new BOM entry with updated child_id or other changes
+        # Insert the new BOM entry with updated child_id or other changes, under the new BOM_id
         bom.BOM_id = new_BOM_id
         bom.status = "active"
 
@@ -426,6 +463,15 @@ async def update_bom(BOM_id: str, bom: BOM):
 
         connection.commit()
 
+        # Keep the in-memory BOM and as-of indexes in step with the committed rows
+        bom_graph.set_status(BOM_id, "NA")
+        bom_graph.add_line(BomLine(bom.BOM_id, bom.part_id, bom.child_id, bom.child_qty, bom.child_leadtime, bom.status))
+        as_of_index.set_status("BOM$", "NA", BOM_id)
+        as_of_index.add("BOM$", (bom.BOM_id, bom.part_id, bom.child_id, bom.child_qty, bom.child_leadtime, bom.BOM_last_updated, bom.status))
+        results.changed("BOM$")
+        for plan in net_change_plans.values():
+            plan.bom_changed()
+
         response = {
             "message": "BOM created successfully",
             "BOM_data": bom,
@@ -439,16 +485,208 @@ async def update_bom(BOM_id: str, bom: BOM):
         connection.rollback()
         return {"error": f"An unexpected error occurred: {str(e)}"}
 
+@app.put("/BOM/{BOM_id}")
+async def update_bom(BOM_id: str, bom: BOM, request: Request):
+    return await database.run(update_bom_blocking, BOM_id, bom, request=request)
+
+def select_in(cursor, query, values, params=()):
+    # Rows of query for every value, run with the values in chunks of an IN (...) list that
+    # replaces the {values} placeholder of query
+    rows = []
+    values = list(values)
+    for i in range(0, len(values), in_list_size):
+        chunk = values[i:i + in_list_size]
+        cursor.execute(query.format(values=", ".join("?" * len(chunk))), list(params) + chunk)
+        rows.extend(cursor.fetchall())
+    return rows
+
+def import_bom_blocking(connection, bom_import: BomImport):
+    lines = bom_import.lines
+    cursor = connection.cursor()
+
+    # Every check runs for the whole batch before anything is written
+    cursor.execute("SELECT part_id FROM dbo.Part_Master_Records$")
+    parts = {part_id.upper(): part_id for part_id, in cursor.fetchall()}
+    cursor.execute("SELECT workcentre_id FROM dbo.Workcentre$")
+    workcentres = {workcentre_id.upper(): workcentre_id for workcentre_id, in cursor.fetchall()}
+    errors = {}
+    edges = []
+    seen = {}
+    for position, line in enumerate(lines):
+        messages = []
+        part_id, child_id = parts.get(line.part_id.upper()), parts.get(line.child_id.upper())
+        if part_id is None:
+            messages.append(f"part_id {line.part_id} does not exist")
+        if child_id is None:
+            messages.append(f"child_id {line.child_id} does not exist")
+        # Ids are written the way the part master has them, so the in-memory indexes match
+        line.part_id, line.child_id = part_id or line.part_id, child_id or line.child_id
+        pair = (line.part_id.upper(), line.child_id.upper())
+        if pair in seen:
+            messages.append(f"Same part_id and child_id as row {seen[pair] + 1}")
+        seen.setdefault(pair, position)
+        for routing in line.routings:
+            if routing.workcentre_id.upper() not in workcentres:
+                messages.append(f"workcentre_id {routing.workcentre_id} does not exist")
+            routing.workcentre_id = workcentres.get(routing.workcentre_id.upper(), routing.workcentre_id)
+        if messages:
+            errors[position] = messages
+        edges.append((line.part_id, line.child_id))
+
+    bom_graph.refresh(connection)
+    for position in bom_graph.batch_cycles(edges):
+        errors.setdefault(position, []).append("Action cannot be completed: this item can't exist as both a parent and a child.")
+    if errors:
+        rejected = [{"row": position + 1, "errors": messages} for position, messages in sorted(errors.items())]
+        raise HTTPException(status_code=422, detail={"message": f"{len(rejected)} of {len(lines)} BOM lines are invalid, none were imported", "errors": rejected})
+
+    # Active rows the batch supersedes: of the same parent and child, or with replace=true every
+    # active row of a parent in the batch, which then gets exactly the structure of the batch
+    pairs = {(line.part_id.upper(), line.child_id.upper()) for line in lines}
+    retired = [
+        BOM_id
+        for BOM_id, part_id, child_id in select_in(cursor, "SELECT BOM_id, part_id, child_id FROM dbo.BOM$ WHERE status = 'active' AND part_id IN ({values})", {line.part_id for line in lines})
+        if bom_import.replace or (part_id.upper(), child_id.upper()) in pairs
+    ]
+
+    now = datetime.now()
+    BOM_ids = id_allocator.next_ids("BOM$", len(lines))
+    routing_ids = iter(id_allocator.next_ids("Routings$", sum(len(line.routings) for line in lines)))
+    bom_rows = [
+        (BOM_id, line.part_id, line.child_id, line.child_qty, line.child_leadtime, now, "active")
+        for BOM_id, line in zip(BOM_ids, lines)
+    ]
+    routing_rows = [
+        (next(routing_ids), BOM_id, routing.operations_sequence, routing.workcentre_id, routing.process_description, routing.setup_time, routing.runtime, now, "active")
+        for BOM_id, line in zip(BOM_ids, lines)
+        for routing in line.routings
+    ]
+    routings_by_bom = {}
+    for routing in routing_rows:
+        routings_by_bom.setdefault(routing[1], []).append(routing[0])
+    try:
+        for i in range(0, len(retired), in_list_size):
+            chunk = retired[i:i + in_list_size]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor.execute(f"UPDATE dbo.BOM$ SET status = 'NA' WHERE status = 'active' AND BOM_id IN ({placeholders})", chunk)
+            cursor.execute(f"UPDATE dbo.Routings$ SET status = 'NA' WHERE status = 'active' AND BOM_id IN ({placeholders})", chunk)
+        insert_rows(connection, "INSERT INTO dbo.BOM$ (BOM_id, part_id, child_id, child_qty, child_leadtime, BOM_last_updated, status) VALUES (?, ?, ?, ?, ?, ?, ?)", bom_rows)
+        insert_rows(connection, "INSERT INTO dbo.Routings$ (routing_id, BOM_id, operations_sequence, workcentre_id, process_description, setup_time, runtime, routings_last_update, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", routing_rows)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    # Keep the in-memory BOM and as-of indexes in step with the committed rows
+    for BOM_id in retired:
+        bom_graph.set_status(BOM_id, "NA")
+    for row in bom_rows:
+        bom_graph.add_line(BomLine(*row[:5], row[6]))
+    as_of_index.set_status("BOM$", "NA", *retired)
+    as_of_index.set_status("Routings$", "NA", *(
+        routing["routing_id"] for BOM_id in retired for routing in as_of_index.routings.history(BOM_id) if routing["status"] == "active"
+    ))
+    as_of_index.add("BOM$", *bom_rows)
+    as_of_index.add("Routings$", *routing_rows)
+    results.changed("BOM$", "Routings$")
+    for plan in net_change_plans.values():
+        plan.bom_changed()
+
+    return {
+        "message": f"{len(bom_rows)} BOM lines and {len(routing_rows)} routings imported",
+        "retired": retired,
+        "created": [
+            {"row": position + 1, "BOM_id": row[0], "routing_ids": routings_by_bom.get(row[0], [])}
+            for position, row in enumerate(bom_rows)
+        ],
+    }
+
+# A product structure in one call: the BOM lines of the batch (each optionally with its
+# routings) are checked together, with one cycle check for the whole batch, and written in one
+# transaction. A line supersedes the active row with the same part_id and child_id, which is
+# retired with its routings; with replace=true every active row of the parents in the batch is
+# retired. When any line is invalid nothing is written and the answer is a 422 listing the
+# errors per line.
+@app.post("/BOM:bulk")
+async def import_bom(bom_import: BomImport, request: Request):
+    return await database.run(import_bom_blocking, bom_import, request=request, timeout=bulk_timeout)
+
+def get_bom_ancestors_blocking(connection, part_id: str, include_inactive: bool):
+    bom_graph.refresh(connection)
+    return {"part_id": part_id, "ancestors": bom_graph.ancestors(part_id, include_inactive)}
+
+@app.get("/BOM/{part_id}/ancestors")
+async def get_bom_ancestors(part_id: str, request: Request, include_inactive: bool = False):
+    return await database.run(get_bom_ancestors_blocking, part_id, include_inactive, request=request)
+
+def get_bom_descendants_blocking(connection, part_id: str, include_inactive: bool):
+    bom_graph.refresh(connection)
+    return {"part_id": part_id, "descendants": bom_graph.descendants(part_id, include_inactive)}
+
+@app.get("/BOM/{part_id}/descendants")
+async def get_bom_descendants(part_id: str, request: Request, include_inactive: bool = False):
+    return await database.run(get_bom_descendants_blocking, part_id, include_inactive, request=request)
+
+def explode_bom_blocking(connection, part_id: str, qty: float, depth: Optional[int], stream: bool):
+    part_id = canonical_part_ids(connection.cursor(), part_id)[0]
+    if part_id is None:
+        raise HTTPException(status_code=404, detail="Part not found")
+    bom_graph.refresh(connection)
+    explosion = bom_graph.explode(part_id, qty, depth)
+    return part_id, explosion if stream else list(explosion)
+
+@app.get("/BOM/{part_id}/explode")
+async def explode_bom(part_id: str, request: Request, qty: float = 1, depth: Optional[int] = Query(None, ge=1), stream: bool = False):
+    # A stream is exploded level by level while it is written, down to depth only
+    part_id, explosion = await database.run(explode_bom_blocking, part_id, qty, depth, stream, request=request)
+
+    def entries():
+        for level, BOM_id, parent_id, child_id, child_qty, extended in explosion:
+            yield {
+                "level": level,
+                "BOM_id": BOM_id,
+                "part_id": parent_id,
+                "child_id": child_id,
+                "child_qty": child_qty,
+                "extended_qty": extended,
+            }
+
+    if stream:
+        return StreamingResponse(ndjson_lines(entries()), media_type="application/x-ndjson")
+    return {"part_id": part_id, "qty": qty, "value": list(entries())}
+
+def get_bom_as_of_blocking(connection, part_id: str, at: datetime):
+    as_of_index.refresh(connection)
+    return as_of_index.structure(part_id, at)
+
+# The BOM of a part as it stood at a point in time (now by default): for every child the latest
+# BOM row written at or before then, with the routing and workcentre versions valid at that time.
+# status is the row's current status, the table does not record when it changed.
+@app.get("/BOM/{part_id}/asof")
+async def get_bom_as_of(part_id: str, request: Request, at: Optional[datetime] = None):
+    at = local_time(at) or datetime.now()
+    lines = await database.run(get_bom_as_of_blocking, part_id, at, request=request)
+    if not lines:
+        raise HTTPException(status_code=404, detail=f"Part {part_id} had no BOM at {at.isoformat()}")
+    return {
+        "part_id": part_id,
+        "at": at,
+        "value": [
+            {
+                **bom,
+                "routings": [{**routing, "workcentre": workcentres[0] if workcentres else None} for routing, workcentres in routings],
+            }
+            for bom, routings in lines
+        ],
+    }
 
 @app.get("/routings") 
-async def get_routings(): 
-    query = "SELECT * FROM dbo.Routings$" 
-    return execute_query(query) 
+async def get_routings(request: Request, top: Optional[int] = Query(None, alias="$top", ge=1), skiptoken: Optional[str] = Query(None, alias="$skiptoken")): 
+    return await get_page(request, "Routings$", "routing_id", top, skiptoken)
 
-@app.post("/routings")
-async def create_routing(routing: Routing):
+def create_routing_blocking(connection, routing: Routing):
 
-    global routing_counter
+    cursor = connection.cursor()
 
     error_messages = {
         "connection_unavailable": "Database connection is not available",
@@ -468,32 +706,10 @@ async def create_routing(routing: Routing):
         if cursor is None:
             return {"error": error_messages["cursor_uninitialized"]}
 
-        # Fetch the latest routing_id from the database
-        query = "SELECT TOP 1 routing_id FROM dbo.Routings$ ORDER BY routing_id DESC"
-        cursor.execute(query)
-        result = cursor.fetchone()
-
-        if result:
-            latest_routing_id = result[0]  # e.g., "R913"
-            # Extract the integer part of the routing_id
-            routing_counter = int(latest_routing_id[1:])  # Ignore the "R" prefix
-        else:
-            routing_counter = 0  # Default to 0 if no records are found
-
-        # Increment the counter for the new routing_id
-        routing_counter += 1
-        routing_id = f"R{str(routing_counter).zfill(3)}"
-        routing.routing_id = routing_id
+        # Reserve the new routing_id
+        routing.routing_id = id_allocator.next_id("Routings$")
         routing.status = "active"
 
-        # Check if routing_id already exists
-        check_query = "SELECT COUNT(*) FROM dbo.Routings$ WHERE routing_id = ?"
-        cursor.execute(check_query, (routing.routing_id,))
-        count = cursor.fetchone()[0]
-
-        if count > 0:
-            raise HTTPException(status_code=400, detail="routing_id already exists and cannot be added")
-        
         # Insert data into the database
         insert_query = """
         INSERT INTO dbo.Routings$ (routing_id, BOM_id, operations_sequence, workcentre_id, process_description, setup_time, runtime, routings_last_update,status)
@@ -512,6 +728,11 @@ async def create_routing(routing: Routing):
         ))
     
         connection.commit()
+        as_of_index.add("Routings$", (
+            routing.routing_id, routing.BOM_id, routing.operations_sequence, routing.workcentre_id, routing.process_description,
+            routing.setup_time, routing.runtime, routing.routings_last_update, routing.status,
+        ))
+        results.changed("Routings$")
 
         response = {
             "message": "Routing created successfully",
@@ -519,61 +740,65 @@ async def create_routing(routing: Routing):
         }
         return response      
 
-    except pyodbc.IntegrityError:
+    except IntegrityError:
         return {"error": error_messages["integrity_error"]}
-    except pyodbc.DatabaseError as e:
+    except DatabaseError as e:
         return {"error": f"{error_messages['database_error']}: {str(e)}"}
     except Exception as e:
         return {"error": f"{error_messages['unexpected_error']}: {str(e)}"}
 
-    
-@app.put("/routings/{routing_id}")
-async def update_routing(routing_id: str, routing: Routing):
-
-    last_id_query = "SELECT TOP 1 routing_id FROM dbo.Routings$ ORDER BY CAST(SUBSTRING(routing_id, 2, LEN(routing_id)-1) AS INT) DESC"
-    cursor.execute(last_id_query)
-    last_id_row = cursor.fetchone()
-
-    if not last_id_row:
-        # If no existing BOMs, start with a base ID, e.g., "B001"
-        new_routing_id = "R001"
-    else:
-        last_id = last_id_row[0]
-        # Assuming the format "B###", extract the numeric part, increment, and reformat
-        prefix, number = last_id[0], int(last_id[1:])
-        new_routing_id = f"{prefix}{str(number + 1).zfill(3)}"
-
-    update_status_query = """
-    UPDATE dbo.Routings$
-    SET status = 'NA'
-    WHERE routing_id = ? 
-    """
+@app.post("/routings")
+async def create_routing(routing: Routing, request: Request):
+    return await database.run(create_routing_blocking, routing, request=request)
 
-    cursor.execute(update_status_query, (routing_id,))
+def update_routing_blocking(connection, routing_id: str, routing: Routing):
+    cursor = connection.cursor()
 
-    routing.routing_id = new_routing_id
-    routing.status = "active"
+    cursor.execute("SELECT routing_id FROM dbo.Routings$ WHERE routing_id = ?", (routing_id,))
+    if cursor.fetchone() is None:
+        raise HTTPException(status_code=404, detail=f"routing_id {routing_id} not found")
 
-    insert_query = """
-    INSERT INTO dbo.Routings$ (routing_id, BOM_id, operations_sequence, workcentre_id, process_description, setup_time, runtime, routings_last_update,status)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?,?)
-    """
-    cursor.execute(insert_query, (
-        routing.routing_id,
-        routing.BOM_id,
-        routing.operations_sequence,
-        routing.workcentre_id,
-        routing.process_description,
-        routing.setup_time,
-        routing.runtime,
-        routing.routings_last_update,
-        routing.status
-    ))
+    # Reserve the new routing_id once the routing is found and before the first write, see
+    # update_bom_blocking
+    new_routing_id = id_allocator.next_id("Routings$")
 
-    if cursor.rowcount == 0:
-        raise HTTPException(status_code=404, detail=f"routing_id {routing_id} not found")
-    
-    connection.commit()
+    try:
+        update_status_query = """
+        UPDATE dbo.Routings$
+        SET status = 'NA'
+        WHERE routing_id = ? 
+        """
+
+        cursor.execute(update_status_query, (routing_id,))
+
+        routing.routing_id = new_routing_id
+        routing.status = "active"
+
+        insert_query = """
+        INSERT INTO dbo.Routings$ (routing_id, BOM_id, operations_sequence, workcentre_id, process_description, setup_time, runtime, routings_last_update,status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?,?)
+        """
+        cursor.execute(insert_query, (
+            routing.routing_id,
+            routing.BOM_id,
+            routing.operations_sequence,
+            routing.workcentre_id,
+            routing.process_description,
+            routing.setup_time,
+            routing.runtime,
+            routing.routings_last_update,
+            routing.status
+        ))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    as_of_index.set_status("Routings$", "NA", routing_id)
+    as_of_index.add("Routings$", (
+        routing.routing_id, routing.BOM_id, routing.operations_sequence, routing.workcentre_id, routing.process_description,
+        routing.setup_time, routing.runtime, routing.routings_last_update, routing.status,
+    ))
+    results.changed("Routings$")
     response = {
         "message": "Routings updated successfully with new routing_id",
         "data": {
@@ -589,9 +814,13 @@ async def update_routing(routing_id: str, routing: Routing):
         }
     }
     return response
- 
-@app.delete("/routing/{routing_id}")
-async def delete_routing(routing_id: str):
+
+@app.put("/routings/{routing_id}")
+async def update_routing(routing_id: str, routing: Routing, request: Request):
+    return await database.run(update_routing_blocking, routing_id, routing, request=request)
+
+def delete_routing_blocking(connection, routing_id: str):
+    cursor = connection.cursor()
     error_messages = {
         "connection_unavailable": "Database connection is not available",
         "cursor_uninitialized": "Database cursor is not initialized",
@@ -638,6 +867,8 @@ async def delete_routing(routing_id: str):
         
         # Commit the transaction
         connection.commit()
+        as_of_index.remove("Routings$", routing_id)
+        results.changed("Routings$")
 
         # If no exceptions, return success response
         response = {
@@ -646,22 +877,24 @@ async def delete_routing(routing_id: str):
         }
         return response
 
-    except pyodbc.IntegrityError:
+    except IntegrityError:
         raise HTTPException(status_code=400, detail=error_messages["integrity_error"])
-    except pyodbc.DatabaseError:
+    except DatabaseError:
         raise HTTPException(status_code=500, detail=error_messages["database_error"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{error_messages['unexpected_error']}: {str(e)}")
 
+@app.delete("/routing/{routing_id}")
+async def delete_routing(routing_id: str, request: Request):
+    return await database.run(delete_routing_blocking, routing_id, request=request)
+
 @app.get("/partmasterrecords") 
-async def get_part_master_records(): 
-    query = "SELECT * FROM dbo.Part_Master_Records$" 
-    return execute_query(query) 
+async def get_part_master_records(request: Request, top: Optional[int] = Query(None, alias="$top", ge=1), skiptoken: Optional[str] = Query(None, alias="$skiptoken")): 
+    return await get_page(request, "Part_Master_Records$", "part_id", top, skiptoken)
 
-@app.post("/partmasterrecords")
-async def create_part(part: Part):
+def create_part_blocking(connection, part: Part):
 
-    global part_counter
+    cursor = connection.cursor()
 
     error_messages = {
         "connection_unavailable": "Database connection is not available",
@@ -681,32 +914,10 @@ async def create_part(part: Part):
         if cursor is None:
             return {"error": error_messages["cursor_uninitialized"]}
 
-        # Fetch the latest part_id from the database
-        query = "SELECT TOP 1 part_id FROM dbo.Part_Master_Records$ ORDER BY part_id DESC"
-        cursor.execute(query)
-        result = cursor.fetchone()
-
-        if result:
-            latest_part_id = result[0]  # e.g., "WC145"
-            # Extract the integer part of the part_id
-            part_counter = int(latest_part_id[1:])  # Ignore the "WC" prefix
-        else:
-            part_counter = 0  # Default to 0 if no records are found
-
-        # Increment the counter for the new part_id
-        part_counter += 1
-        part_id = f"P{str(part_counter).zfill(3)}"
-        part.part_id = part_id
+        # Reserve the new part_id
+        part.part_id = id_allocator.next_id("Part_Master_Records$")
         part.status = "Active"
         
-        # Check if the part_id already exists
-        check_query = "SELECT COUNT(*) FROM dbo.Part_Master_Records$ WHERE part_id = ?"
-        cursor.execute(check_query, (part.part_id,))
-        count = cursor.fetchone()[0]
-
-        if count > 0:
-            raise HTTPException(status_code=400, detail="part_id already exists and cannot be added")
-        
         current_time = datetime.now()
         
         # Insert data into the database
@@ -728,6 +939,9 @@ async def create_part(part: Part):
         ))
     
         connection.commit()
+        results.changed("Part_Master_Records$")
+        for plan in net_change_plans.values():
+            plan.part_changed(part.part_id, part.inventory, part.lead_time)
 
         response = {
             "message": "Part created successfully",
@@ -735,15 +949,19 @@ async def create_part(part: Part):
         }
         return response
 
-    except pyodbc.IntegrityError:
+    except IntegrityError:
         return {"error": error_messages["integrity_error"]}
-    except pyodbc.DatabaseError as e:
+    except DatabaseError as e:
         return {"error": f"{error_messages['database_error']}: {str(e)}"}
     except Exception as e:
         return {"error": f"{error_messages['unexpected_error']}: {str(e)}"}
 
-@app.put("/partmasterrecords/{part_id}")
-async def update_part(part_id: str, part: Part):
+@app.post("/partmasterrecords")
+async def create_part(part: Part, request: Request):
+    return await database.run(create_part_blocking, part, request=request)
+
+def update_part_blocking(connection, part_id: str, part: Part):
+    cursor = connection.cursor()
 
     # Fetch the existing part details
     existing_part_query = "SELECT part_name FROM dbo.Part_Master_Records$ WHERE part_id = ?"
@@ -777,6 +995,9 @@ async def update_part(part_id: str, part: Part):
     ))
 
     connection.commit()
+    results.changed("Part_Master_Records$")
+    for plan in net_change_plans.values():
+        plan.part_changed(part_id, part.inventory, part.lead_time)
     response = {
         "message": "Part Master Records updated successfully",
         "data": {
@@ -794,14 +1015,19 @@ async def update_part(part_id: str, part: Part):
     }
     return response
 
-@app.delete("/partmasterrecords/{part_id}")
-async def delete_part(part_id: str):
+@app.put("/partmasterrecords/{part_id}")
+async def update_part(part_id: str, part: Part, request: Request):
+    return await database.run(update_part_blocking, part_id, part, request=request)
+
+def delete_part_blocking(connection, part_id: str):
+    cursor = connection.cursor()
 
     error_messages = {
         "connection_unavailable": "Database connection is not available",
         "cursor_uninitialized": "Database cursor is not initialized",
-        "referenced_entry": "Cannot delete BOM entry because it is referenced by Routings$ table.",
-        "bom_not_found": "BOM not found",
+        "referenced_entry": "Cannot delete part because it is referenced by BOM$ table.",
+        "part_not_found": "Part not found",
+        "part_deleted": "Part deleted successfully",
         "integrity_error": "Database integrity error: Check constraints and foreign keys.",
         "database_error": "Database error occurred.",
         "unexpected_error": "An unexpected error occurred."
@@ -816,94 +1042,189 @@ async def delete_part(part_id: str):
         if cursor is None:
             raise HTTPException(status_code=503, detail=error_messages["cursor_uninitialized"])
 
-        # Check for referencing entries in dbo.BOM$
-        check_query = "SELECT COUNT(*) FROM dbo.BOM$ WHERE part_id = ?"
-        cursor.execute(check_query, (part_id,))
-        referencing_count = cursor.fetchone()[0]
+        # The where-used index is keyed by the part id the way the part master has it
+        part_id = canonical_part_ids(cursor, part_id)[0]
+        if part_id is None:
+            raise HTTPException(status_code=404, detail=error_messages["part_not_found"])
 
-        if referencing_count > 0:
+        # Check for referencing entries in dbo.BOM$ (as parent or child) through the where-used index
+        bom_graph.refresh(connection)
+        if bom_graph.is_referenced(part_id):
             raise HTTPException(status_code=409, detail=error_messages["referenced_entry"])
 
         # Delete part entry
-        delete_query = "DELETE FROM dbo.BOM$ WHERE part_id = ?"
+        delete_query = "DELETE FROM dbo.Part_Master_Records$ WHERE part_id = ?"
         cursor.execute(delete_query, (part_id,))
         
         if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail=error_messages["routing_not_found"])
+            raise HTTPException(status_code=404, detail=error_messages["part_not_found"])
         
         connection.commit()
+        results.changed("Part_Master_Records$")
 
         response = {
-            "message": error_messages["unexpected_error"],
+            "message": error_messages["part_deleted"],
             "part_id": part_id
         }
         return response
 
-    except pyodbc.IntegrityError:
+    except HTTPException:
+        raise
+    except IntegrityError:
         raise HTTPException(status_code=400, detail=error_messages["integrity_error"])
-    except pyodbc.DatabaseError:
+    except DatabaseError:
         raise HTTPException(status_code=500, detail=error_messages["database_error"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{error_messages['unexpected_error']}: {str(e)}")
 
-@app.get("/orderdetailsfull/{order_id}")
-async def get_full_order_details(order_id: str):
+def get_where_used_blocking(connection, part_id: str, full: bool):
+    bom_graph.refresh(connection)
+    rows = bom_graph.where_used(part_id, full)
+    response = {
+        "part_id": part_id,
+        "value": [
+            {"level": level, "BOM_id": BOM_id, "part_id": parent_id, "child_id": child_id, "child_qty": child_qty}
+            for level, BOM_id, parent_id, child_id, child_qty in rows
+        ],
+    }
+    if full:
+        response["top_level_parts"] = bom_graph.top_level_parents(part_id)
+    return response
+
+@app.get("/partmasterrecords/{part_id}/whereused")
+async def get_where_used(part_id: str, request: Request, full: bool = False):
+    return await database.run(get_where_used_blocking, part_id, full, request=request)
+
+@app.delete("/partmasterrecords/{part_id}")
+async def delete_part(part_id: str, request: Request):
+    return await database.run(delete_part_blocking, part_id, request=request)
+
+def get_rollup_blocking(connection, rollup, part_id: Optional[str]):
+    rollup.refresh(connection, results.versions(rollup.tables))
+    if part_id is None:
+        return rollup.get_all()
+    return rollup.get(part_id)
+
+def cost_rollup_rows(costs):
+    return [
+        {
+            "part_id": part_id,
+            "unit_cost": unit_cost,
+            "material_cost": material,
+            "labour_cost": labour,
+            "rolled_cost": rolled,
+        }
+        for part_id, (unit_cost, (material, labour, rolled)) in costs.items()
+    ]
+
+# Rolled-up standard cost of every part
+@app.get("/costs/rollup")
+async def get_cost_rollups(request: Request):
+    costs = await database.run(get_rollup_blocking, cost_rollup, None, request=request)
+    return {"value": cost_rollup_rows(costs)}
+
+# Rolled-up standard cost of one part, with the cost of each of its BOM children
+@app.get("/costs/rollup/{part_id}")
+async def get_cost_rollup(part_id: str, request: Request):
+    cost = await database.run(get_rollup_blocking, cost_rollup, part_id, request=request)
+    if cost is None:
+        raise HTTPException(status_code=404, detail="Part not found")
+    unit_cost, (material, labour, rolled), children = cost
+    return {
+        "part_id": part_id,
+        "unit_cost": unit_cost,
+        "material_cost": material,
+        "labour_cost": labour,
+        "rolled_cost": rolled,
+        "children": [
+            {
+                "child_id": child_id,
+                "child_qty": child_qty,
+                "labour_cost": line_labour,
+                "child_cost": child_cost[2],
+                "extended_cost": child_qty * child_cost[2] + line_labour,
+            }
+            for child_id, (child_qty, line_labour), child_cost in children
+        ],
+    }
+
+def lead_time_rows(lead_times):
+    return [
+        {
+            "part_id": part_id,
+            "lead_time": lead_time,
+            "cumulative_lead_time": cumulative,
+            "driving_path": [part_id] + [child_id for child_id, _ in path],
+        }
+        for part_id, (lead_time, (cumulative, _, path)) in lead_times.items()
+    ]
+
+# Cumulative (critical path) lead time of every part
+@app.get("/leadtimes")
+async def get_cumulative_lead_times(request: Request):
+    lead_times = await database.run(get_rollup_blocking, lead_time_rollup, None, request=request)
+    return {"value": lead_time_rows(lead_times)}
+
+# Cumulative lead time of one part, with the chain of BOM rows that drives it
+@app.get("/leadtimes/{part_id}")
+async def get_cumulative_lead_time(part_id: str, request: Request):
+    lead_time = await database.run(get_rollup_blocking, lead_time_rollup, part_id, request=request)
+    if lead_time is None:
+        raise HTTPException(status_code=404, detail="Part not found")
+    own, (cumulative, _, path), _ = lead_time
+    return {
+        "part_id": part_id,
+        "lead_time": own,
+        "cumulative_lead_time": cumulative,
+        "driving_path": [{"part_id": part_id, "lead_time": own or 0}] + [
+            {"part_id": child_id, "lead_time": line_lead_time} for child_id, line_lead_time in path
+        ],
+    }
+
+# Orders with their part, and the BOM, routing and workcentre versions that were valid on each
+# order_date, looked up in the version index instead of with a MAX() subquery per joined row.
+# Returns {order_id: [detail rows]} in the order of the query; orders without any are left out.
+def fetch_order_details(connection, where: str, params=()):
+    cursor = connection.cursor()
+    query = f"""
+    SELECT 
+        o.order_id, 
+        o.part_id, 
+        o.part_qty,
+        o.order_date, 
+        o.due_date, 
+        o.order_last_updated,
+        pmr.part_name, 
+        pmr.part_description,
+        pmr.inventory,
+        pmr.POM,
+        pmr.unit_cost,
+        pmr.lead_time
+    FROM 
+        dbo.Orders$ o
+    JOIN 
+        dbo.Part_Master_Records$ pmr ON o.part_id = pmr.part_id
+    WHERE 
+        {where}
+    """
+    cursor.execute(query, params)
+    orders = cursor.fetchall()
+    as_of_index.refresh(connection)
+
+    details = {}
+    for order in orders:
+        order = tuple(order)
+        for b, r, wc in as_of_index.resolve(order[1], order[3]):
+            details.setdefault(order[0], []).append(order + (
+                b["BOM_id"], b["part_id"], b["child_id"], b["child_qty"], b["child_leadtime"], b["BOM_last_updated"],
+                r["routing_id"], r["routings_last_update"],
+                wc["workcentre_id"], wc["workcentre_name"], wc["workcentre_last_updated"],
+            ))
+    return details
+
+def get_full_order_details_blocking(connection, order_id: str):
     try:
-        query = """
-        SELECT 
-            o.order_id, 
-            o.part_id, 
-            o.part_qty,
-            o.order_date, 
-            o.due_date, 
-            o.order_last_updated,
-            pmr.part_name, 
-            pmr.part_description,
-            pmr.inventory,
-            pmr.POM,
-            pmr.unit_cost,
-            pmr.lead_time,
-            b.BOM_id, 
-            b.part_id,
-            b.child_id,
-            b.child_qty,
-            b.child_leadtime,
-            b.BOM_last_updated,
-            r.routing_id, 
-            r.routings_last_update,
-            wc.workcentre_id, 
-            wc.workcentre_name, 
-            wc.workcentre_last_updated
-        FROM 
-            dbo.Orders$ o
-        JOIN 
-            dbo.Part_Master_Records$ pmr ON o.part_id = pmr.part_id
-        JOIN 
-            dbo.BOM$ b ON o.part_id = b.part_id
-        JOIN 
-            dbo.Routings$ r ON b.BOM_id = r.BOM_id
-        JOIN 
-            dbo.Workcentre$ wc ON r.workcentre_id = wc.workcentre_id
-        WHERE 
-            o.order_id = ?
-            AND b.BOM_last_updated = (
-                SELECT MAX(b2.BOM_last_updated)
-                FROM dbo.BOM$ b2
-                WHERE b2.part_id = o.part_id AND b2.BOM_last_updated <= o.order_date
-            )
-            AND r.routings_last_update = (
-                SELECT MAX(r2.routings_last_update)
-                FROM dbo.Routings$ r2
-                WHERE r2.BOM_id = b.BOM_id AND r2.routings_last_update <= o.order_date
-            )
-            AND wc.workcentre_last_updated = (
-                SELECT MAX(wc2.workcentre_last_updated)
-                FROM dbo.Workcentre$ wc2
-                WHERE wc2.workcentre_id = r.workcentre_id AND wc2.workcentre_last_updated <= o.order_date
-            )
-        """
-        cursor.execute(query, (order_id,))
-        result = cursor.fetchall()
+        result = fetch_order_details(connection, "o.order_id = ?", (order_id,)).get(order_id)
         if not result:
             raise HTTPException(status_code=404, detail="Order not found")
         return result
@@ -913,22 +1234,60 @@ async def get_full_order_details(order_id: str):
     except Exception as e:
         return {"error": f"An unexpected error occurred: {str(e)}"}
 
+@app.get("/orderdetailsfull/{order_id}")
+async def get_full_order_details(order_id: str, request: Request):
+    return await database.run(get_full_order_details_blocking, order_id, request=request)
+
+def get_order_details_batch_blocking(connection, batch: OrderDetailsBatch):
+    conditions, params = [], []
+    if batch.from_date is not None:
+        conditions.append("o.order_date >= ?")
+        params.append(batch.from_date)
+    if batch.to_date is not None:
+        conditions.append("o.order_date <= ?")
+        params.append(batch.to_date)
+
+    if batch.order_ids is None:
+        details = fetch_order_details(connection, " AND ".join(conditions) + " ORDER BY o.order_date, o.order_id", params)
+        return list(details.items())
+
+    order_ids = list(dict.fromkeys(batch.order_ids))
+    details = {}
+    for i in range(0, len(order_ids), in_list_size):
+        chunk = order_ids[i:i + in_list_size]
+        where = " AND ".join(conditions + [f"o.order_id IN ({', '.join('?' * len(chunk))})"])
+        details.update(fetch_order_details(connection, where, params + chunk))
+    return [(order_id, details.get(order_id)) for order_id in order_ids]
+
+# Full details of many orders in one call, for rendering an order list: the orders in order_ids
+# (in that order), or every order with an order_date between from_date and to_date (both
+# optional and inclusive, by order date), or the orders in order_ids within those dates. The
+# rows of each order are the ones GET /orderdetailsfull/{order_id} returns; an order without
+# any gets an error instead. With stream=true every order is one line of NDJSON.
+@app.post("/orderdetailsfull:batch")
+async def get_order_details_batch(batch: OrderDetailsBatch, request: Request, stream: bool = False):
+    if batch.order_ids is None and batch.from_date is None and batch.to_date is None:
+        raise HTTPException(status_code=400, detail="Give order_ids, a from_date/to_date range or both")
+    orders = await database.run(get_order_details_batch_blocking, batch, request=request)
+
+    def entries():
+        for order_id, details in orders:
+            if details:
+                yield {"order_id": order_id, "details": details}
+            else:
+                yield {"order_id": order_id, "error": "Order not found"}
+
+    if stream:
+        return StreamingResponse(ndjson_lines(jsonable_encoder(entry) for entry in entries()), media_type="application/x-ndjson")
+    return {"value": list(entries())}
+
 @app.get("/orders") 
-async def get_orders(): 
+async def get_orders(request: Request): 
     query = "SELECT * FROM dbo.Orders$" 
-    df = pd.read_sql(query, connection)
-  # Convert DataFrame to CSV
-    output = StringIO()
-    df.to_csv(output, index=False)
-    output.seek(0)  # Rewind the buffer to the beginning
-  # Create a StreamingResponse with the CSV data
-    response = StreamingResponse(output, media_type="text/csv")
-    response.headers["Content-Disposition"] = "attachment; filename=export_orders.csv"
-    return response
+    return csv_response(request, query, "export_orders.csv")
 
-@app.post("/orders")
-async def create_order(order: Order):
-    global order_counter
+def create_order_blocking(connection, order: Order, atp: bool):
+    cursor = connection.cursor()
     error_messages = {
         "connection_unavailable": "Database connection is not available",
         "cursor_uninitialized": "Database cursor is not initialized",
@@ -947,34 +1306,20 @@ async def create_order(order: Order):
         if cursor is None:
             return {"error": error_messages["cursor_uninitialized"]}
         
-        # Fetch the latest order_id from the database
-        query = "SELECT TOP 1 order_id FROM dbo.Orders$ ORDER BY order_id DESC"
-        cursor.execute(query)
-        result = cursor.fetchone()
-
-        if result:
-            latest_order_id = result[0]  # e.g., "WC1000"
-            # Extract the integer part of the order_id
-            order_counter = int(latest_order_id[1:])  # Ignore the "O" prefix
-        else:
-            order_counter = 0  # Default to 0 if no records are found
-
-        # Increment the counter for the new order_id
-        order_counter += 1
-        order_id = f"O{str(order_counter).zfill(3)}"
-        order.order_id = order_id
-        order.status ="processing"
-
-        # Check if the order_id already exists
-        check_query = "SELECT COUNT(*) FROM dbo.Orders$ WHERE order_id = ?"
-        cursor.execute(check_query, (order.order_id,))
-        count = cursor.fetchone()[0]
-
-        if count > 0:
-            return HTTPException(status_code=400, detail="order_id already exists and cannot be added")
-
         if order.order_date >= order.due_date:
             raise HTTPException(status_code=400, detail="order_date must be before due_date")
+
+        # Available/capable-to-promise check against the projected stock, lead times and workcentre load
+        promise = None
+        if atp:
+            promising.refresh(connection, results.versions(promising.tables))
+            promise = promising.check(order.part_id, order.part_qty, order.order_date, order.due_date)
+            if not promise["promisable"]:
+                raise HTTPException(status_code=409, detail=promise)
+
+        # Reserve the new order_id
+        order.order_id = id_allocator.next_id("Orders$")
+        order.status ="processing"
     
         # Insert data into the database
         insert_query = """
@@ -991,27 +1336,102 @@ async def create_order(order: Order):
             order.status 
         ))
         connection.commit()
+        results.changed("Orders$")
+        promising.add_order(order.order_id, order.part_id, order.part_qty, order.due_date)
+        for plan in net_change_plans.values():
+            plan.order_added(order.order_id, order.part_id, order.part_qty, order.due_date)
 
         response = {
             "message": "Order created successfully",
             "data": order
         }
+        if promise is not None:
+            response["atp"] = promise
         return response
 
-    except pyodbc.IntegrityError:
+    except HTTPException:
+        raise
+    except IntegrityError:
         return {"error": error_messages["integrity_error"]}
-    except pyodbc.DatabaseError as e:
+    except DatabaseError as e:
         return {"error": f"{error_messages['database_error']}: {str(e)}"}
     except Exception as e:
         return {"error": f"{error_messages['unexpected_error']}: {str(e)}"}
 
-@app.delete("/orders/{order_id}")
-async def delete_order(order_id: str):
+# With atp=true the order is only created when it can be met by its due date, otherwise the
+# answer is a 409 with the details of the check
+@app.post("/orders")
+async def create_order(order: Order, request: Request, atp: bool = False):
+    return await database.run(create_order_blocking, order, atp, request=request)
+
+def insert_rows(connection, query, rows):
+    # Bulk insert in chunks of bulk_chunk_size, inside the caller's transaction
+    cursor = connection.cursor()
+    for i in range(0, len(rows), bulk_chunk_size):
+        backend.executemany(cursor, query, rows[i:i + bulk_chunk_size])
+
+def create_orders_bulk_blocking(connection, body: bytes, content_type: str, partial: bool):
+    try:
+        frame = bulk.read_rows(body, content_type)
+        cursor = connection.cursor()
+        cursor.execute("SELECT part_id FROM dbo.Part_Master_Records$")
+        valid, errors = bulk.validate_orders(frame, [row[0] for row in cursor.fetchall()], datetime.now())
+    except bulk.BulkFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Rows are numbered from 1 in the order they were sent (the header line of a CSV not counted)
+    rejected = [{"row": position + 1, "errors": messages} for position, messages in sorted(errors.items())]
+    if rejected and not partial:
+        raise HTTPException(status_code=422, detail={"message": f"{len(rejected)} of {len(frame)} orders are invalid, none were created", "errors": rejected})
+
+    order_ids = id_allocator.next_ids("Orders$", len(valid)) if len(valid) else []
+    part_ids = valid["part_id"].tolist()
+    part_qtys = valid["part_qty"].astype("int64").tolist()
+    due_dates = bulk.datetimes(valid["due_date"])
+    rows = list(zip(
+        order_ids,
+        part_ids,
+        part_qtys,
+        bulk.datetimes(valid["order_date"]),
+        due_dates,
+        bulk.datetimes(valid["order_last_updated"]),
+        ["processing"] * len(valid),
+    ))
+    try:
+        insert_rows(connection, "INSERT INTO dbo.Orders$ (order_id, part_id, part_qty, order_date, due_date, order_last_updated, status) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    if rows:
+        results.changed("Orders$")
+        for order in zip(order_ids, part_ids, part_qtys, due_dates):
+            promising.add_order(*order)
+            for plan in net_change_plans.values():
+                plan.order_added(*order)
+    return {
+        "message": f"{len(rows)} orders created",
+        "created": [{"row": position + 1, "order_id": order_id} for position, order_id in zip(valid.index.tolist(), order_ids)],
+        "errors": rejected,
+    }
+
+# Many orders in one transaction: a JSON array of orders, or the same fields as NDJSON
+# (application/x-ndjson) or CSV with a header line (text/csv). Every row is checked before
+# anything is written (part_id exists, part_qty is a whole number, order_date before due_date);
+# when any row fails none are created and the answer is a 422 listing the errors per row, with
+# partial=true the valid rows are created and the invalid ones reported. Dates are ISO 8601.
+@app.post("/orders:bulk")
+async def create_orders_bulk(request: Request, partial: bool = False):
+    body = await request.body()
+    return await database.run(create_orders_bulk_blocking, body, request.headers.get("content-type"), partial, request=request, timeout=bulk_timeout)
+
+def delete_order_blocking(connection, order_id: str):
+    cursor = connection.cursor()
     error_messages = {
         "connection_unavailable": "Database connection is not available",
         "cursor_uninitialized": "Database cursor is not initialized",
-        "referenced_entry": "Cannot delete BOM entry because it is referenced by Routings$ table.",
-        "bom_not_found": "BOM not found",
+        "order_not_found": "Order not found",
         "integrity_error": "Database integrity error: Check constraints and foreign keys.",
         "database_error": "Database error occurred.",
         "unexpected_error": "An unexpected error occurred."
@@ -1029,22 +1449,12 @@ async def delete_order(order_id: str):
         # Check if the order_id exists in dbo.Orders$
         check_order_query = "SELECT part_id FROM dbo.Orders$ WHERE order_id = ?"
         cursor.execute(check_order_query, (order_id,))
-        order_row = cursor.fetchone()[0]
-        
-        if not order_row:
-            raise HTTPException(status_code=404, detail=error_messages["order_not_found"])
-        
-        part_id = order_row[0]
+        row = cursor.fetchone()
 
-        # Check if the part_id exists in dbo.Part_Master_Records$
-        check_part_query = "SELECT COUNT(*) FROM dbo.Part_Master_Records$ WHERE part_id = ?"
-        cursor.execute(check_part_query, (part_id,))
-        part_count = cursor.fetchone()[0]
-
-        if part_count > 0:
-            raise HTTPException(status_code=409, detail=error_messages["referenced_entry"])
+        if row is None:
+            raise HTTPException(status_code=404, detail=error_messages["order_not_found"])
 
-        # Delete BOM entry
+        # Delete order entry
         delete_query = "DELETE FROM dbo.Orders$ WHERE order_id = ?"
         cursor.execute(delete_query, (order_id,))
         
@@ -1052,6 +1462,10 @@ async def delete_order(order_id: str):
             raise HTTPException(status_code=404, detail=error_messages["order_not_found"])
         
         connection.commit()
+        results.changed("Orders$")
+        promising.remove_order(order_id)
+        for plan in net_change_plans.values():
+            plan.order_removed(order_id)
 
         response = {
             "message": "Order successfully deleted",
@@ -1059,30 +1473,71 @@ async def delete_order(order_id: str):
         }
         return response
 
-    except pyodbc.IntegrityError:
+    except HTTPException:
+        raise
+    except IntegrityError:
         raise HTTPException(status_code=400, detail=error_messages["integrity_error"])
-    except pyodbc.DatabaseError:
+    except DatabaseError:
         raise HTTPException(status_code=500, detail=error_messages["database_error"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{error_messages['unexpected_error']}: {str(e)}")
- 
+
+@app.delete("/orders/{order_id}")
+async def delete_order(order_id: str, request: Request):
+    return await database.run(delete_order_blocking, order_id, request=request)
+
+def get_workcentre_load_blocking(connection, bucket: str):
+    def compute():
+        bom_graph.refresh(connection)
+        lines, _ = bom_graph.active_structure()
+        return capacity.workcentre_load(
+            mrp.load_orders(connection),
+            mrp.bom_frame(lines),
+            capacity.load_routings(connection),
+            capacity.load_workcentres(connection),
+            bucket,
+            workcentre_hours_per_day,
+            workcentre_days_per_week,
+        )
+
+    return results.get(("workcentre_load", bucket), ["Orders$", "BOM$", "Routings$", "Workcentre$"], compute)
+
+# Hours the open orders need per workcentre per day or week, against the workcentre's capacity
+@app.get("/workcentre/load")
+async def get_workcentre_load(request: Request, bucket: str = Query("day", pattern="^(day|week)$"), workcentre_id: Optional[str] = None):
+    load = await database.run(get_workcentre_load_blocking, bucket, request=request)
+    if workcentre_id is not None:
+        load = load[load["workcentre_id"].str.upper() == workcentre_id.upper()]
+    return frame_response({"bucket": bucket}, load, ["bucket"])
+
+def get_schedule_blocking(connection, rule: str, start: Optional[datetime]):
+    def compute():
+        bom_graph.refresh(connection)
+        orders, routings, workcentres = scheduler.load_inputs(connection)
+        lines, _ = bom_graph.active_structure()
+        jobs = scheduler.build_jobs(orders, lines, routings, workcentres, scheduling_calendar, start)
+        gantt = scheduler.schedule(jobs, rule)
+        return json.dumps(scheduler.report(jobs, gantt, scheduling_calendar))
+
+    return results.get(("schedule", rule, start), ["Orders$", "BOM$", "Routings$", "Workcentre$"], compute)
+
+# Finite-capacity production schedule of the open orders: start and finish of every order and
+# the operations of every workcentre in time order. rule is the dispatching rule: edd (earliest
+# due date), spt (shortest processing time) or cr (critical ratio). No operation starts before
+# its order_date or before start.
+@app.get("/schedule")
+async def get_schedule(request: Request, rule: str = Query("edd", pattern="^(edd|spt|cr)$"), start: Optional[datetime] = None):
+    body = await database.run(get_schedule_blocking, rule, local_time(start), request=request)
+    return Response(body, media_type="application/json")
+
 @app.get("/workcentre") 
-async def get_work_centre(): 
+async def get_work_centre(request: Request): 
     query = "SELECT * FROM dbo.Workcentre$"
-    df = pd.read_sql(query, connection)
-  # Convert DataFrame to CSV
-    output = StringIO()
-    df.to_csv(output, index=False)
-    output.seek(0)  # Rewind the buffer to the beginning
-  # Create a StreamingResponse with the CSV data
-    response = StreamingResponse(output, media_type="text/csv")
-    response.headers["Content-Disposition"] = "attachment; filename=export.csv"
-    return response
+    return csv_response(request, query, "export.csv")
 
-@app.post("/workcentre")
-async def create_workcentre(workcentre: WorkCentre):
+def create_workcentre_blocking(connection, workcentre: WorkCentre):
     
-    global workcentre_counter
+    cursor = connection.cursor()
     error_messages = {
         "connection_unavailable": "Database connection is not available",
         "cursor_uninitialized": "Database cursor is not initialized",
@@ -1101,32 +1556,10 @@ async def create_workcentre(workcentre: WorkCentre):
         if cursor is None:
             return {"error": error_messages["cursor_uninitialized"]}
         
-        query = "SELECT TOP 1 workcentre_id FROM dbo.Workcentre$ ORDER BY workcentre_id DESC"
-        cursor.execute(query)
-        result = cursor.fetchone()
-
-        if result:
-            latest_workcentre_id = result[0]  # e.g., "WC005"
-            # Extract the integer part of the workcentre_id
-            workcentre_counter = int(latest_workcentre_id[2:])  # Ignore the "WC" prefix
-        else:
-            workcentre_counter = 0  # Default to 0 if no records are found
-
-        # Increment the counter for the new workcentre_id
-        workcentre_counter += 1
-        workcentre_id = f"WC{str(workcentre_counter).zfill(3)}"
-        workcentre.workcentre_id = workcentre_id
+        # Reserve the new workcentre_id
+        workcentre.workcentre_id = id_allocator.next_id("Workcentre$")
         workcentre.status = "active"
     
-        check_query = "SELECT COUNT(*) FROM dbo.Workcentre$ WHERE workcentre_id = ?"
-        cursor.execute(check_query, (workcentre.workcentre_id,))
-        count = cursor.fetchone()[0]
-
-        if count > 0:
-        # cursor.close()
-        # connection.close()
-            raise HTTPException(status_code=400, detail="workcentre_id already exists and cannot be added")
-    
     # Insert data into the database
         insert_query = """
         INSERT INTO dbo.Workcentre$(workcentre_id, workcentre_name, workcentre_description, capacity, capacity_unit, cost_rate_h,workcentre_last_updated, status)
@@ -1144,6 +1577,11 @@ async def create_workcentre(workcentre: WorkCentre):
         ))
     
         connection.commit()
+        as_of_index.add("Workcentre$", (
+            workcentre.workcentre_id, workcentre.workcentre_name, workcentre.workcentre_description, workcentre.capacity,
+            workcentre.capacity_unit, workcentre.cost_rate_h, workcentre.workcentre_last_updated, workcentre.status,
+        ))
+        results.changed("Workcentre$")
 
         response = {
             "message": "WorkCentre created successfully",
@@ -1151,60 +1589,64 @@ async def create_workcentre(workcentre: WorkCentre):
         }
         return response
 
-    except pyodbc.IntegrityError:
+    except IntegrityError:
         return {"error": error_messages["integrity_error","id":workcentre.workcentre_id]}
-    except pyodbc.DatabaseError:
+    except DatabaseError:
         return {"error": error_messages["database_error"]}
     except Exception as e:
         return {"error": f"{error_messages['unexpected_error']}: {str(e)}"}
 
-@app.put("/workcentre/{workcentre_id}")
-async def update_workcentre(workcentre_id: str, workcentre: WorkCentre):
+@app.post("/workcentre")
+async def create_workcentre(workcentre: WorkCentre, request: Request):
+    return await database.run(create_workcentre_blocking, workcentre, request=request)
 
-    last_id_query = "SELECT TOP 1 workcentre_id FROM dbo.Workcentre$ ORDER BY CAST(SUBSTRING(workcentre_id, 3, LEN(workcentre_id)-2) AS INT) DESC"
-    cursor.execute(last_id_query)
-    last_id_row = cursor.fetchone()
+def update_workcentre_blocking(connection, workcentre_id: str, workcentre: WorkCentre):
+    cursor = connection.cursor()
 
-    if not last_id_row:
-        # If no existing workcentres, start with a base ID, e.g., "WC001"
-        new_workcentre_id = "WC001"
-    else:
-        last_id = last_id_row[0]
-        # Assuming the format "WC###", extract the numeric part, increment, and reformat
-        prefix, number = last_id[:2], int(last_id[2:])
-        new_workcentre_id = f"{prefix}{str(number + 1).zfill(3)}"
+    cursor.execute("SELECT workcentre_id FROM dbo.Workcentre$ WHERE workcentre_id = ?", (workcentre_id,))
+    if cursor.fetchone() is None:
+        raise HTTPException(status_code=404, detail=f"workcentre_id {workcentre_id} not found")
 
-        workcentre.workcentre_id = new_workcentre_id
+    # Reserve the new workcentre_id once the workcentre is found and before the first write, see
+    # update_bom_blocking
+    new_workcentre_id = id_allocator.next_id("Workcentre$")
 
-    update_status_query = """
-    UPDATE dbo.Workcentre$
-    SET status = 'inactive'
-    WHERE workcentre_id = ? 
-    """
+    try:
+        update_status_query = """
+        UPDATE dbo.Workcentre$
+        SET status = 'inactive'
+        WHERE workcentre_id = ? 
+        """
 
-    cursor.execute(update_status_query, (workcentre_id,))
+        cursor.execute(update_status_query, (workcentre_id,))
 
-    workcentre.workcentre_id = new_workcentre_id
-    workcentre.status = "active"
+        workcentre.workcentre_id = new_workcentre_id
+        workcentre.status = "active"
 
-    insert_query = """
-    INSERT INTO dbo.Workcentre$ (workcentre_id, workcentre_name, workcentre_description, capacity, capacity_unit, cost_rate_h, workcentre_last_updated, status)
-    VALUES (?, ?, ?, ?, ?, ?, ?,?)
-    """
-    cursor.execute(insert_query, (
-        workcentre.workcentre_id,
-        workcentre.workcentre_name,
-        workcentre.workcentre_description,
-        workcentre.capacity,
-        workcentre.capacity_unit,
-        workcentre.cost_rate_h,
-        workcentre.workcentre_last_updated,
-        workcentre.status
+        insert_query = """
+        INSERT INTO dbo.Workcentre$ (workcentre_id, workcentre_name, workcentre_description, capacity, capacity_unit, cost_rate_h, workcentre_last_updated, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?,?)
+        """
+        cursor.execute(insert_query, (
+            workcentre.workcentre_id,
+            workcentre.workcentre_name,
+            workcentre.workcentre_description,
+            workcentre.capacity,
+            workcentre.capacity_unit,
+            workcentre.cost_rate_h,
+            workcentre.workcentre_last_updated,
+            workcentre.status
+        ))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    as_of_index.set_status("Workcentre$", "inactive", workcentre_id)
+    as_of_index.add("Workcentre$", (
+        workcentre.workcentre_id, workcentre.workcentre_name, workcentre.workcentre_description, workcentre.capacity,
+        workcentre.capacity_unit, workcentre.cost_rate_h, workcentre.workcentre_last_updated, workcentre.status,
     ))
-    if cursor.rowcount == 0:
-        raise HTTPException(status_code=404, detail=f"workcentre_id {workcentre_id} not found")
-    
-    connection.commit()
+    results.changed("Workcentre$")
     
     response = {
         "message": "Workcentre updated successfully with new workcentre_id",
@@ -1221,8 +1663,12 @@ async def update_workcentre(workcentre_id: str, workcentre: WorkCentre):
     }
     return response
 
-@app.delete("/workcentre/{workcentre_id}")
-async def delete_workcentre(workcentre_id: str):
+@app.put("/workcentre/{workcentre_id}")
+async def update_workcentre(workcentre_id: str, workcentre: WorkCentre, request: Request):
+    return await database.run(update_workcentre_blocking, workcentre_id, workcentre, request=request)
+
+def delete_workcentre_blocking(connection, workcentre_id: str):
+    cursor = connection.cursor()
     error_messages = {
         "connection_unavailable": "Database connection is not available",
         "cursor_uninitialized": "Database cursor is not initialized",
@@ -1259,6 +1705,8 @@ async def delete_workcentre(workcentre_id: str):
         
         # Commit the transaction
         connection.commit()
+        as_of_index.remove("Workcentre$", workcentre_id)
+        results.changed("Workcentre$")
 
         # If no exceptions, return success response
         response = {
@@ -1267,9 +1715,247 @@ async def delete_workcentre(workcentre_id: str):
         }
         return response
 
-    except pyodbc.IntegrityError:
+    except IntegrityError:
         raise HTTPException(status_code=400, detail=error_messages["integrity_error"])
-    except pyodbc.DatabaseError:
+    except DatabaseError:
         raise HTTPException(status_code=500, detail=error_messages["database_error"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{error_messages['unexpected_error']}: {str(e)}")
+
+@app.delete("/workcentre/{workcentre_id}")
+async def delete_workcentre(workcentre_id: str, request: Request):
+    return await database.run(delete_workcentre_blocking, workcentre_id, request=request)
+
+# Tables available through /export/{table}: the database table and the model describing its columns
+export_tables = {
+    "BOM": ("BOM$", BOM),
+    "routings": ("Routings$", Routing),
+    "partmasterrecords": ("Part_Master_Records$", Part),
+    "orders": ("Orders$", Order),
+    "workcentre": ("Workcentre$", WorkCentre),
+}
+
+@app.get("/export/{table}")
+async def export_table(table: str, format: str = "arrow"):
+    if not columnar.available:
+        raise HTTPException(status_code=501, detail="Columnar exports need pyarrow to be installed")
+    if table not in export_tables:
+        raise HTTPException(status_code=404, detail=f"Unknown table {table}, expected one of {', '.join(export_tables)}")
+    if format not in columnar.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {format}, expected one of {', '.join(columnar.FORMATS)}")
+
+    table_name, model = export_tables[table]
+    columns = [column for column, _ in TABLES[table_name].columns]
+    schema = columnar.arrow_schema(model, columns)
+    query = f"SELECT {', '.join(columns)} FROM dbo.{table_name}"
+
+    output = columnar.stream_columnar(pool, backend, query, schema, format, chunk_size=export_chunk_size, timeout=database.timeout)
+    response = StreamingResponse(output, media_type=columnar.FORMATS[format])
+    extension = "arrows" if format == "arrow" else "parquet"
+    response.headers["Content-Disposition"] = f"attachment; filename=export_{table}.{extension}"
+    return response
+
+def run_mrp_blocking(connection, bucket: str, mode: str, progress=None):
+    if mode == "net_change":
+        state = net_change_plans[bucket]
+        state.refresh(connection)
+        return len(state.orders), state.frame()
+
+    bom_graph.refresh(connection)
+    orders = mrp.load_orders(connection)
+    parts = mrp.load_parts(connection)
+    lines, llc = bom_graph.active_structure()
+    return len(orders), mrp.plan(orders, parts, mrp.bom_frame(lines), llc, bucket, progress)
+
+# Gross-to-net requirements of every open order, exploded through the active BOM. mode=regenerative
+# plans from scratch; mode=net_change returns the persistent plan after replanning only the parts
+# and buckets that writes have touched since the last call.
+@app.post("/mrp/run")
+async def run_mrp(
+    request: Request,
+    bucket: str = Query("day", pattern="^(day|week)$"),
+    mode: str = Query("regenerative", pattern="^(regenerative|net_change)$"),
+    planned_only: bool = False,
+):
+    orders, plan = await database.run(run_mrp_blocking, bucket, mode, request=request)
+    return mrp_response(bucket, mode, orders, plan, planned_only)
+
+def mrp_response(bucket: str, mode: str, orders: int, plan, planned_only: bool):
+    if planned_only:
+        plan = plan[plan["net_qty"] > 0]
+    summary = {"bucket": bucket, "mode": mode, "orders": orders, "planned_orders": int((plan["net_qty"] > 0).sum())}
+    return frame_response(summary, plan, ["due_date", "release_date"])
+
+def run_scenarios_blocking(connection, request: ScenarioRequest):
+    snapshot = results.get(
+        "scenario_snapshot",
+        ["Orders$", "Part_Master_Records$", "BOM$", "Routings$", "Workcentre$"],
+        lambda: scenarios.load_snapshot(connection, bom_graph),
+    )
+    settings = {
+        "bucket": request.bucket,
+        "rule": request.rule,
+        "as_of": local_time(request.as_of),
+        "hours_per_day": workcentre_hours_per_day,
+        "days_per_week": workcentre_days_per_week,
+        "day_start": scheduling_calendar.day_start,
+    }
+    # The baseline is evaluated alongside, as the scenario without changes
+    overlays = [{}] + [scenario.model_dump() for scenario in request.scenarios]
+    baseline, *evaluated = scenario_pool.evaluate(snapshot, overlays, settings)
+    return {
+        "snapshot_taken_at": snapshot.taken_at.isoformat(),
+        "bucket": request.bucket,
+        "rule": request.rule,
+        "baseline": baseline,
+        "scenarios": [
+            {"name": scenario.name, "kpis": kpis, "delta": scenarios.delta(kpis, baseline)}
+            for scenario, kpis in zip(request.scenarios, evaluated)
+        ],
+    }
+
+# What-if comparison of planning scenarios against the current data, which is never changed.
+# Every scenario overlays a demand factor (optionally for some parts only), lead times, stock
+# levels and workcentre availability (0 = down, 0.5 = half the hours) and is evaluated in
+# parallel into material (MRP), capacity (workcentre load) and schedule KPIs plus their change
+# against the baseline.
+@app.post("/scenarios")
+async def run_scenarios(request: Request, scenario_request: ScenarioRequest):
+    if scenario_request.bucket not in mrp.BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Unknown bucket {scenario_request.bucket}, expected one of {', '.join(mrp.BUCKETS)}")
+    if scenario_request.rule not in scheduler.RULES:
+        raise HTTPException(status_code=400, detail=f"Unknown rule {scenario_request.rule}, expected one of {', '.join(scheduler.RULES)}")
+    invalid = [scenario.name for scenario in scenario_request.scenarios if any(fraction < 0 for fraction in scenario.workcentre_availability.values())]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Workcentre availability cannot be negative: {', '.join(invalid)}")
+    return await database.run(run_scenarios_blocking, scenario_request, request=request)
+
+def mrp_job(connection, job: jobs.Job, bucket: str, mode: str, planned_only: bool):
+    job.progress(0, "Planning")
+    orders, plan = run_mrp_blocking(connection, bucket, mode, lambda fraction: job.progress(0.9 * fraction))
+    job.progress(0.9, "Encoding the plan")
+    return jobs.JobOutput("application/json", mrp_response(bucket, mode, orders, plan, planned_only).body)
+
+def schedule_job(connection, job: jobs.Job, rule: str, start: Optional[str]):
+    job.progress(0, "Scheduling")
+    body = get_schedule_blocking(connection, rule, datetime.fromisoformat(start) if start else None)
+    return jobs.JobOutput("application/json", body.encode("utf-8"))
+
+def cost_rollup_job(connection, job: jobs.Job):
+    job.progress(0, "Rolling up costs")
+    costs = get_rollup_blocking(connection, cost_rollup, None)
+    return jobs.JobOutput("application/json", json.dumps({"value": cost_rollup_rows(costs)}).encode("utf-8"))
+
+def lead_time_job(connection, job: jobs.Job):
+    job.progress(0, "Rolling up lead times")
+    lead_times = get_rollup_blocking(connection, lead_time_rollup, None)
+    return jobs.JobOutput("application/json", json.dumps({"value": lead_time_rows(lead_times)}).encode("utf-8"))
+
+def scenarios_job(connection, job: jobs.Job, **params):
+    job.progress(0, "Evaluating scenarios")
+    result = run_scenarios_blocking(connection, ScenarioRequest(**params))
+    return jobs.JobOutput("application/json", json.dumps(result).encode("utf-8"))
+
+# Writes a table to a CSV file chunk by chunk, progress counts the rows written
+def export_job(connection, job: jobs.Job, table: str):
+    table_name, _ = export_tables[table]
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM dbo.{table_name}")
+    total = cursor.fetchone()[0]
+    cursor.execute(f"SELECT * FROM dbo.{table_name}")
+
+    path = job.output_path(".csv")
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow([column[0] for column in cursor.description])
+        written = 0
+        while True:
+            rows = cursor.fetchmany(export_chunk_size)
+            if not rows:
+                break
+            writer.writerows(rows)
+            written += len(rows)
+            job.progress(written / total if total else 1, f"{written} of {total} rows written")
+    return jobs.JobOutput("text/csv", path=path, filename=f"export_{table}.csv")
+
+job_queue.register("mrp", ["Orders$", "BOM$", "Part_Master_Records$"], mrp_job)
+job_queue.register("schedule", ["Orders$", "BOM$", "Routings$", "Workcentre$"], schedule_job)
+job_queue.register("costs", cost_rollup.tables, cost_rollup_job)
+job_queue.register("leadtimes", lead_time_rollup.tables, lead_time_job)
+job_queue.register("scenarios", ["Orders$", "Part_Master_Records$", "BOM$", "Routings$", "Workcentre$"], scenarios_job)
+job_queue.register("export", list(TABLES), export_job)
+
+def submit_job(kind: str, params: dict):
+    try:
+        job, reused = job_queue.submit(kind, params)
+    except jobs.QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {**job.info(), "reused": reused}
+
+# The heavy computations as background jobs. Each POST answers at once with the job, whose
+# status and progress are at GET /jobs/{job_id} and whose result, once it succeeded, is at
+# GET /jobs/{job_id}/result. Submitting a job that is identical to a queued, running or recent
+# one (same parameters, no writes to the tables it reads since) returns that job instead.
+@app.post("/jobs/mrp", status_code=202)
+async def submit_mrp_job(
+    bucket: str = Query("day", pattern="^(day|week)$"),
+    mode: str = Query("regenerative", pattern="^(regenerative|net_change)$"),
+    planned_only: bool = False,
+):
+    return submit_job("mrp", {"bucket": bucket, "mode": mode, "planned_only": planned_only})
+
+@app.post("/jobs/schedule", status_code=202)
+async def submit_schedule_job(rule: str = Query("edd", pattern="^(edd|spt|cr)$"), start: Optional[datetime] = None):
+    start = local_time(start)
+    return submit_job("schedule", {"rule": rule, "start": start and start.isoformat()})
+
+@app.post("/jobs/costs", status_code=202)
+async def submit_cost_rollup_job():
+    return submit_job("costs", {})
+
+@app.post("/jobs/leadtimes", status_code=202)
+async def submit_lead_time_job():
+    return submit_job("leadtimes", {})
+
+@app.post("/jobs/scenarios", status_code=202)
+async def submit_scenarios_job(scenario_request: ScenarioRequest):
+    if scenario_request.bucket not in mrp.BUCKETS or scenario_request.rule not in scheduler.RULES:
+        raise HTTPException(status_code=400, detail="Unknown bucket or rule")
+    return submit_job("scenarios", scenario_request.model_dump(mode="json"))
+
+@app.post("/jobs/export/{table}", status_code=202)
+async def submit_export_job(table: str):
+    if table not in export_tables:
+        raise HTTPException(status_code=404, detail=f"Unknown table {table}, expected one of {', '.join(export_tables)}")
+    return submit_job("export", {"table": table})
+
+@app.get("/jobs")
+async def get_jobs():
+    return {"value": [job.info() for job in job_queue.list()]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.info()
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != jobs.SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}" + (f": {job.error}" if job.error else ""))
+    output = job.output
+    if output.path is not None:
+        return FileResponse(output.path, media_type=output.media_type, filename=output.filename)
+    return Response(output.body, media_type=output.media_type)
+
+# Cancels a queued or running job
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.info()
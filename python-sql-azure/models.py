@@ -0,0 +1,111 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+# Request and row models of the API. The five table models also define the types the seed
+# loader coerces the CSV rows to (see TABLE_MODELS).
+
+class WorkCentre(BaseModel):
+    workcentre_name: str
+    capacity_unit: str
+    cost_rate_h: float
+    workcentre_description: str
+    capacity: int
+    workcentre_last_updated: datetime
+    workcentre_id: str = None
+    status: str = None
+    
+class Order(BaseModel):
+    order_id: str = None
+    part_id: str
+    part_qty: int
+    order_date: datetime
+    due_date: datetime
+    order_last_updated: datetime
+    status: str = None
+
+class BOM(BaseModel):
+    BOM_id: Optional[str] = None
+    part_id: str
+    child_id: str
+    child_qty: float
+    child_leadtime: float
+    BOM_last_updated: datetime
+    status: str = None
+    process_description: Optional[str] = None
+    setup_time: Optional[int] = None
+    runtime: Optional[float] = None
+    routing_id: Optional[str] = None 
+    operations_sequence: Optional[int] = None 
+    workcentre_id: Optional[str] = None 
+    
+class Routing(BaseModel):
+    routing_id: str = None 
+    BOM_id: str
+    operations_sequence: int
+    workcentre_id: str
+    process_description: Optional[str] = None
+    setup_time: Optional[int] = None
+    runtime: Optional[float] = None
+    routings_last_update: datetime
+    status: str = None 
+
+class Part(BaseModel):
+    part_id: str = None
+    part_name: str
+    inventory: int
+    POM: str
+    UOM: str
+    part_description: str
+    unit_cost: float
+    lead_time: int
+    part_last_updated: datetime
+    status: str = None
+
+class Scenario(BaseModel):
+    name: str
+    demand_factor: float = 1.0
+    demand_part_ids: Optional[List[str]] = None
+    lead_times: Dict[str, float] = {}
+    inventory: Dict[str, float] = {}
+    workcentre_availability: Dict[str, float] = {}
+
+class BomImportRouting(BaseModel):
+    operations_sequence: int
+    workcentre_id: str
+    process_description: Optional[str] = None
+    setup_time: Optional[int] = None
+    runtime: Optional[float] = None
+
+class BomImportLine(BaseModel):
+    part_id: str
+    child_id: str
+    child_qty: float
+    child_leadtime: float
+    routings: List[BomImportRouting] = []
+
+class BomImport(BaseModel):
+    lines: List[BomImportLine]
+    replace: bool = False
+
+class OrderDetailsBatch(BaseModel):
+    order_ids: Optional[List[str]] = None
+    from_date: Optional[datetime] = None
+    to_date: Optional[datetime] = None
+
+class ScenarioRequest(BaseModel):
+    scenarios: List[Scenario]
+    bucket: str = "week"
+    rule: str = "edd"
+    as_of: Optional[datetime] = None
+
+
+# Model of the rows of each table
+TABLE_MODELS = {
+    "BOM$": BOM,
+    "Routings$": Routing,
+    "Part_Master_Records$": Part,
+    "Orders$": Order,
+    "Workcentre$": WorkCentre,
+}
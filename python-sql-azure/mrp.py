@@ -0,0 +1,372 @@
+import heapq
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Gross-to-net MRP over the open orders, the active BOM and the part master. Every step works on
+# whole columns at once; the only Python loop is over the low-level codes (the depth of the
+# product structure), never over orders or BOM rows.
+
+BUCKETS = ("day", "week")
+
+ORDER_COLUMNS = ["order_id", "part_id", "part_qty", "due_date"]
+PART_COLUMNS = ["part_id", "inventory", "lead_time"]
+BOM_COLUMNS = ["BOM_id", "part_id", "child_id", "child_qty", "child_leadtime"]
+PLAN_COLUMNS = ["llc", "part_id", "due_date", "gross_qty", "projected_on_hand", "net_qty", "release_date"]
+
+
+def fetch_frame(cursor, columns):
+    # pyodbc rows are not tuples, pandas wants plain sequences
+    return pd.DataFrame.from_records([tuple(row) for row in cursor.fetchall()], columns=columns)
+
+
+def load_orders(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT order_id, part_id, part_qty, due_date FROM dbo.Orders$ WHERE status = 'processing'")
+    return fetch_frame(cursor, ORDER_COLUMNS)
+
+
+def load_parts(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT part_id, inventory, lead_time FROM dbo.Part_Master_Records$")
+    return fetch_frame(cursor, PART_COLUMNS)
+
+
+def bom_frame(lines):
+    # Active BomLine rows from the BOM graph index as a frame
+    return pd.DataFrame.from_records([line[:5] for line in lines], columns=BOM_COLUMNS)
+
+
+def bucket_start(dates, bucket="day"):
+    # Start of the time bucket every date (a datetime64 series) falls in, weeks start on Monday
+    dates = dates.dt.normalize()
+    if bucket == "week":
+        return dates - pd.to_timedelta(dates.dt.weekday, unit="D")
+    return dates
+
+
+def plan(orders, parts, bom, llc, bucket="day", progress=None):
+    # Lot-for-lot net requirements per part and bucket, planned level by level in low-level-code
+    # order so a part's gross requirements are complete before it is netted. Parts that are
+    # not in the part master have no stock and no lead time.
+    #   orders: ORDER_COLUMNS, the independent demand
+    #   parts:  PART_COLUMNS
+    #   bom:    BOM_COLUMNS, active rows only
+    #   llc:    {part_id: low-level code}, edges that close a cycle are dropped
+    #   progress: optional callable, gets the fraction of the levels planned so far
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket {bucket!r}, expected one of {BUCKETS}")
+
+    parts = parts.drop_duplicates("part_id").set_index("part_id")
+    inventory = parts["inventory"].astype(float).fillna(0).clip(lower=0)
+    lead_time = parts["lead_time"].astype(float).fillna(0)
+    levels = pd.Series(llc, dtype="int64")
+
+    def level_of(part_ids):
+        return part_ids.map(levels).fillna(0).astype("int64")
+
+    # The lead time on a BOM row overrides the child's own lead time from the part master
+    bom = bom.assign(
+        parent_llc=level_of(bom["part_id"]),
+        child_llc=level_of(bom["child_id"]),
+        line_lead_time=bom["child_leadtime"].astype(float).fillna(bom["child_id"].map(lead_time)).fillna(0),
+        child_qty=bom["child_qty"].astype(float).fillna(0),
+    )
+    bom = bom[bom["child_llc"] > bom["parent_llc"]]
+
+    # Gross requirements waiting to be netted: part, date needed, quantity and the lead time
+    # to offset the part's planned order by
+    orders = orders.dropna(subset=["part_id", "part_qty", "due_date"])
+    pending = pd.DataFrame({
+        "part_id": orders["part_id"],
+        "need_date": pd.to_datetime(orders["due_date"]),
+        "qty": orders["part_qty"].astype(float),
+        "lead_time": orders["part_id"].map(lead_time).fillna(0),
+        "llc": level_of(orders["part_id"]),
+    })
+
+    planned = []
+    level_count = int(levels.max()) + 1 if len(levels) else 1
+    for level in range(level_count):
+        if progress is not None:
+            progress(level / level_count)
+        mask = (pending["llc"] == level).to_numpy()
+        current, pending = pending[mask], pending[~mask]
+        if current.empty:
+            continue
+
+        buckets = (
+            current.assign(due_date=bucket_start(current["need_date"], bucket))
+            .groupby(["part_id", "due_date"], sort=True)
+            .agg(gross_qty=("qty", "sum"), lead_time=("lead_time", "max"))
+            .reset_index()
+        )
+
+        # Net the running gross requirement of each part against its stock
+        on_hand = buckets["part_id"].map(inventory).fillna(0).to_numpy()
+        cumulative = buckets.groupby("part_id")["gross_qty"].cumsum().to_numpy()
+        net_cumulative = pd.Series(np.maximum(cumulative - on_hand, 0), index=buckets.index)
+        previous = net_cumulative.groupby(buckets["part_id"]).shift(fill_value=0)
+        buckets["projected_on_hand"] = np.maximum(on_hand - cumulative, 0)
+        buckets["net_qty"] = net_cumulative - previous
+        buckets["release_date"] = buckets["due_date"] - pd.to_timedelta(buckets["lead_time"], unit="D")
+        buckets["llc"] = level
+        planned.append(buckets[PLAN_COLUMNS])
+
+        # Planned orders become dependent demand of the children when they are released
+        released = buckets.loc[buckets["net_qty"] > 0, ["part_id", "net_qty", "release_date"]]
+        lines = released.merge(bom, on="part_id")
+        pending = pd.concat([pending, pd.DataFrame({
+            "part_id": lines["child_id"],
+            "need_date": lines["release_date"],
+            "qty": lines["net_qty"] * lines["child_qty"],
+            "lead_time": lines["line_lead_time"],
+            "llc": lines["child_llc"],
+        })], ignore_index=True)
+
+    if not planned:
+        return pd.DataFrame(columns=PLAN_COLUMNS).astype({"due_date": "datetime64[ns]", "release_date": "datetime64[ns]"})
+    return pd.concat(planned, ignore_index=True)
+
+
+def bucket_of(moment, bucket="day"):
+    # bucket_start for a single datetime
+    day = datetime(moment.year, moment.month, moment.day)
+    return day - timedelta(days=day.weekday()) if bucket == "week" else day
+
+
+class NetChangePlan:
+    # Persistent planning state for net-change MRP, the same lot-for-lot logic as plan() kept per
+    # part. The gross requirements of a part are stored per source (its open orders, or the BOM
+    # row through which a parent's planned orders reach it), so a change only touches the sources
+    # it affects. Writes mark parts dirty from the earliest bucket they change; replan() renets
+    # the dirty parts in low-level-code order from that bucket onward, and only the planned
+    # orders that actually changed are passed down to the children, marking them dirty from the
+    # earliest bucket those fall in. A full regeneration happens on first use and every
+    # ttl seconds, to pick up changes made by other processes.
+
+    def __init__(self, bom_graph, bucket="day", ttl=300):
+        self.bom_graph = bom_graph
+        self.bucket = bucket
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._generated_at = None
+        self._structure_stale = False
+        self.inventory = {}
+        self.lead_times = {}
+        self.lines = {}        # BOM_id -> (part_id, child_id, child_qty, child_leadtime), active and acyclic rows
+        self.children = {}     # part_id -> [BOM_id, ...]
+        self.llc = {}
+        self.orders = {}       # order_id -> (part_id, part_qty, due bucket)
+        self.sources = {}      # part_id -> {"orders" or BOM_id: Counter(bucket -> qty)}
+        self.rows = {}         # part_id -> {bucket: (gross_qty, projected_on_hand, net_qty, release_date)}
+        self.dirty = {}        # part_id -> earliest changed bucket (None: the whole horizon)
+        self._frame = None
+        self.stats = {"regenerations": 0, "parts_replanned": 0, "buckets_changed": 0}
+
+    # Loading
+
+    def refresh(self, connection):
+        # Bring the plan up to date, call before reading it in a request
+        with self._lock:
+            if self._generated_at is None or time.monotonic() - self._generated_at >= self.ttl:
+                self.regenerate(connection)
+            elif self._structure_stale:
+                self.bom_graph.refresh(connection)
+                self._set_structure(*self.bom_graph.active_structure())
+            self.replan()
+
+    def regenerate(self, connection):
+        with self._lock:
+            self.bom_graph.refresh(connection)
+            lines, llc = self.bom_graph.active_structure()
+            parts = load_parts(connection)
+            orders = load_orders(connection)
+            self.inventory = dict(zip(parts["part_id"], parts["inventory"]))
+            self.lead_times = dict(zip(parts["part_id"], parts["lead_time"]))
+            self.lines, self.children, self.orders, self.sources, self.rows, self.dirty = {}, {}, {}, {}, {}, {}
+            self._frame = None
+            self._set_structure(lines, llc)
+            for order in orders.itertuples(index=False):
+                self.order_added(order.order_id, order.part_id, order.part_qty, order.due_date)
+            self.replan()
+            self._generated_at = time.monotonic()
+            self.stats["regenerations"] += 1
+
+    def _set_structure(self, lines, llc):
+        # Replace the product structure. The children of removed rows lose the demand that came
+        # through them, the children of new or changed rows get the parent's current planned
+        # orders through them; the parents themselves are not affected.
+        lines = {
+            line.BOM_id: (line.part_id, line.child_id, line.child_qty or 0, line.child_leadtime)
+            for line in lines
+            if llc.get(line.child_id, 0) > llc.get(line.part_id, 0)
+        }
+        for BOM_id, (_, child_id, _, _) in self.lines.items():
+            if lines.get(BOM_id) != self.lines[BOM_id] and self.sources.get(child_id, {}).pop(BOM_id, None):
+                self._mark(child_id, None)
+        for BOM_id, (part_id, child_id, child_qty, _) in lines.items():
+            if self.lines.get(BOM_id) != lines[BOM_id]:
+                demand = Counter()
+                for gross, on_hand, net, release in self.rows.get(part_id, {}).values():
+                    if net > 0:
+                        demand[bucket_of(release, self.bucket)] += net * child_qty
+                self.sources.setdefault(child_id, {})[BOM_id] = demand
+                self._mark(child_id, None)
+        self.lines = lines
+        self.children = {}
+        for BOM_id, (part_id, _, _, _) in sorted(lines.items()):
+            self.children.setdefault(part_id, []).append(BOM_id)
+        self.llc = llc
+        self._structure_stale = False
+
+    # Changes, called by the write handlers once their transaction has committed
+
+    def order_added(self, order_id, part_id, qty, due_date):
+        with self._lock:
+            if order_id in self.orders or due_date is None or pd.isna(due_date) or pd.isna(qty):
+                return
+            due = bucket_of(due_date, self.bucket)
+            self.orders[order_id] = (part_id, qty, due)
+            self.sources.setdefault(part_id, {}).setdefault("orders", Counter())[due] += qty
+            self._mark(part_id, due)
+
+    def order_removed(self, order_id):
+        with self._lock:
+            order = self.orders.pop(order_id, None)
+            if order is None:
+                return
+            part_id, qty, due = order
+            self.sources[part_id]["orders"][due] -= qty
+            self._mark(part_id, due)
+
+    def part_changed(self, part_id, inventory, lead_time):
+        # Stock moves every bucket of the part, a lead time every release date of it
+        with self._lock:
+            self.inventory[part_id] = inventory
+            self.lead_times[part_id] = lead_time
+            self._mark(part_id, None)
+
+    def bom_changed(self):
+        # The structure is read again from the BOM graph at the next refresh
+        with self._lock:
+            self._structure_stale = True
+
+    def _mark(self, part_id, since):
+        if part_id in self.dirty:
+            current = self.dirty[part_id]
+            since = None if current is None or since is None else min(current, since)
+        self.dirty[part_id] = since
+
+    # Planning
+
+    def _lead_time(self, part_id, source):
+        if source == "orders":
+            lead_time = self.lead_times.get(part_id)
+        else:
+            child_leadtime = self.lines[source][3]
+            lead_time = child_leadtime if child_leadtime is not None else self.lead_times.get(part_id)
+        return 0 if lead_time is None or pd.isna(lead_time) else lead_time
+
+    def _renet(self, part_id, since):
+        # Lot-for-lot netting of one part against its stock, as plan() does for a whole level.
+        # The buckets before since are kept as they are; netting resumes from the cumulative
+        # gross requirement they add up to.
+        rows = {due: row for due, row in self.rows.get(part_id, {}).items() if since is not None and due < since}
+
+        gross = Counter()
+        lead_times = {}
+        for source, quantities in self.sources.get(part_id, {}).items():
+            lead_time = self._lead_time(part_id, source)
+            for due, qty in quantities.items():
+                if qty and (since is None or due >= since):
+                    gross[due] += qty
+                    lead_times[due] = max(lead_times.get(due, lead_time), lead_time)
+
+        inventory = self.inventory.get(part_id)
+        on_hand = 0 if inventory is None or pd.isna(inventory) else max(inventory, 0)
+        cumulative = 0
+        for due in sorted(rows):
+            cumulative += rows[due][0]
+        previous = max(cumulative - on_hand, 0)
+        for due in sorted(gross):
+            cumulative += gross[due]
+            net_cumulative = max(cumulative - on_hand, 0)
+            release = due - timedelta(days=float(lead_times[due]))
+            rows[due] = (gross[due], max(on_hand - cumulative, 0), net_cumulative - previous, release)
+            previous = net_cumulative
+        return rows
+
+    def replan(self):
+        # Renet the dirty parts, parents before children
+        with self._lock:
+            queue = [(self.llc.get(part_id, 0), part_id) for part_id in self.dirty]
+            heapq.heapify(queue)
+            while queue:
+                _, part_id = heapq.heappop(queue)
+                if part_id not in self.dirty:
+                    continue
+                since = self.dirty.pop(part_id)
+                old = self.rows.get(part_id, {})
+                if not old:
+                    since = None
+                new = self._renet(part_id, since)
+                self.rows[part_id] = new
+                self._frame = None
+                self.stats["parts_replanned"] += 1
+
+                # Planned orders (net quantity and release date) that changed
+                changed = [
+                    due for due in old.keys() | new.keys()
+                    if (since is None or due >= since) and old.get(due, (0, 0, 0, None))[2:] != new.get(due, (0, 0, 0, None))[2:]
+                ]
+                if not changed:
+                    continue
+                self.stats["buckets_changed"] += len(changed)
+                for BOM_id in self.children.get(part_id, ()):
+                    _, child_id, child_qty, _ = self.lines[BOM_id]
+                    demand = self.sources.setdefault(child_id, {}).setdefault(BOM_id, Counter())
+                    touched = set()
+                    for due in changed:
+                        for rows, sign in ((old, -1), (new, 1)):
+                            if due in rows and rows[due][2] > 0:
+                                need = bucket_of(rows[due][3], self.bucket)
+                                demand[need] += sign * rows[due][2] * child_qty
+                                touched.add(need)
+                    if touched:
+                        self._mark(child_id, min(touched))
+                        heapq.heappush(queue, (self.llc.get(child_id, 0), child_id))
+
+    def frame(self):
+        # The current plan in the layout of plan(), rebuilt only after a replan changed something
+        with self._lock:
+            if self._frame is not None:
+                return self._frame
+            parts = sorted(self.rows, key=lambda part_id: (self.llc.get(part_id, 0), part_id))
+            columns = {column: [] for column in PLAN_COLUMNS}
+            for part_id in parts:
+                rows = self.rows[part_id]
+                dues = sorted(rows)
+                columns["llc"].extend([self.llc.get(part_id, 0)] * len(dues))
+                columns["part_id"].extend([part_id] * len(dues))
+                columns["due_date"].extend(dues)
+                for due in dues:
+                    gross, on_hand, net, release = rows[due]
+                    columns["gross_qty"].append(gross)
+                    columns["projected_on_hand"].append(on_hand)
+                    columns["net_qty"].append(net)
+                    columns["release_date"].append(release)
+            self._frame = pd.DataFrame({
+                "llc": np.array(columns["llc"], dtype="int64"),
+                "part_id": columns["part_id"],
+                "due_date": pd.to_datetime(columns["due_date"]),
+                "gross_qty": np.array(columns["gross_qty"], dtype=float),
+                "projected_on_hand": np.array(columns["projected_on_hand"], dtype=float),
+                "net_qty": np.array(columns["net_qty"], dtype=float),
+                "release_date": pd.to_datetime(columns["release_date"]),
+            })
+            return self._frame
@@ -0,0 +1,107 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+
+
+class BomRollup(ABC):
+    # Base class for values rolled up the active BOM, computed for children before their parents
+    # (low-level-code order) and memoized per part, so each sub-assembly is computed once.
+    # Subclasses read their inputs in load() and combine a part's own input with the results of
+    # its children in combine(). On refresh the inputs are reloaded and compared part by part;
+    # only the parts whose inputs changed, and their ancestors, are computed again.
+    # Rows that close a cycle in the BOM are left out, like in the BOM explosion.
+
+    tables = []  # tables load() reads, the result goes stale when one of them is written
+
+    def __init__(self, bom_graph, ttl=300):
+        self.bom_graph = bom_graph
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._versions = None
+        self._checked_at = 0
+        self.inputs = {}    # part_id -> (own input, ((child_id, line input), ...))
+        self.llc = {}
+        self.parents = {}   # child_id -> set of parent part_ids
+        self.results = {}   # part_id -> memoized result
+
+    @abstractmethod
+    def load(self, connection, lines):
+        # Returns ({part_id: own input}, {BOM_id: line input}) for the given active BOM rows
+        ...
+
+    @abstractmethod
+    def combine(self, part_id, own, children):
+        # Result of a part from its own input and a [(child_id, line input, child result)] list
+        ...
+
+    def refresh(self, connection, versions):
+        # versions identifies the state of self.tables (see ResultCache.versions); the inputs are
+        # reloaded when it moved, or every ttl seconds to notice changes made by other processes
+        with self._lock:
+            now = time.monotonic()
+            if versions == self._versions and now - self._checked_at < self.ttl:
+                return
+            self.bom_graph.refresh(connection)
+            lines, llc = self.bom_graph.active_structure()
+            own, line_inputs = self.load(connection, lines)
+
+            children = {}
+            parents = {}
+            for line in lines:
+                if llc.get(line.child_id, 0) <= llc.get(line.part_id, 0):
+                    continue  # closes a cycle
+                children.setdefault(line.part_id, []).append((line.child_id, line_inputs.get(line.BOM_id)))
+                parents.setdefault(line.child_id, set()).add(line.part_id)
+            inputs = {
+                part: (own.get(part), tuple(sorted(children.get(part, ()), key=lambda child: child[0])))
+                for part in own.keys() | children.keys() | parents.keys()
+            }
+
+            changed = {part for part in inputs.keys() | self.inputs.keys() if inputs.get(part) != self.inputs.get(part)}
+            self.inputs, self.llc, self.parents = inputs, llc, parents
+            for part in self._with_ancestors(changed):
+                self.results.pop(part, None)
+            self._versions = versions
+            self._checked_at = now
+
+    def _with_ancestors(self, parts):
+        seen = set(parts)
+        stack = list(parts)
+        while stack:
+            for parent in self.parents.get(stack.pop(), ()):
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        return seen
+
+    def _descendants(self, part_id):
+        seen = {part_id}
+        stack = [part_id]
+        while stack:
+            for child, _ in self.inputs[stack.pop()][1]:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        return seen
+
+    def _compute(self, parts):
+        for part in sorted(parts, key=lambda p: self.llc.get(p, 0), reverse=True):
+            if part in self.results:
+                continue
+            own, children = self.inputs[part]
+            self.results[part] = self.combine(part, own, [(child, line, self.results[child]) for child, line in children])
+
+    def get(self, part_id):
+        # (own input, result, [(child_id, line input, child result), ...]) or None for an unknown part
+        with self._lock:
+            if part_id not in self.inputs:
+                return None
+            self._compute(self._descendants(part_id))
+            own, children = self.inputs[part_id]
+            return own, self.results[part_id], [(child, line, self.results[child]) for child, line in children]
+
+    def get_all(self):
+        # {part_id: (own input, result)} for every known part, in one bottom-up pass
+        with self._lock:
+            self._compute(self.inputs.keys())
+            return {part: (self.inputs[part][0], self.results[part]) for part in sorted(self.inputs)}
@@ -0,0 +1,265 @@
+import atexit
+import multiprocessing
+import pickle
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import capacity
+import mrp
+import scheduler
+from bom_graph import BomLine
+
+# What-if evaluation of planning scenarios. The orders, parts, BOM, routings and workcentres are
+# read once into a Snapshot; every scenario is an overlay of changes on top of it (a demand
+# factor, lead times, stock levels, workcentre availability) and never touches the database.
+# The scenarios of a request are evaluated in parallel by a process pool that lives as long as
+# the server. Its workers are started by a forkserver (spawned where there is none), never forked
+# from the multithreaded server itself. A snapshot is pickled once into shared memory; each worker
+# unpickles it from there the first time it evaluates a scenario of that snapshot and keeps it
+# until a newer one comes.
+
+SCENARIO_ORDER_COLUMNS = ["order_id", "part_id", "part_qty", "order_date", "due_date"]
+SCENARIO_ROUTING_COLUMNS = ["routing_id", "BOM_id", "operations_sequence", "workcentre_id", "setup_time", "runtime"]
+
+Snapshot = namedtuple("Snapshot", ["orders", "parts", "bom", "llc", "routings", "workcentres", "taken_at"])
+
+
+def load_snapshot(connection, bom_graph):
+    bom_graph.refresh(connection)
+    lines, llc = bom_graph.active_structure()
+    cursor = connection.cursor()
+    cursor.execute("SELECT order_id, part_id, part_qty, order_date, due_date FROM dbo.Orders$ WHERE status = 'processing'")
+    orders = mrp.fetch_frame(cursor, SCENARIO_ORDER_COLUMNS)
+    cursor.execute("""
+    SELECT routing_id, BOM_id, operations_sequence, workcentre_id, setup_time, runtime
+    FROM dbo.Routings$ WHERE status = 'active'
+    """)
+    routings = mrp.fetch_frame(cursor, SCENARIO_ROUTING_COLUMNS)
+    return Snapshot(
+        orders,
+        mrp.load_parts(connection),
+        mrp.bom_frame(lines),
+        llc,
+        routings,
+        capacity.load_workcentres(connection),
+        pd.Timestamp.now().floor("s"),
+    )
+
+
+def apply(snapshot, scenario):
+    # The snapshot's frames with the scenario's changes applied (copies, the snapshot is shared)
+    orders, parts, bom = snapshot.orders, snapshot.parts, snapshot.bom
+    routings, workcentres = snapshot.routings, snapshot.workcentres
+
+    factor = scenario.get("demand_factor", 1)
+    if factor != 1:
+        part_ids = scenario.get("demand_part_ids")
+        scaled = orders["part_id"].isin(part_ids) if part_ids else True
+        orders = orders.assign(part_qty=np.where(scaled, orders["part_qty"].astype(float) * factor, orders["part_qty"].astype(float)))
+
+    lead_times = scenario.get("lead_times") or {}
+    if lead_times:
+        # A supplier lead time change applies to the part and to every BOM row that uses it
+        parts = parts.assign(lead_time=parts["part_id"].map(lead_times).fillna(parts["lead_time"]))
+        bom = bom.assign(child_leadtime=bom["child_id"].map(lead_times).fillna(bom["child_leadtime"]))
+
+    inventory = scenario.get("inventory") or {}
+    if inventory:
+        parts = parts.assign(inventory=parts["part_id"].map(inventory).fillna(parts["inventory"]))
+
+    availability = scenario.get("workcentre_availability") or {}
+    return orders, parts, bom, routings, workcentres, availability
+
+
+def _stretched(routings, workcentres, availability):
+    # Routings and workcentres for the scheduler, which has no notion of availability: a
+    # workcentre at half availability takes twice as long for the same operation. The operations
+    # of a workcentre that is down are left as they are, they are not scheduled at all.
+    if not availability:
+        return routings, workcentres
+    fraction = routings["workcentre_id"].map(availability).fillna(1).astype(float)
+    fraction = fraction.where(fraction > 0, 1)
+    routings = routings.assign(
+        setup_time=routings["setup_time"].astype(float) / fraction,
+        runtime=routings["runtime"].astype(float) / fraction,
+    )
+    workcentres = workcentres.assign(
+        capacity=workcentres["capacity"].astype(float) * workcentres["workcentre_id"].map(availability).fillna(1)
+    )
+    return routings, workcentres
+
+
+def _records(frame, columns):
+    # Rows as plain tuples with None for missing values, the form the scheduler reads from a cursor
+    values = frame[columns].astype(object).where(frame[columns].notna(), None)
+    return list(values.itertuples(index=False, name=None))
+
+
+def _datetimes(series):
+    return [None if pd.isna(value) else value.to_pydatetime() for value in series]
+
+
+def evaluate(snapshot, scenario, settings):
+    # KPIs of one scenario. settings: bucket, rule, as_of, hours_per_day, days_per_week, day_start
+    orders, parts, bom, routings, workcentres, availability = apply(snapshot, scenario)
+    down = {workcentre_id for workcentre_id, fraction in availability.items() if fraction <= 0}
+    as_of = pd.Timestamp(settings["as_of"] or snapshot.taken_at)
+
+    # Material: planned orders that should have been released before as_of cannot arrive in time
+    plan = mrp.plan(orders[mrp.ORDER_COLUMNS], parts, bom, snapshot.llc, settings["bucket"])
+    planned = plan[plan["net_qty"] > 0]
+    late = planned[planned["release_date"] < as_of.normalize()]
+    material = {
+        "planned_orders": int(len(planned)),
+        "planned_qty": float(planned["net_qty"].sum()),
+        "past_due_releases": int(len(late)),
+        "shortage_qty": float(late["net_qty"].sum()),
+        "short_parts": int(late["part_id"].nunique()),
+    }
+
+    # Capacity: utilization of the hours the workcentre is available per bucket; a workcentre
+    # that is down is overloaded in every bucket it has work in
+    load = capacity.workcentre_load(
+        orders[mrp.ORDER_COLUMNS], bom, routings[capacity.ROUTING_COLUMNS], workcentres, settings["bucket"],
+        settings["hours_per_day"], settings["days_per_week"],
+    )
+    fraction = load["workcentre_id"].map(availability).fillna(1).astype(float)
+    utilization = load["required_hours"] / (load["available_hours"] * fraction).where(fraction > 0)
+    load = load.assign(utilization=utilization.fillna(np.inf))
+    per_workcentre = {}
+    for workcentre_id, rows in load.groupby("workcentre_id", sort=True):
+        per_workcentre[str(workcentre_id)] = {
+            "required_hours": float(rows["required_hours"].sum()),
+            "mean_utilization": _finite(rows["utilization"].mean()),
+            "peak_utilization": _finite(rows["utilization"].max()),
+            "overloaded_buckets": int((rows["utilization"] > 1).sum()),
+        }
+    workload = {
+        "required_hours": float(load["required_hours"].sum()),
+        "overloaded_buckets": int((load["utilization"] > 1).sum()),
+        "peak_utilization": _finite(load["utilization"].max()) if len(load) else 0.0,
+    }
+
+    # Schedule: orders that need a workcentre that is down cannot be scheduled at all
+    calendar = scheduler.WorkingCalendar(settings["hours_per_day"], settings["days_per_week"], settings["day_start"])
+    order_rows = list(zip(
+        orders["order_id"], orders["part_id"], orders["part_qty"].astype(float).fillna(0),
+        _datetimes(orders["order_date"]), _datetimes(orders["due_date"]),
+    ))
+    lines = [BomLine(*row, "active") for row in bom.itertuples(index=False, name=None)]
+    routings, workcentres = _stretched(routings, workcentres, availability)
+    jobs = scheduler.build_jobs(order_rows, lines, _records(routings, SCENARIO_ROUTING_COLUMNS), _records(workcentres, ["workcentre_id", "capacity"]), calendar)
+    blocked = [job for job in jobs if any(op.workcentre_id in down for stage in job.stages for op in stage)]
+    if blocked:
+        jobs = [job for job in jobs if not any(op.workcentre_id in down for stage in job.stages for op in stage)]
+    scheduler.schedule(jobs, settings["rule"])
+    tardiness = [max(job.finish - job.due, 0) / 60 for job in jobs]
+    schedule = {
+        "scheduled_orders": len(jobs),
+        "blocked_orders": len(blocked),
+        "late_orders": sum(hours > 0 for hours in tardiness),
+        "total_tardiness_hours": float(sum(tardiness)),
+        "finish": calendar.from_working(max((job.finish for job in jobs), default=0), end=True).isoformat(timespec="seconds") if jobs else None,
+    }
+
+    return {"material": material, "capacity": workload, "schedule": schedule, "workcentres": per_workcentre}
+
+
+def _finite(value):
+    # JSON has no infinity: utilization of a workcentre that is down is reported as None
+    return float(value) if np.isfinite(value) else None
+
+
+def delta(kpis, baseline):
+    # Change of every numeric KPI against the baseline, per section
+    return {
+        section: {
+            name: value - baseline[section][name]
+            for name, value in values.items()
+            if isinstance(value, (int, float)) and isinstance(baseline[section].get(name), (int, float))
+        }
+        for section, values in kpis.items()
+        if section != "workcentres"
+    }
+
+
+# The snapshot a worker evaluates against, with the name of the shared memory it was read from
+_snapshot_name = None
+_snapshot = None
+
+
+def _evaluate_in_worker(name, scenario, settings):
+    global _snapshot_name, _snapshot
+    if name != _snapshot_name:
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            _snapshot = pickle.loads(block.buf)
+        finally:
+            # Only detach: the server owns the block and unlinks it (the workers share its
+            # resource tracker, so attaching does not make them owners)
+            block.close()
+        _snapshot_name = name
+    return evaluate(_snapshot, scenario, settings)
+
+
+class SharedSnapshot:
+    # A snapshot pickled into a shared memory block, unlinked once it has been replaced and the
+    # evaluations still reading it are done
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        data = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        self.block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        self.block.buf[:len(data)] = data
+        self.users = 0
+        self.replaced = False
+        self.unlinked = False
+
+    def release(self):
+        # Called with the pool's lock held
+        if self.replaced and self.users == 0 and not self.unlinked:
+            self.block.close()
+            self.block.unlink()
+            self.unlinked = True
+
+
+class ScenarioPool:
+
+    def __init__(self, max_workers=None):
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._executor = ProcessPoolExecutor(max_workers, mp_context=context)
+        self._lock = threading.Lock()
+        self._shared = None
+        atexit.register(self.shutdown)
+
+    def evaluate(self, snapshot, scenarios, settings):
+        # [kpis] in the order of scenarios
+        with self._lock:
+            if self._shared is None or self._shared.snapshot is not snapshot:
+                if self._shared is not None:
+                    self._shared.replaced = True
+                    self._shared.release()
+                self._shared = SharedSnapshot(snapshot)
+            shared = self._shared
+            shared.users += 1
+        try:
+            futures = [self._executor.submit(_evaluate_in_worker, shared.block.name, scenario, settings) for scenario in scenarios]
+            return [future.result() for future in futures]
+        finally:
+            with self._lock:
+                shared.users -= 1
+                shared.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            if self._shared is not None:
+                self._shared.replaced = True
+                self._shared.release()
+                self._shared = None
@@ -0,0 +1,233 @@
+import heapq
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from bom_graph import is_active
+from tables import operation_minutes, runtime_at_capacity
+
+# Finite-capacity scheduling of the open orders onto the workcentres. Every order runs the active
+# routings of its part's active BOM rows; routings with the same operations_sequence may run at
+# the same time, the next sequence starts once they have all finished. A workcentre works on one
+# operation at a time, only during working hours, and picks the next operation from its queue by
+# a dispatching rule. The simulation is event driven over a heap of operation releases and
+# finishes, with one priority queue (heap) per workcentre.
+
+Operation = namedtuple("Operation", ["routing_id", "operations_sequence", "workcentre_id", "minutes"])
+
+
+class Job:
+    __slots__ = ["order_id", "part_id", "part_qty", "due_date", "release", "due", "stages", "stage", "open", "remaining", "start", "finish"]
+
+    def __init__(self, order_id, part_id, part_qty, due_date, release, due, stages):
+        self.order_id = order_id
+        self.part_id = part_id
+        self.part_qty = part_qty
+        self.due_date = due_date
+        self.release = release        # working minutes, when the first operations may start
+        self.due = due                # working minutes
+        self.stages = stages          # [[Operation, ...], ...] in operations_sequence order
+        self.stage = 0
+        self.open = 0                 # operations of the current stage not finished yet
+        self.remaining = sum(op.minutes for stage in stages for op in stage)
+        self.start = None
+        self.finish = None
+
+
+# Dispatching rules: the sort key of an operation joining a workcentre queue at time now, lowest
+# first. Critical ratio is evaluated when the operation joins the queue.
+RULES = {
+    "edd": lambda job, op, now: job.due,                                  # earliest due date
+    "spt": lambda job, op, now: op.minutes,                               # shortest processing time
+    "cr": lambda job, op, now: (job.due - now) / max(job.remaining, 1),   # critical ratio
+}
+
+
+class WorkingCalendar:
+    # Maps datetimes to minutes of working time counted from a Monday, so the simulation can add
+    # durations with plain arithmetic. Work happens days_per_week days a week (Monday first),
+    # hours_per_day hours from day_start. A moment outside working hours maps to the start of
+    # the next working period.
+    epoch = datetime(2000, 1, 3)
+
+    def __init__(self, hours_per_day=8, days_per_week=5, day_start=8):
+        self.day_start = day_start
+        self.days_per_week = days_per_week
+        self.day_minutes = hours_per_day * 60
+        self.week_minutes = days_per_week * self.day_minutes
+
+    def to_working(self, moment):
+        delta = moment - self.epoch
+        weeks, weekday = divmod(delta.days, 7)
+        if weekday >= self.days_per_week:
+            return (weeks + 1) * self.week_minutes
+        minute = delta.seconds / 60 - self.day_start * 60
+        return weeks * self.week_minutes + weekday * self.day_minutes + min(max(minute, 0), self.day_minutes)
+
+    def from_working(self, minutes, end=False):
+        # With end=True a moment at the start of a working day is shown as the end of the previous
+        # one, which is what a finish time means
+        weeks, rest = divmod(minutes, self.week_minutes)
+        day, minute = divmod(rest, self.day_minutes)
+        if end and minute == 0 and minutes > 0:
+            weeks, day = (weeks - 1, self.days_per_week - 1) if day == 0 else (weeks, day - 1)
+            minute = self.day_minutes
+        return self.epoch + timedelta(weeks=weeks, days=day, hours=self.day_start, minutes=minute)
+
+
+def load_inputs(connection):
+    # (orders, routings, workcentres) rows of the open orders, the active routings and every workcentre
+    cursor = connection.cursor()
+    cursor.execute("SELECT order_id, part_id, part_qty, order_date, due_date FROM dbo.Orders$ WHERE status = 'processing'")
+    orders = cursor.fetchall()
+    cursor.execute("""
+    SELECT routing_id, BOM_id, operations_sequence, workcentre_id, setup_time, runtime
+    FROM dbo.Routings$ WHERE status = 'active'
+    """)
+    routings = cursor.fetchall()
+    cursor.execute("SELECT workcentre_id, capacity FROM dbo.Workcentre$")
+    workcentres = cursor.fetchall()
+    return orders, routings, workcentres
+
+
+def build_jobs(orders, lines, routings, workcentres, calendar, start=None):
+    # One job per order with a due date. setup_time is per order and runtime per unit (minutes,
+    # see tables.py); a routing without a runtime runs at the workcentre's capacity (units per hour).
+    capacities = {workcentre_id: capacity for workcentre_id, capacity in workcentres}
+    routings_by_bom = defaultdict(list)
+    for routing_id, BOM_id, sequence, workcentre_id, setup_time, runtime in routings:
+        routings_by_bom[BOM_id].append((sequence or 0, routing_id, workcentre_id, setup_time or 0, runtime))
+    lines_by_part = defaultdict(list)
+    for line in lines:
+        if is_active(line.status):
+            lines_by_part[line.part_id].append(line.BOM_id)
+
+    operations_by_part = {}
+    earliest = calendar.to_working(start) if start else 0
+    jobs = []
+    for order_id, part_id, part_qty, order_date, due_date in orders:
+        if due_date is None:
+            continue
+        if part_id not in operations_by_part:
+            operations_by_part[part_id] = sorted(
+                routing for BOM_id in lines_by_part.get(part_id, ()) for routing in routings_by_bom.get(BOM_id, ())
+            )
+        qty = part_qty or 0
+        stages = {}
+        for sequence, routing_id, workcentre_id, setup_time, runtime in operations_by_part[part_id]:
+            if runtime is None:
+                runtime = runtime_at_capacity(capacities.get(workcentre_id))
+            stages.setdefault(sequence, []).append(Operation(routing_id, sequence, workcentre_id, operation_minutes(setup_time, runtime, qty)))
+        release = max(calendar.to_working(order_date), earliest) if order_date else earliest
+        jobs.append(Job(order_id, part_id, part_qty, due_date, release, calendar.to_working(due_date), [stages[s] for s in sorted(stages)]))
+    return jobs
+
+
+def schedule(jobs, rule="edd"):
+    # Schedules the jobs in place (job.start, job.finish) and returns the Gantt chart as
+    # {workcentre_id: [(start, finish, job, operation), ...]}, all times in working minutes
+    priority = RULES[rule]
+    events = []                 # (time, tie breaker, job index, operation or None for a release)
+    queues = defaultdict(list)  # workcentre_id -> heap of (priority, tie breaker, job index, operation)
+    busy = set()
+    gantt = defaultdict(list)
+    tie = 0
+
+    for index, job in enumerate(jobs):
+        if job.stages:
+            events.append((job.release, tie, index, None))
+            tie += 1
+        else:
+            job.start = job.finish = job.release
+    heapq.heapify(events)
+
+    while events:
+        now = events[0][0]
+        waiting = set()
+        while events and events[0][0] == now:
+            _, _, index, op = heapq.heappop(events)
+            job = jobs[index]
+            if op is not None:
+                busy.discard(op.workcentre_id)
+                waiting.add(op.workcentre_id)
+                job.remaining -= op.minutes
+                job.open -= 1
+                if job.open:
+                    continue
+                job.stage += 1
+                if job.stage == len(job.stages):
+                    job.finish = now
+                    continue
+            # Release the job's next stage
+            job.open = len(job.stages[job.stage])
+            for next_op in job.stages[job.stage]:
+                heapq.heappush(queues[next_op.workcentre_id], (priority(job, next_op, now), tie, index, next_op))
+                tie += 1
+                waiting.add(next_op.workcentre_id)
+
+        for workcentre_id in waiting:
+            queue = queues[workcentre_id]
+            if workcentre_id in busy or not queue:
+                continue
+            _, _, index, op = heapq.heappop(queue)
+            job = jobs[index]
+            if job.start is None:
+                job.start = now
+            busy.add(workcentre_id)
+            heapq.heappush(events, (now + op.minutes, tie, index, op))
+            tie += 1
+            gantt[workcentre_id].append((now, now + op.minutes, job, op))
+    return gantt
+
+
+def report(jobs, gantt, calendar):
+    # Plain data for the API: per-order start and finish, per-workcentre Gantt bars and totals.
+    # Tardiness is counted in working hours. A finish is shown as the end of a working day only
+    # when something ran before it, an order without operations finishes when it starts.
+    def moment(minutes, end=False):
+        return calendar.from_working(minutes, end).isoformat(timespec="seconds")
+
+    orders = []
+    late = 0
+    tardiness = 0
+    for job in jobs:
+        job_tardiness = max(job.finish - job.due, 0) / 60
+        late += job_tardiness > 0
+        tardiness += job_tardiness
+        orders.append({
+            "order_id": job.order_id,
+            "part_id": job.part_id,
+            "part_qty": job.part_qty,
+            "due_date": job.due_date.isoformat(timespec="seconds"),
+            "start": moment(job.start),
+            "finish": moment(job.finish, end=job.finish > job.start),
+            "tardiness_hours": job_tardiness,
+            "operations": sum(len(stage) for stage in job.stages),
+        })
+
+    workcentres = {}
+    for workcentre_id in sorted(gantt, key=str):
+        bars = gantt[workcentre_id]
+        workcentres[workcentre_id] = {
+            "busy_hours": sum(finish - start for start, finish, _, _ in bars) / 60,
+            "operations": [
+                {
+                    "order_id": job.order_id,
+                    "routing_id": op.routing_id,
+                    "operations_sequence": op.operations_sequence,
+                    "start": moment(start),
+                    "finish": moment(finish, end=finish > start),
+                }
+                for start, finish, job, op in bars
+            ],
+        }
+
+    scheduled = [job for job in jobs if job.stages]
+    summary = {
+        "orders": len(jobs),
+        "operations": sum(len(bars) for bars in gantt.values()),
+        "late_orders": late,
+        "total_tardiness_hours": tardiness,
+        "start": moment(min(job.start for job in scheduled)) if scheduled else None,
+        "finish": moment(max(job.finish for job in scheduled), end=True) if scheduled else None,
+    }
+    return {"summary": summary, "orders": orders, "workcentres": workcentres}
@@ -0,0 +1,313 @@
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from decimal import Decimal
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+from backends import create_backend
+from ids import ID_FORMATS
+from models import TABLE_MODELS
+from tables import TABLES, read_csv
+
+# Command line loader that seeds or syncs a database from the ESA Showcase CSV exports:
+#   cd python-sql-azure
+#   python -m seed                                 # every table into DB_BACKEND
+#   python -m seed --diff --dry-run                # only report what would change
+#   python -m seed --tables Orders BOM --diff --prune
+# Every file is streamed row by row and each row is coerced to the Pydantic model of its table;
+# rows that do not pass are reported and skipped. The rows are written in batches by a few
+# workers in parallel, each on a connection of its own and with one transaction per batch.
+# Rows are matched on the key column of their table (case-insensitively, like the database
+# collation): new keys are inserted and existing ones updated, with --diff only when a value
+# differs. With --prune the rows whose key is not in the file are deleted.
+
+# Referenced tables first, so the rows pointing at them find them in place
+LOAD_ORDER = ["Part_Master_Records$", "Workcentre$", "BOM$", "Routings$", "Orders$"]
+
+# SQL Server keeps datetime values to about 3 ms, timestamps closer than this are the same
+TIMESTAMP_TOLERANCE = 0.004
+
+# Keys per IN (...) list, well below the 2100 parameters SQL Server allows per statement
+IN_LIST_SIZE = 1000
+
+
+def same_value(new, current):
+    if new is None or current is None:
+        return new is None and current is None
+    if isinstance(current, Decimal):
+        current = float(current)
+    if isinstance(new, datetime) and isinstance(current, datetime):
+        return abs((new - current).total_seconds()) <= TIMESTAMP_TOLERANCE
+    if isinstance(new, float) or isinstance(current, float):
+        # REAL columns may only hold single precision
+        try:
+            return math.isclose(float(new), float(current), rel_tol=1e-6, abs_tol=1e-9)
+        except (TypeError, ValueError):
+            return False
+    return new == current
+
+
+def same_row(new, current):
+    return all(same_value(a, b) for a, b in zip(new, current))
+
+
+class Report:
+    # Counts per table, updated by the workers
+
+    fields = ["rows", "inserted", "updated", "unchanged", "deleted", "invalid", "duplicate"]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, table, **counts):
+        with self._lock:
+            total = self.counts.setdefault(table, dict.fromkeys(self.fields, 0))
+            for field, count in counts.items():
+                total[field] += count
+
+    def problems(self):
+        return sum(counts["invalid"] + counts["duplicate"] for counts in self.counts.values())
+
+    def line(self, table):
+        counts = self.counts.get(table, dict.fromkeys(self.fields, 0))
+        return ", ".join(f"{counts[field]} {field}" for field in self.fields)
+
+
+def table_rows(table, data_dir, report, keys):
+    # Rows of the table's CSV coerced to its model, as tuples in column order. Rows that fail
+    # the model, have no key or repeat a key already read are reported and skipped. The key of
+    # every row read, skipped or not, is added to keys (upper case), so --prune never deletes
+    # a row that is in the file.
+    model = TABLE_MODELS[table.name]
+    names = [name for name, _ in table.columns]
+    key_index = names.index(table.key)
+    seen = set()
+    for number, row in enumerate(read_csv(table, data_dir, strict=False), start=1):
+        report.add(table.name, rows=1)
+        if row[key_index] is not None:
+            keys.add(row[key_index].upper())
+        try:
+            values = model(**dict(zip(names, row)))
+        except ValidationError as e:
+            report.add(table.name, invalid=1)
+            problems = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+            print(f"{table.csv_file} row {number}: {problems}", file=sys.stderr)
+            continue
+        row = tuple(getattr(values, name) for name in names)
+        key = row[key_index]
+        if key is None:
+            report.add(table.name, invalid=1)
+            print(f"{table.csv_file} row {number}: {table.key} is missing", file=sys.stderr)
+            continue
+        if key.upper() in seen:
+            report.add(table.name, duplicate=1)
+            print(f"{table.csv_file} row {number}: {table.key} {key} repeats an earlier row", file=sys.stderr)
+            continue
+        seen.add(key.upper())
+        yield row
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Loader:
+
+    def __init__(self, backend, report, batch_size=1000, workers=4, diff=False, dry_run=False):
+        self.backend = backend
+        self.report = report
+        self.batch_size = batch_size
+        self.workers = workers
+        self.diff = diff
+        self.dry_run = dry_run
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self.keys = {}  # table -> keys read from its file
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="seed")
+
+    def connection(self):
+        # One connection per thread, kept for the whole run
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self.backend.connect()
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def load(self, table, data_dir):
+        # Stream the table's file into the database. At most two batches per worker are read
+        # ahead, so memory stays flat however large the file is.
+        pending = set()
+        self.keys[table.name] = set()
+        try:
+            for batch in batches(table_rows(table, data_dir, self.report, self.keys[table.name]), self.batch_size):
+                if len(pending) >= 2 * self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(self._executor.submit(self.write_batch, table, batch))
+        finally:
+            done, _ = wait(pending)
+        for future in done:
+            future.result()
+
+    def write_batch(self, table, rows):
+        names = [name for name, _ in table.columns]
+        key_index = names.index(table.key)
+        others = [name for name in names if name != table.key]
+        connection = self.connection()
+        cursor = connection.cursor()
+
+        existing = {}
+        keys = [row[key_index] for row in rows]
+        for i in range(0, len(keys), IN_LIST_SIZE):
+            chunk = keys[i:i + IN_LIST_SIZE]
+            cursor.execute(f"SELECT {', '.join(names)} FROM dbo.{table.name} WHERE {table.key} IN ({', '.join('?' * len(chunk))})", chunk)
+            for current in cursor.fetchall():
+                existing[current[key_index].upper()] = tuple(current)
+
+        inserts, updates, unchanged = [], [], 0
+        for row in rows:
+            current = existing.get(row[key_index].upper())
+            if current is None:
+                inserts.append(row)
+            elif self.diff and same_row(row, current):
+                unchanged += 1
+            else:
+                updates.append(tuple(value for name, value in zip(names, row) if name != table.key) + (current[key_index],))
+
+        if not self.dry_run:
+            try:
+                if inserts:
+                    self.backend.executemany(cursor, f"INSERT INTO dbo.{table.name} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})", inserts)
+                if updates:
+                    self.backend.executemany(cursor, f"UPDATE dbo.{table.name} SET {', '.join(f'{name} = ?' for name in others)} WHERE {table.key} = ?", updates)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        self.report.add(table.name, inserted=len(inserts), updated=len(updates), unchanged=unchanged)
+
+    def prune(self, table):
+        # Delete the rows whose key was not in the table's file (after load)
+        keys = self.keys[table.name]
+        connection = self.connection()
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT {table.key} FROM dbo.{table.name} WHERE {table.key} IS NOT NULL")
+        missing = [key for key, in cursor.fetchall() if key.upper() not in keys]
+        if not self.dry_run:
+            try:
+                for i in range(0, len(missing), IN_LIST_SIZE):
+                    chunk = missing[i:i + IN_LIST_SIZE]
+                    cursor.execute(f"DELETE FROM dbo.{table.name} WHERE {table.key} IN ({', '.join('?' * len(chunk))})", chunk)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        self.report.add(table.name, deleted=len(missing))
+
+    def advance_ids(self, names):
+        # Move the id counters (see ids.py) past the highest loaded key, so that new rows never
+        # get the id of a loaded one. Counters that do not exist yet start there anyway.
+        connection = self.connection()
+        self.backend.ensure_id_table(connection)
+        cursor = connection.cursor()
+        try:
+            for name in names:
+                prefix, _, column = ID_FORMATS[name]
+                number = self.backend.id_number(column, len(prefix))
+                cursor.execute(f"SELECT COALESCE(MAX({number}), 0) + 1 FROM dbo.{name} WHERE {column} LIKE ?", (f"{prefix}%",))
+                next_value = cursor.fetchone()[0]
+                cursor.execute("UPDATE dbo.Id_Blocks$ SET next_value = ? WHERE entity = ? AND next_value < ?", (next_value, name, next_value))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+    def close(self):
+        self._executor.shutdown()
+        for connection in self._connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+def table_names(names):
+    # Table names as given on the command line, with or without the trailing $, in load order
+    if not names:
+        return LOAD_ORDER
+    wanted = {name.rstrip("$").lower() for name in names}
+    known = {name.rstrip("$").lower(): name for name in LOAD_ORDER}
+    unknown = wanted - set(known)
+    if unknown:
+        raise SystemExit(f"Unknown tables: {', '.join(sorted(unknown))}, expected some of {', '.join(LOAD_ORDER)}")
+    return [name for name in LOAD_ORDER if name.rstrip("$").lower() in wanted]
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="python -m seed", description="Load the ESA Showcase CSV files into the database")
+    parser.add_argument("--backend", default=os.getenv("DB_BACKEND", "sqlserver"), help="sqlserver or sqlite (default: DB_BACKEND)")
+    parser.add_argument("--data-dir", default=os.getenv("SEED_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")), help="directory with the CSV files (default: SEED_DATA_DIR or the repository root)")
+    parser.add_argument("--tables", nargs="+", help="tables to load (default: all of them)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per batch and transaction")
+    parser.add_argument("--workers", type=int, default=4, help="batches written in parallel")
+    parser.add_argument("--diff", action="store_true", help="only write rows that are new or differ from the database")
+    parser.add_argument("--prune", action="store_true", help="delete rows whose key is not in the file")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be written without writing")
+    parser.add_argument("--strict", action="store_true", help="write nothing when any row is invalid or repeats a key")
+    args = parser.parse_args(argv)
+
+    names = table_names(args.tables)
+    if args.strict:
+        # A first pass over the files, so that nothing is written when any row would be skipped
+        check = Report()
+        for name in names:
+            for _ in table_rows(TABLES[name], args.data_dir, check, set()):
+                pass
+        if check.problems():
+            print(f"{check.problems()} rows are invalid or repeat a key, nothing was written", file=sys.stderr)
+            return 1
+
+    backend = create_backend(args.backend, seed=False)
+    report = Report()
+    loader = Loader(backend, report, args.batch_size, args.workers, args.diff, args.dry_run)
+    try:
+        backend.ensure_tables(loader.connection())
+        for name in names:
+            started = time.perf_counter()
+            loader.load(TABLES[name], args.data_dir)
+            print(f"{name}: {report.line(name)} ({time.perf_counter() - started:.2f}s)")
+        if args.prune:
+            # Referencing tables first, the reverse of the load order
+            for name in reversed(names):
+                loader.prune(TABLES[name])
+                print(f"{name}: {report.counts[name]['deleted']} deleted")
+        if not args.dry_run:
+            loader.advance_ids(names)
+    finally:
+        loader.close()
+    if args.dry_run:
+        print("Dry run, nothing was written")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
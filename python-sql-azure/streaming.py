@@ -0,0 +1,42 @@
+import csv
+import zlib
+from io import StringIO
+
+
+def stream_csv(pool, backend, query, params=(), chunk_size=5000, timeout=None, compress=False):
+    # Generator that streams the result of a query as CSV. Rows are pulled from the cursor with
+    # fetchmany and encoded chunk by chunk, so memory stays constant whatever the size of the table
+    # and the header reaches the client before the query has finished. With compress=True the
+    # output is gzip encoded on the fly.
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip header
+
+    def encode(text):
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    with pool.connection() as connection:
+        backend.set_query_timeout(connection, timeout)
+        cursor = connection.cursor()
+        cursor.execute(query, params)
+        # The timeout covers running the query, not how fast the client reads the result
+        backend.set_query_timeout(connection, None)
+
+        buffer = StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow([column[0] for column in cursor.description])
+
+        while True:
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            data = encode(chunk)
+            if data:
+                yield data
+
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            writer.writerows(rows)
+
+    if compressor:
+        yield compressor.flush()
@@ -0,0 +1,168 @@
+import csv
+import os
+from collections import namedtuple
+from datetime import datetime
+
+# Layout of the five tables, columns in the same order as the ESA Showcase CSV exports.
+# text_column is the free-text column that may contain unquoted commas in those exports.
+Table = namedtuple("Table", ["name", "csv_file", "key", "columns", "text_column"])
+
+TABLES = {
+    "BOM$": Table(
+        "BOM$", "ESA Showcase BOM.csv", "BOM_id",
+        [
+            ("BOM_id", "TEXT"),
+            ("part_id", "TEXT"),
+            ("child_id", "TEXT"),
+            ("child_qty", "REAL"),
+            ("child_leadtime", "REAL"),
+            ("BOM_last_updated", "TIMESTAMP"),
+            ("status", "TEXT"),
+        ],
+        None,
+    ),
+    "Routings$": Table(
+        "Routings$", "ESA Showcase Routings.csv", "routing_id",
+        [
+            ("routing_id", "TEXT"),
+            ("BOM_id", "TEXT"),
+            ("operations_sequence", "INTEGER"),
+            ("workcentre_id", "TEXT"),
+            ("process_description", "TEXT"),
+            ("setup_time", "REAL"),
+            ("runtime", "REAL"),
+            ("routings_last_update", "TIMESTAMP"),
+            ("status", "TEXT"),
+        ],
+        "process_description",
+    ),
+    "Part_Master_Records$": Table(
+        "Part_Master_Records$", "ESA Showcase Parts Master Records.csv", "part_id",
+        [
+            ("part_id", "TEXT"),
+            ("part_name", "TEXT"),
+            ("inventory", "INTEGER"),
+            ("POM", "TEXT"),
+            ("UOM", "TEXT"),
+            ("part_description", "TEXT"),
+            ("unit_cost", "REAL"),
+            ("lead_time", "INTEGER"),
+            ("part_last_updated", "TIMESTAMP"),
+            ("status", "TEXT"),
+        ],
+        "part_description",
+    ),
+    "Orders$": Table(
+        "Orders$", "ESA Showcase Orders.csv", "order_id",
+        [
+            ("order_id", "TEXT"),
+            ("part_id", "TEXT"),
+            ("part_qty", "INTEGER"),
+            ("order_date", "TIMESTAMP"),
+            ("due_date", "TIMESTAMP"),
+            ("order_last_updated", "TIMESTAMP"),
+            ("status", "TEXT"),
+        ],
+        None,
+    ),
+    "Workcentre$": Table(
+        "Workcentre$", "ESA Showcase Workcentre.csv", "workcentre_id",
+        [
+            ("workcentre_id", "TEXT"),
+            ("workcentre_name", "TEXT"),
+            ("workcentre_description", "TEXT"),
+            ("capacity", "INTEGER"),
+            ("capacity_unit", "TEXT"),
+            ("cost_rate_h", "REAL"),
+            ("workcentre_last_updated", "TIMESTAMP"),
+            ("status", "TEXT"),
+        ],
+        "workcentre_description",
+    ),
+}
+
+# Routings$ keeps setup_time and runtime in minutes: setup_time once per run of the operation,
+# runtime per unit made. The columns carry no unit themselves; minutes is what the showcase data
+# fits (mostly 30 minutes of setup and 10 minutes per unit, against workcentres rated at 5 to 50
+# units an hour in Workcentre$.capacity). Costs, workcentre load, promising and scheduling all
+# convert routing times through the helpers below.
+MINUTES_PER_HOUR = 60
+
+
+def operation_minutes(setup_time, runtime, qty=1):
+    # Minutes an operation takes for qty units, for numbers and pandas Series alike
+    return setup_time + runtime * qty
+
+
+def operation_hours(setup_time, runtime, qty=1):
+    return operation_minutes(setup_time, runtime, qty) / MINUTES_PER_HOUR
+
+
+def runtime_at_capacity(capacity):
+    # Minutes per unit of a workcentre that makes capacity units an hour, 0 when it has none
+    return MINUTES_PER_HOUR / capacity if capacity else 0
+
+
+# The exports mix ISO timestamps (with up to nanosecond fractions) and Excel style m/d/Y dates
+TIMESTAMP_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f", "%m/%d/%Y %H:%M", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y"]
+
+
+def parse_timestamp(value):
+    if "." in value:
+        # strptime only understands microseconds
+        head, fraction = value.rsplit(".", 1)
+        value = f"{head}.{fraction[:6]}"
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def coerce(value, sql_type):
+    value = value.strip()
+    if value == "":
+        return None
+    if sql_type == "INTEGER":
+        return int(float(value))
+    if sql_type == "REAL":
+        return float(value)
+    if sql_type == "TIMESTAMP":
+        return parse_timestamp(value)
+    return value
+
+
+def read_csv(table, data_dir, strict=True):
+    # Yields typed row tuples from the table's CSV export, one row at a time. With strict=False a
+    # value that does not convert to its column's type is passed on as text, for the caller to
+    # report, instead of stopping the whole file.
+    def convert(value, sql_type):
+        try:
+            return coerce(value, sql_type)
+        except ValueError:
+            if strict:
+                raise
+            return value.strip()
+
+    path = os.path.join(data_dir, table.csv_file)
+    names = [name for name, _ in table.columns]
+    types = [sql_type for _, sql_type in table.columns]
+    text_index = names.index(table.text_column) if table.text_column else None
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if header != names:
+            raise ValueError(f"{table.csv_file} has columns {header}, expected {names}")
+
+        for fields in reader:
+            if not fields:
+                continue
+            extra = len(fields) - len(names)
+            if extra > 0 and text_index is not None:
+                # Unquoted commas inside the description spill into extra fields
+                fields[text_index:text_index + extra + 1] = [",".join(fields[text_index:text_index + extra + 1])]
+            if len(fields) != len(names):
+                raise ValueError(f"{table.csv_file}: expected {len(names)} fields, got {len(fields)}: {fields}")
+            yield tuple(convert(value, sql_type) for value, sql_type in zip(fields, types))
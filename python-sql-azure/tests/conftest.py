@@ -0,0 +1,28 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The tests run the API in process on the SQLite backend, loaded from the showcase CSV files into
+# a database of their own:
+#   cd python-sql-azure
+#   python -m pytest tests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="mso-tests-"), "mso.sqlite3")
+os.environ["SQLITE_RESEED"] = "1"
+
+
+@pytest.fixture(scope="session")
+def main():
+    import main
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(main):
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import pytest
+
+from asof import AsOfIndex
+
+# GET /BOM/{part_id}/asof after writes: the as-of index takes the written rows over without
+# reading the tables again, and ends up the same as an index loaded from the tables.
+
+PART = {"part_name": "As-of test", "POM": "make", "UOM": "each", "part_description": "As-of test part", "inventory": 0, "unit_cost": 1, "lead_time": 1, "part_last_updated": "2023-06-01T00:00:00"}
+
+
+def create_part(client):
+    response = client.post("/partmasterrecords", json=PART)
+    assert response.status_code == 200, response.text
+    return response.json()["data"]["part_id"]
+
+
+def as_of(client, part_id, at=None):
+    response = client.get(f"/BOM/{part_id}/asof", params={"at": at} if at else None)
+    assert response.status_code == 200, response.text
+    return response.json()["value"]
+
+
+@pytest.fixture
+def loads(main, monkeypatch):
+    # Counts the tables the as-of index reads from the database
+    loaded = []
+    for index in (main.as_of_index.bom, main.as_of_index.routings, main.as_of_index.workcentres):
+        monkeypatch.setattr(index, "load", lambda rows, index=index, load=index.load: (loaded.append(index.table), load(rows)))
+    return loaded
+
+
+def test_writes_update_the_index(main, client, loads):
+    assembly_id, part_id = create_part(client), create_part(client)
+    bom = {"part_id": assembly_id, "child_id": part_id, "child_qty": 2, "child_leadtime": 1, "BOM_last_updated": "2023-06-01T00:00:00"}
+    created = client.post("/BOM", json=bom).json()["data"]
+    BOM_id, at = created["BOM_id"], created["BOM_last_updated"]  # stamped with the time it was created
+    routing = {"BOM_id": BOM_id, "operations_sequence": 1, "workcentre_id": "WC002", "setup_time": 30, "runtime": 6, "routings_last_update": "2023-06-01T00:00:00"}
+    routing_id = client.post("/routings", json=routing).json()["data"]["routing_id"]
+    [line] = as_of(client, assembly_id, at)
+    assert (line["BOM_id"], line["child_qty"], line["status"]) == (BOM_id, 2, "active")
+    assert [r["routing_id"] for r in line["routings"]] == [routing_id]
+
+    loads.clear()
+    response = client.put(f"/BOM/{BOM_id}", json={**bom, "child_qty": 3, "BOM_last_updated": "2099-01-01T00:00:00"})
+    new_BOM_id = response.json()["BOM_data"]["BOM_id"]
+    response = client.put(f"/routings/{routing_id}", json={**routing, "BOM_id": new_BOM_id, "setup_time": 20, "routings_last_update": "2099-01-01T00:00:00"})
+    new_routing_id = response.json()["data"]["routing_id"]
+
+    [line] = as_of(client, assembly_id, at)
+    assert (line["BOM_id"], line["child_qty"], line["status"]) == (BOM_id, 2, "NA")
+    assert [(r["routing_id"], r["status"]) for r in line["routings"]] == [(routing_id, "NA")]
+    [line] = as_of(client, assembly_id, "2099-06-01T00:00:00")
+    assert (line["BOM_id"], line["child_qty"], line["status"]) == (new_BOM_id, 3, "active")
+    assert [(r["routing_id"], r["setup_time"]) for r in line["routings"]] == [(new_routing_id, 20)]
+    assert loads == []
+
+    # The same answers as an index read from the tables
+    index = AsOfIndex()
+    with main.pool.connection() as connection:
+        index.refresh(connection)
+    for moment in (datetime.fromisoformat(at), datetime(2099, 6, 1)):
+        assert index.structure(assembly_id, moment) == main.as_of_index.structure(assembly_id, moment)
+
+
+def test_deleted_rows_leave_the_index(main, client):
+    bom = {"part_id": create_part(client), "child_id": create_part(client), "child_qty": 1, "child_leadtime": 1, "BOM_last_updated": "2023-06-01T00:00:00"}
+    BOM_id = client.post("/BOM", json=bom).json()["data"]["BOM_id"]
+    assert [line["BOM_id"] for line in as_of(client, bom["part_id"])] == [BOM_id]
+
+    assert client.delete(f"/bom/{BOM_id}").status_code == 200
+    assert client.get(f"/BOM/{bom['part_id']}/asof").status_code == 404
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from atp import Promising
+from bom_graph import BomGraph
+
+# Available/capable-to-promise checks. A is made from 2 C (row lead time 3 days) with one hour of
+# setup and one hour per unit on WC1; D only loads WC1. 2023-08-07 is a Monday.
+
+MONDAY = datetime(2023, 8, 7)
+
+
+@pytest.fixture
+def promising():
+    promising = Promising(BomGraph(), hours_per_day=8, days_per_week=5)
+    promising.inventory = {"A": 5, "C": 0, "D": 0}
+    promising.lead_times = {"A": 2, "C": 4, "D": 0}
+    promising.children = {"A": [("C", 2, 3)]}
+    promising.operations = {"A": [("WC1", 60, 60)], "D": [("WC1", 0, 60)]}
+    return promising
+
+
+def test_from_stock(promising):
+    promise = promising.check("A", 3, MONDAY, MONDAY + timedelta(days=1))
+    assert promise["promisable"]
+    assert (promise["available_qty"], promise["shortage"], promise["supply_lead_time"]) == (5, 0, 0)
+    assert promise["capacity"] == [{"workcentre_id": "WC1", "required_hours": 4, "free_hours": 16}]
+
+
+def test_committed_stock_and_lead_times(promising):
+    promising.add_order("O1", "A", 4, MONDAY + timedelta(days=1))
+    promise = promising.check("A", 3, MONDAY, MONDAY + timedelta(days=1))
+    # 1 left in stock, the other 2 take A's 2 days plus 3 days for the 4 C
+    assert not promise["promisable"]
+    assert (promise["available_qty"], promise["shortage"], promise["supply_lead_time"]) == (1, 2, 5)
+    assert promise["earliest_date"] == (MONDAY + timedelta(days=5)).isoformat()
+    assert promise["capacity"][0]["free_hours"] == 16 - 5
+
+    assert promising.check("A", 3, MONDAY, MONDAY + timedelta(days=7))["promisable"]
+    promising.remove_order("O1")
+    assert promising.check("A", 3, MONDAY, MONDAY + timedelta(days=1))["available_qty"] == 5
+
+
+def test_workcentre_load(promising):
+    promising.add_order("O2", "D", 4, MONDAY)
+    promise = promising.check("A", 5, MONDAY, MONDAY)
+    assert promise["capacity"] == [{"workcentre_id": "WC1", "required_hours": 6, "free_hours": 4}]
+    assert promise["shortage"] == 0 and not promise["promisable"]
+
+
+def test_order_endpoint(client):
+    part = {"part_name": "ATP test", "POM": "buy", "UOM": "each", "part_description": "ATP test part", "inventory": 0, "unit_cost": 1, "lead_time": 30, "part_last_updated": "2023-06-01T00:00:00"}
+    part_id = client.post("/partmasterrecords", json=part).json()["data"]["part_id"]
+    order = {"part_id": part_id, "part_qty": 2, "order_date": "2098-06-02T00:00:00", "due_date": "2098-06-03T00:00:00", "order_last_updated": "2098-06-01T00:00:00"}
+
+    response = client.post("/orders", params={"atp": "true"}, json=order)
+    assert response.status_code == 409
+    assert response.json()["detail"]["earliest_date"] == "2098-07-02T00:00:00"
+
+    response = client.post("/orders", params={"atp": "true"}, json={**order, "due_date": "2098-08-01T00:00:00"})
+    assert response.status_code == 200, response.text
+    assert response.json()["atp"]["promisable"]
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from backends import SqliteBackend, create_backend
+from tables import TABLES, read_csv
+
+# The SQLite stand-in backend on a database file of its own, seeded from the showcase CSV files.
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..")
+
+
+@pytest.fixture(scope="module")
+def backend(tmp_path_factory):
+    backend = SqliteBackend(str(tmp_path_factory.mktemp("backend") / "backend.sqlite3"))
+    backend.seed(DATA_DIR)
+    return backend
+
+
+def query(backend, sql, params=()):
+    connection = backend.connect()
+    try:
+        return connection.execute(sql, params).fetchall()
+    finally:
+        connection.close()
+
+
+def test_seeded_from_the_csv_files(backend):
+    for table in TABLES.values():
+        [(count,)] = query(backend, f"SELECT COUNT(*) FROM dbo.{table.name}")
+        assert count == sum(1 for _ in read_csv(table, DATA_DIR))
+    [(order_date,)] = query(backend, backend.top("SELECT order_date FROM dbo.Orders$ ORDER BY order_id", 1))
+    assert order_date.year > 2000
+
+
+def test_reseed(backend):
+    connection = backend.connect()
+    connection.execute("DELETE FROM dbo.Workcentre$ WHERE workcentre_id = 'WC001'")
+    connection.commit()
+    connection.close()
+    backend.seed(DATA_DIR)
+    assert query(backend, "SELECT * FROM dbo.Workcentre$ WHERE workcentre_id = 'WC001'") == []
+    backend.seed(DATA_DIR, force=True)
+    assert len(query(backend, "SELECT * FROM dbo.Workcentre$ WHERE workcentre_id = 'WC001'")) == 1
+
+
+def test_ids_compare_case_insensitively(backend):
+    [(part_id,)] = query(backend, "SELECT part_id FROM dbo.Part_Master_Records$ WHERE part_id = ?", ("p001",))
+    assert part_id == "P001"
+
+
+def test_query_timeout(backend):
+    connection = backend.connect()
+    backend.set_query_timeout(connection, 0.05)
+    started = time.monotonic()
+    with pytest.raises(sqlite3.OperationalError):
+        connection.execute("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n").fetchall()
+    assert time.monotonic() - started < 5
+    backend.set_query_timeout(connection, None)
+    assert connection.execute("SELECT 1").fetchall() == [(1,)]
+    connection.close()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_backend("oracle")
@@ -0,0 +1,43 @@
+# BOM writes match part ids case-insensitively, like the database does, also in the cycle checks
+# that run against the in-memory BOM index.
+
+PART = {"part_name": "BOM test", "POM": "make", "UOM": "each", "part_description": "BOM test part", "unit_cost": 1, "inventory": 0, "lead_time": 1, "part_last_updated": "2023-06-01T00:00:00"}
+
+
+def create_part(client):
+    response = client.post("/partmasterrecords", json=PART)
+    assert response.status_code == 200, response.text
+    return response.json()["data"]["part_id"]
+
+
+def bom(part_id, child_id):
+    return {"part_id": part_id, "child_id": child_id, "child_qty": 1, "child_leadtime": 1, "BOM_last_updated": "2023-06-01T00:00:00"}
+
+
+def test_cycle_through_lower_case_ids_is_refused(client):
+    parent_id, child_id = create_part(client), create_part(client)
+    created = client.post("/BOM", json=bom(parent_id, child_id)).json()
+    assert created["data"]["part_id"] == parent_id
+
+    refused = client.post("/BOM", json=bom(child_id.lower(), parent_id.lower())).json()
+    assert refused["status_code"] == 400
+    assert "both a parent and a child" in refused["detail"]
+
+    updated = client.put(f"/BOM/{created['data']['BOM_id']}", json=bom(child_id.lower(), parent_id.lower())).json()
+    assert "both a parent and a child" in updated["error"]
+    assert client.get(f"/BOM/{child_id}/descendants").json()["descendants"] == []
+
+
+def test_ids_are_stored_as_the_part_master_has_them(client):
+    parent_id, child_id = create_part(client), create_part(client)
+    created = client.post("/BOM", json=bom(parent_id.lower(), child_id.lower())).json()
+    assert (created["data"]["part_id"], created["data"]["child_id"]) == (parent_id, child_id)
+    assert child_id in client.get(f"/BOM/{parent_id}/descendants").json()["descendants"]
+
+    updated = client.put(f"/BOM/{created['data']['BOM_id']}", json=bom(parent_id.lower(), child_id.lower())).json()
+    assert (updated["BOM_data"]["part_id"], updated["BOM_data"]["child_id"]) == (parent_id, child_id)
+
+
+def test_unknown_parts_are_refused(client):
+    part_id = create_part(client)
+    assert client.post("/BOM", json=bom(part_id, "NO-SUCH-PART")).json()["status_code"] == 400
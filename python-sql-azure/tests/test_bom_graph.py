@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+from bom_graph import BomGraph, BomLine
+
+
+def graph(edges):
+    bom_graph = BomGraph()
+    for i, (part_id, child_id) in enumerate(edges):
+        bom_graph.add_line(BomLine(f"B{i:03d}", part_id, child_id, 1, 0, "active"))
+    return bom_graph
+
+
+def brute_force_cycles(existing, batch):
+    # An edge closes a cycle when its child reaches its parent once every edge is in
+    children = {}
+    for part_id, child_id in existing + batch:
+        children.setdefault(part_id, set()).add(child_id)
+
+    def reaches(source, target):
+        seen, stack = set(), [source]
+        while stack:
+            for child in children.get(stack.pop(), ()):
+                if child == target:
+                    return True
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        return False
+
+    return [position for position, (part_id, child_id) in enumerate(batch) if part_id == child_id or reaches(child_id, part_id)]
+
+
+def test_edge_between_two_new_cycles_is_not_flagged():
+    bom_graph = graph([("P3", "P1")])
+    assert bom_graph.batch_cycles([("P1", "P3"), ("P7", "P5"), ("P5", "P7"), ("P1", "P5")]) == [0, 1, 2]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_cycles_match_brute_force(seed):
+    rng = random.Random(seed)
+    for _ in range(300):
+        parts = [f"P{i}" for i in range(rng.randint(2, 10))]
+        existing = [(rng.choice(parts), rng.choice(parts)) for _ in range(rng.randint(0, 12))]
+        batch = [(rng.choice(parts), rng.choice(parts)) for _ in range(rng.randint(1, 8))]
+        bom_graph = graph(existing)
+        if rng.random() < 0.5:
+            # Also through the closure a bulk rebuild makes, as after a removed edge
+            bom_graph.all.rebuild()
+        assert bom_graph.batch_cycles(batch) == brute_force_cycles(existing, batch), (existing, batch)
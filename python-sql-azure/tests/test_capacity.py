@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import capacity
+import mrp
+
+# Workcentre load of hand-made orders: P1 runs 30 minutes of setup and 10 minutes per unit on
+# WC1 (6 units an hour); 2023-08-07 is a Monday.
+
+BOM = pd.DataFrame([("B1", "P1", "C1", 1, 0)], columns=mrp.BOM_COLUMNS)
+ROUTINGS = pd.DataFrame([("B1", "WC1", 30, 10)], columns=capacity.ROUTING_COLUMNS)
+WORKCENTRES = pd.DataFrame([("WC1", "Cutting", 6, "units/hour", "active")], columns=capacity.WORKCENTRE_COLUMNS)
+ORDERS = pd.DataFrame(
+    [
+        ("O1", "P1", 3, datetime(2023, 8, 7, 12)),
+        ("O2", "P1", 6, datetime(2023, 8, 7, 15)),
+        ("O3", "P1", 12, datetime(2023, 8, 9)),
+        ("O4", "C1", 5, datetime(2023, 8, 9)),   # no routings
+        ("O5", "P1", 5, None),                  # no due date
+    ],
+    columns=mrp.ORDER_COLUMNS,
+)
+
+
+def test_daily_load():
+    load = capacity.workcentre_load(ORDERS, BOM, ROUTINGS, WORKCENTRES, "day", hours_per_day=8)
+    assert load["bucket"].dt.strftime("%Y-%m-%d").tolist() == ["2023-08-07", "2023-08-09"]
+    assert load["operations"].tolist() == [2, 1]
+    assert load["units"].tolist() == [9, 12]
+    assert load["required_hours"].tolist() == pytest.approx([(60 + 90) / 60, 150 / 60])
+    assert load["utilization"].tolist() == pytest.approx([2.5 / 8, 2.5 / 8])
+    assert load["capacity_utilization"].tolist() == pytest.approx([9 / 48, 12 / 48])
+
+
+def test_weekly_load():
+    load = capacity.workcentre_load(ORDERS, BOM, ROUTINGS, WORKCENTRES, "week", hours_per_day=8, days_per_week=5)
+    [week] = load.to_dict("records")
+    assert week["bucket"] == pd.Timestamp(2023, 8, 7)
+    assert (week["operations"], week["units"], week["available_hours"]) == (3, 21, 40)
+    assert week["required_hours"] == pytest.approx(5)
+
+
+def test_load_endpoint(client):
+    body = client.get("/workcentre/load", params={"bucket": "week"}).json()
+    assert body["bucket"] == "week"
+    assert all(row["required_hours"] >= 0 for row in body["value"])
+    workcentre_id = body["value"][0]["workcentre_id"]
+    only = client.get("/workcentre/load", params={"bucket": "week", "workcentre_id": workcentre_id.lower()}).json()["value"]
+    assert only and {row["workcentre_id"] for row in only} == {workcentre_id}
+    assert client.get("/workcentre/load", params={"bucket": "month"}).status_code == 422
@@ -0,0 +1,38 @@
+from io import BytesIO
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+# GET /export/{table} in the Arrow IPC stream and Parquet formats.
+
+
+def count(main, table):
+    with main.pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM dbo.{table}")
+        return cursor.fetchone()[0]
+
+
+def test_arrow(main, client):
+    response = client.get("/export/orders", params={"format": "arrow"})
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == count(main, "Orders$")
+    assert table.schema.field("part_qty").type == pa.int64()
+    assert table.schema.field("due_date").type == pa.timestamp("us")
+
+
+def test_parquet(main, client):
+    response = client.get("/export/BOM", params={"format": "parquet"})
+    assert response.headers["content-disposition"] == "attachment; filename=export_BOM.parquet"
+    table = pq.read_table(BytesIO(response.content))
+    assert table.num_rows == count(main, "BOM$")
+    assert table.column_names[:3] == ["BOM_id", "part_id", "child_id"]
+    assert table.schema.field("child_qty").type == pa.float64()
+
+
+def test_unknown_table_or_format(client):
+    assert client.get("/export/nothing").status_code == 404
+    assert client.get("/export/orders", params={"format": "xlsx"}).status_code == 400
@@ -0,0 +1,41 @@
+import csv
+import gzip
+from io import StringIO
+
+from streaming import stream_csv
+
+# The /orders and /workcentre CSV exports, plain and gzip encoded.
+
+
+def count(main, table):
+    with main.pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM dbo.{table}")
+        return cursor.fetchone()[0]
+
+
+def test_orders_export(main, client):
+    response = client.get("/orders", headers={"Accept-Encoding": "identity"})
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "content-encoding" not in response.headers
+    header, *rows = csv.reader(StringIO(response.text))
+    assert header[:3] == ["order_id", "part_id", "part_qty"]
+    assert len(rows) == count(main, "Orders$")
+
+
+def test_workcentre_export_gzip(main, client):
+    response = client.get("/workcentre", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-disposition"].startswith("attachment; filename=")
+    header, *rows = csv.reader(StringIO(response.text))
+    assert header[0] == "workcentre_id"
+    assert len(rows) == count(main, "Workcentre$")
+
+
+def test_chunks(main):
+    # The header comes first on its own, then the rows a few at a time
+    chunks = list(stream_csv(main.pool, main.backend, "SELECT order_id FROM dbo.Orders$ ORDER BY order_id", chunk_size=100))
+    assert chunks[0] == b"order_id\n"
+    assert len(chunks) == 1 + -(-count(main, "Orders$") // 100)
+    compressed = b"".join(stream_csv(main.pool, main.backend, "SELECT order_id FROM dbo.Orders$ ORDER BY order_id", chunk_size=100, compress=True))
+    assert gzip.decompress(compressed) == b"".join(chunks)
@@ -0,0 +1,107 @@
+import json
+from collections import Counter
+
+import pytest
+
+from bom_graph import BomGraph, BomLine
+
+# GET /BOM/{part_id}/explode against a plain recursion over the active BOM rows
+
+
+def active_children(client):
+    children = {}
+    for row in client.get("/BOM", params={"$top": 100000}).json()["value"]:
+        if (row["status"] or "").lower() == "active":
+            children.setdefault(row["part_id"], []).append(row)
+    return children
+
+
+def reaches(children, source, target):
+    seen, stack = set(), [source]
+    while stack:
+        for row in children.get(stack.pop(), ()):
+            if row["child_id"] == target:
+                return True
+            if row["child_id"] not in seen:
+                seen.add(row["child_id"])
+                stack.append(row["child_id"])
+    return False
+
+
+def recursive_explosion(children, part_id, qty, depth, level=1):
+    rows = []
+    for row in sorted(children.get(part_id, ()), key=lambda row: row["BOM_id"]):
+        if row["child_id"] == part_id or reaches(children, row["child_id"], part_id):
+            continue
+        extended = qty * (row["child_qty"] or 0)
+        rows.append((level, row["BOM_id"], part_id, row["child_id"], pytest.approx(extended)))
+        if depth is None or level < depth:
+            rows.extend(recursive_explosion(children, row["child_id"], extended, depth, level + 1))
+    return rows
+
+
+@pytest.mark.parametrize("part_id", ["P001", "P002", "P010"])
+@pytest.mark.parametrize("depth", [None, 1, 2])
+def test_explosion_quantities_and_depth(client, part_id, depth):
+    params = {"qty": 3}
+    if depth is not None:
+        params["depth"] = depth
+    body = client.get(f"/BOM/{part_id}/explode", params=params).json()
+    rows = [(row["level"], row["BOM_id"], row["part_id"], row["child_id"], row["extended_qty"]) for row in body["value"]]
+    assert rows == recursive_explosion(active_children(client), part_id, 3, depth)
+
+
+def test_streamed_explosion_matches(client):
+    body = client.get("/BOM/P001/explode", params={"qty": 2}).json()
+    streamed = client.get("/BOM/P001/explode", params={"qty": 2, "stream": True})
+    assert streamed.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in streamed.text.splitlines()] == body["value"]
+
+
+def test_unknown_part(client):
+    response = client.get("/BOM/NO-SUCH-PART/explode")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Part not found"
+
+
+def test_part_id_in_another_case(client):
+    body = client.get("/BOM/p001/explode").json()
+    assert body["part_id"] == "P001"
+    assert body["value"] == client.get("/BOM/P001/explode").json()["value"]
+
+
+def test_shared_sub_assembly_is_walked_once():
+    # A uses the sub-assembly D through both B and C
+    bom_graph = BomGraph()
+    for BOM_id, part_id, child_id, child_qty in [("B1", "A", "B", 2), ("B2", "A", "C", 3), ("B3", "B", "D", 5), ("B4", "C", "D", 7), ("B5", "D", "E", 11)]:
+        bom_graph.add_line(BomLine(BOM_id, part_id, child_id, child_qty, 0, "active"))
+    walked = Counter()
+    child_rows = bom_graph.child_rows
+
+    def counting_child_rows(part_id):
+        walked[part_id] += 1
+        return child_rows(part_id)
+
+    bom_graph.child_rows = counting_child_rows
+    assert list(bom_graph.explode("A", 10)) == [
+        (1, "B1", "A", "B", 2, 20),
+        (2, "B3", "B", "D", 5, 100),
+        (3, "B5", "D", "E", 11, 1100),
+        (1, "B2", "A", "C", 3, 30),
+        (2, "B4", "C", "D", 7, 210),
+        (3, "B5", "D", "E", 11, 2310),
+    ]
+    assert walked["D"] == 1
+    assert list(bom_graph.explode("A", 1, depth=2)) == [
+        (1, "B1", "A", "B", 2, 2),
+        (2, "B3", "B", "D", 5, 10),
+        (1, "B2", "A", "C", 3, 3),
+        (2, "B4", "C", "D", 7, 21),
+    ]
+
+    # Replayed from the memo, and walked again after a change
+    walked.clear()
+    list(bom_graph.explode("A", 1))
+    assert sum(walked.values()) == 0
+    bom_graph.add_line(BomLine("B6", "D", "F", 1, 0, "active"))
+    assert [row[3] for row in bom_graph.explode("C")] == ["D", "E", "F"]
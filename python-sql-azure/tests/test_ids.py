@@ -0,0 +1,77 @@
+import threading
+
+from ids import IdAllocator
+
+# Every process has an IdAllocator of its own on the shared counters; two of them stand in for two
+# processes here.
+
+
+def test_allocators_never_share_an_id(main):
+    allocators = [IdAllocator(main.backend, block_size=7), IdAllocator(main.backend, block_size=3)]
+    for allocator in allocators:
+        allocator.initialize()
+    ids = [[] for _ in range(4)]
+
+    def allocate(allocator, out):
+        for i in range(150):
+            if i % 10 == 0:
+                out.extend(allocator.next_ids("Orders$", 4))
+            else:
+                out.append(allocator.next_id("Orders$"))
+
+    threads = [threading.Thread(target=allocate, args=(allocators[i % 2], ids[i])) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    every_id = [id_ for out in ids for id_ in out]
+    assert len(every_id) == 4 * (135 + 15 * 4)
+    assert len(set(every_id)) == len(every_id)
+
+
+def test_new_ids_are_not_in_the_table(main, client):
+    allocator = IdAllocator(main.backend, block_size=5)
+    allocator.initialize()
+    new_ids = allocator.next_ids("Orders$", 20)
+    with main.pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT order_id FROM dbo.Orders$")
+        existing = {order_id.upper() for order_id, in cursor.fetchall() if order_id}
+    assert not existing & {id_.upper() for id_ in new_ids}
+
+
+def bom(part_id, child_id):
+    return {"part_id": part_id, "child_id": child_id, "child_qty": 1, "child_leadtime": 1, "BOM_last_updated": "2023-06-01T00:00:00"}
+
+
+def number(id_):
+    return int(id_.lstrip("BRWC"))
+
+
+def test_refused_requests_use_up_no_id(client):
+    # Ids are handed out in order within the process, so a refused request in between would
+    # show as a gap
+    part = {"part_name": "Id test", "POM": "make", "UOM": "each", "part_description": "Id test part", "unit_cost": 1, "inventory": 0, "lead_time": 1, "part_last_updated": "2023-06-01T00:00:00"}
+    parent_id, child_id, other_id = (client.post("/partmasterrecords", json=part).json()["data"]["part_id"] for _ in range(3))
+    first = client.post("/BOM", json=bom(parent_id, child_id)).json()["data"]
+    assert client.post("/BOM", json=bom(parent_id, child_id)).json()["status_code"] == 400
+    assert client.post("/BOM", json=bom(child_id, parent_id)).json()["status_code"] == 400
+    assert client.post("/BOM", json=bom(parent_id, "NO-SUCH-PART")).json()["status_code"] == 400
+    assert "error" in client.put(f"/BOM/{first['BOM_id']}", json=bom(child_id, parent_id)).json()
+    assert "error" in client.put("/BOM/B999999", json=bom(parent_id, other_id)).json()
+    second = client.post("/BOM", json=bom(parent_id, other_id)).json()["data"]
+    assert number(second["BOM_id"]) == number(first["BOM_id"]) + 1
+
+
+def test_updating_an_unknown_routing_or_workcentre_uses_up_no_id(client):
+    routing = {"BOM_id": "B001", "operations_sequence": 1, "workcentre_id": "WC001", "routings_last_update": "2023-06-01T00:00:00"}
+    first = client.post("/routings", json=routing).json()["data"]["routing_id"]
+    assert client.put("/routings/R999999", json=routing).status_code == 404
+    second = client.put(f"/routings/{first}", json=routing).json()["data"]["routing_id"]
+    assert number(second) == number(first) + 1
+
+    workcentre = {"workcentre_name": "Id test", "capacity_unit": "hours", "cost_rate_h": 1, "workcentre_description": "Id test", "capacity": 8, "workcentre_last_updated": "2023-06-01T00:00:00"}
+    first = client.post("/workcentre", json=workcentre).json()["data"]["workcentre_id"]
+    assert client.put("/workcentre/WC999999", json=workcentre).status_code == 404
+    second = client.put(f"/workcentre/{first}", json=workcentre).json()["data"]["workcentre_id"]
+    assert number(second) == number(first) + 1
@@ -0,0 +1,98 @@
+import csv
+import threading
+import time
+from io import StringIO
+
+import pytest
+
+import jobs
+
+# Background jobs through the API (submit, poll until done, fetch the result) and the queue on
+# its own.
+
+
+def wait(client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        info = client.get(f"/jobs/{job_id}").json()
+        if info["status"] not in ("queued", "running") or time.monotonic() > deadline:
+            return info
+        time.sleep(0.05)
+
+
+def test_cost_rollup_job(client):
+    response = client.post("/jobs/costs")
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    info = wait(client, job_id)
+    assert (info["status"], info["progress"]) == ("succeeded", 1)
+    value = client.get(f"/jobs/{job_id}/result").json()["value"]
+    assert value == client.get("/costs/rollup").json()["value"]
+
+    # The same job again, with no writes in between, is the finished one
+    again = client.post("/jobs/costs").json()
+    assert (again["job_id"], again["reused"]) == (job_id, True)
+    assert job_id in [job["job_id"] for job in client.get("/jobs").json()["value"]]
+
+
+def test_export_job(main, client):
+    job_id = client.post("/jobs/export/workcentre").json()["job_id"]
+    assert wait(client, job_id)["status"] == "succeeded"
+    response = client.get(f"/jobs/{job_id}/result")
+    assert response.headers["content-type"].startswith("text/csv")
+    header, *rows = csv.reader(StringIO(response.text))
+    with main.pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM dbo.Workcentre$")
+        assert len(rows) == cursor.fetchone()[0]
+
+
+def test_unknown_jobs(client):
+    assert client.get("/jobs/no-such-job").status_code == 404
+    assert client.get("/jobs/no-such-job/result").status_code == 404
+    assert client.delete("/jobs/no-such-job").status_code == 404
+    assert client.post("/jobs/export/nothing").status_code == 404
+
+
+@pytest.fixture
+def queue(main):
+    queue = jobs.JobQueue(main.pool, main.backend, lambda tables: (), max_workers=1, max_queued=1)
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(connection, job, n):
+        started.set()
+        while not release.wait(0.01):
+            job.progress(0.5)
+        return jobs.JobOutput("text/plain", str(n).encode())
+
+    def failing(connection, job):
+        raise ValueError("no good")
+
+    queue.register("blocking", [], blocking)
+    queue.register("failing", [], failing)
+    yield queue, started, release
+    release.set()
+
+
+def test_queue_cancel_and_limits(queue):
+    queue, started, release = queue
+    running, _ = queue.submit("blocking", {"n": 1})
+    assert started.wait(5)
+    queued, _ = queue.submit("blocking", {"n": 2})
+    with pytest.raises(jobs.QueueFull):
+        queue.submit("blocking", {"n": 3})
+
+    # The queued job never starts, the running one stops at its next progress() call
+    assert queue.cancel(queued.job_id).status == jobs.CANCELLED
+    queue.cancel(running.job_id)
+    running.future.result(5)
+    assert running.status == jobs.CANCELLED and running.output is None
+
+
+def test_queue_failure(queue):
+    queue, _, _ = queue
+    job, _ = queue.submit("failing", {})
+    job.future.result(5)
+    assert (job.status, job.error) == (jobs.FAILED, "no good")
+    # A failed job is not reused
+    assert queue.submit("failing", {})[1] is False
@@ -0,0 +1,66 @@
+import pytest
+
+# POST /mrp/run on a two-level structure of new parts, small enough to net by hand: the parent
+# (10 in stock, lead time 5 days) needs 2 of the child (4 in stock) per unit, 3 days ahead.
+
+PART = {"part_name": "MRP test", "POM": "make", "UOM": "each", "part_description": "MRP test part", "unit_cost": 1, "part_last_updated": "2023-06-01T00:00:00"}
+
+
+def create_part(client, inventory, lead_time):
+    response = client.post("/partmasterrecords", json={**PART, "inventory": inventory, "lead_time": lead_time})
+    assert response.status_code == 200, response.text
+    return response.json()["data"]["part_id"]
+
+
+@pytest.fixture(scope="module")
+def structure(client):
+    parent_id = create_part(client, 10, 5)
+    child_id = create_part(client, 4, 2)
+    response = client.post("/BOM", json={"part_id": parent_id, "child_id": child_id, "child_qty": 2, "child_leadtime": 3, "BOM_last_updated": "2023-06-01T00:00:00", "status": "active"})
+    assert response.status_code == 200, response.text
+    for qty, due_date in [(6, "2023-08-10"), (8, "2023-08-20"), (5, "2023-08-20")]:
+        order = {"part_id": parent_id, "part_qty": qty, "order_date": "2023-06-01T00:00:00", "due_date": f"{due_date}T00:00:00", "order_last_updated": "2023-06-01T00:00:00"}
+        response = client.post("/orders", json=order)
+        assert response.status_code == 200, response.text
+    return parent_id, child_id
+
+
+def plan_rows(client, part_ids, **params):
+    response = client.post("/mrp/run", params=params)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    rows = [
+        (row["llc"], row["part_id"], row["due_date"], row["gross_qty"], row["projected_on_hand"], row["net_qty"], row["release_date"])
+        for row in body["value"] if row["part_id"] in part_ids
+    ]
+    return body, rows
+
+
+@pytest.mark.parametrize("mode", ["regenerative", "net_change"])
+def test_daily_plan(client, structure, mode):
+    parent_id, child_id = structure
+    body, rows = plan_rows(client, structure, bucket="day", mode=mode)
+    assert body["bucket"] == "day" and body["mode"] == mode
+    assert rows == [
+        (0, parent_id, "2023-08-10", 6, 4, 0, "2023-08-05"),
+        (0, parent_id, "2023-08-20", 13, 0, 9, "2023-08-15"),
+        (1, child_id, "2023-08-15", 18, 0, 14, "2023-08-12"),
+    ]
+
+
+def test_weekly_plan(client, structure):
+    # Requirements are gathered on the Monday of their week
+    parent_id, child_id = structure
+    _, rows = plan_rows(client, structure, bucket="week")
+    assert rows == [
+        (0, parent_id, "2023-08-07", 6, 4, 0, "2023-08-02"),
+        (0, parent_id, "2023-08-14", 13, 0, 9, "2023-08-09"),
+        (1, child_id, "2023-08-07", 18, 0, 14, "2023-08-04"),
+    ]
+
+
+def test_planned_only(client, structure):
+    body, rows = plan_rows(client, structure, bucket="day", planned_only=True)
+    assert [row[2] for row in rows] == ["2023-08-20", "2023-08-15"]
+    assert all(row["net_qty"] > 0 for row in body["value"])
+    assert body["planned_orders"] == len(body["value"])
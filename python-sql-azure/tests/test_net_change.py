@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+
+import pytest
+
+# mode=net_change keeps its plan between runs and only replans what writes touched, so after any
+# write it must still return exactly what mode=regenerative plans from scratch.
+
+ORDER = {"part_id": "P001", "part_qty": 5, "order_date": "2023-06-01T00:00:00", "due_date": "2023-09-15T00:00:00", "order_last_updated": "2023-06-01T00:00:00"}
+
+
+def plan(client, mode, bucket):
+    response = client.post("/mrp/run", params={"bucket": bucket, "mode": mode})
+    assert response.status_code == 200, response.text
+    return sorted(
+        (row["part_id"], row["due_date"], round(row["gross_qty"], 6), round(row["projected_on_hand"], 6), round(row["net_qty"], 6), row["release_date"])
+        for row in response.json()["value"]
+    )
+
+
+def assert_plans_match(client):
+    for bucket in ("day", "week"):
+        assert plan(client, "net_change", bucket) == plan(client, "regenerative", bucket)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def generated(client):
+    # The first net-change run generates the plan, the writes of the tests then change it
+    assert_plans_match(client)
+
+
+def active_bom_rows(client):
+    rows = client.get("/BOM", params={"$top": 100000}).json()["value"]
+    return [row for row in rows if (row["status"] or "").lower() == "active"]
+
+
+def test_create_orders(client):
+    for part_id, due_date in [("P001", "2023-09-15T00:00:00"), ("P002", "2023-07-03T00:00:00"), ("P001", "2023-07-03T00:00:00")]:
+        response = client.post("/orders", json={**ORDER, "part_id": part_id, "due_date": due_date})
+        assert response.status_code == 200, response.text
+        assert_plans_match(client)
+
+
+def test_create_orders_bulk(client):
+    rows = [
+        {"part_id": f"P{1 + i % 12:03d}", "part_qty": 1 + i % 7, "order_date": "2023-06-01T00:00:00", "due_date": f"2024-0{1 + i % 9}-{10 + i % 18}T00:00:00"}
+        for i in range(200)
+    ]
+    body = "\n".join(json.dumps(row) for row in rows)
+    response = client.post("/orders:bulk", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200, response.text
+    assert_plans_match(client)
+
+
+def test_delete_orders(client):
+    orders = list(csv.DictReader(io.StringIO(client.get("/orders").text)))
+    for order in orders[::800]:
+        response = client.delete(f"/orders/{order['order_id']}")
+        assert response.status_code == 200, response.text
+        assert_plans_match(client)
+
+
+def test_delete_unknown_order(client):
+    order_id = client.post("/orders", json=ORDER).json()["data"]["order_id"]
+    assert_plans_match(client)
+    response = client.delete(f"/orders/{order_id}")
+    assert response.status_code == 200, response.text
+    assert_plans_match(client)
+    response = client.delete(f"/orders/{order_id}")
+    assert response.status_code == 404, response.text
+    assert response.json()["detail"] == "Order not found"
+    assert_plans_match(client)
+
+
+def test_update_bom(client):
+    for row in active_bom_rows(client)[:40:10]:
+        row["child_qty"] = (row["child_qty"] or 1) * 2
+        row["child_leadtime"] = (row["child_leadtime"] or 0) + 3
+        row["BOM_last_updated"] = "2023-06-01T00:00:00"
+        response = client.put(f"/BOM/{row['BOM_id']}", json=row)
+        assert response.status_code == 200, response.text
+        assert_plans_match(client)
+
+
+def test_import_bom(client):
+    lines = [
+        {"part_id": "P003", "child_id": "P020", "child_qty": 3, "child_leadtime": 4},
+        {"part_id": "P020", "child_id": "P025", "child_qty": 1, "child_leadtime": 2},
+    ]
+    response = client.post("/BOM:bulk", json={"lines": lines})
+    assert response.status_code == 200, response.text
+    assert_plans_match(client)
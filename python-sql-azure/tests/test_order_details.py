@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+# GET /orderdetailsfull/{order_id} and POST /orderdetailsfull:batch on orders of a new structure.
+# Its BOM row is stamped when it is created, the orders are placed in March 2098, after it.
+
+PART = {"part_name": "Details test", "POM": "make", "UOM": "each", "part_description": "Details test part", "inventory": 0, "unit_cost": 1, "lead_time": 1, "part_last_updated": "2023-06-01T00:00:00"}
+
+
+def create_part(client):
+    response = client.post("/partmasterrecords", json=PART)
+    assert response.status_code == 200, response.text
+    return response.json()["data"]["part_id"]
+
+
+@pytest.fixture(scope="module")
+def orders(client):
+    assembly_id, part_id = create_part(client), create_part(client)
+    bom = {"part_id": assembly_id, "child_id": part_id, "child_qty": 2, "child_leadtime": 1, "BOM_last_updated": "2023-06-01T00:00:00"}
+    BOM_id = client.post("/BOM", json=bom).json()["data"]["BOM_id"]
+    routing = {"BOM_id": BOM_id, "operations_sequence": 1, "workcentre_id": "WC002", "setup_time": 30, "runtime": 6, "routings_last_update": "2023-06-01T00:00:00"}
+    routing_id = client.post("/routings", json=routing).json()["data"]["routing_id"]
+    order_ids = []
+    for day in (10, 5):
+        order = {"part_id": assembly_id, "part_qty": 1, "order_date": f"2098-03-{day:02d}T00:00:00", "due_date": "2098-04-01T00:00:00", "order_last_updated": "2098-03-01T00:00:00"}
+        response = client.post("/orders", json=order)
+        assert response.status_code == 200, response.text
+        order_ids.append(response.json()["data"]["order_id"])
+    return order_ids, BOM_id, routing_id
+
+
+def test_order_details(client, orders):
+    order_ids, BOM_id, routing_id = orders
+    [row] = client.get(f"/orderdetailsfull/{order_ids[0]}").json()
+    assert row[0] == order_ids[0]
+    assert BOM_id in row and routing_id in row and "WC002" in row
+
+
+def test_batch_by_ids(client, orders):
+    order_ids, _, _ = orders
+    body = client.post("/orderdetailsfull:batch", json={"order_ids": [order_ids[1], "NO-SUCH-ORDER", order_ids[0], order_ids[1]]}).json()
+    assert [entry["order_id"] for entry in body["value"]] == [order_ids[1], "NO-SUCH-ORDER", order_ids[0]]
+    assert body["value"][1] == {"order_id": "NO-SUCH-ORDER", "error": "Order not found"}
+    for entry in body["value"][::2]:
+        assert entry["details"] == client.get(f"/orderdetailsfull/{entry['order_id']}").json()
+
+
+def test_batch_by_dates(client, orders):
+    order_ids, _, _ = orders
+    dates = {"from_date": "2098-03-01T00:00:00", "to_date": "2098-03-31T00:00:00"}
+    body = client.post("/orderdetailsfull:batch", json=dates).json()
+    # Ordered by order date
+    assert [entry["order_id"] for entry in body["value"]] == order_ids[::-1]
+    body = client.post("/orderdetailsfull:batch", json={**dates, "order_ids": [order_ids[0], "NO-SUCH-ORDER"]}).json()
+    assert [("details" in entry) for entry in body["value"]] == [True, False]
+
+
+def test_batch_stream(client, orders):
+    order_ids, _, _ = orders
+    response = client.post("/orderdetailsfull:batch", params={"stream": "true"}, json={"order_ids": order_ids})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["order_id"] for line in response.text.splitlines()] == order_ids
+    assert client.post("/orderdetailsfull:batch", json={}).status_code == 400
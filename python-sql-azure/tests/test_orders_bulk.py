@@ -0,0 +1,59 @@
+import csv
+import io
+
+# POST /orders:bulk checks every row first: without partial nothing is created when a row fails,
+# with partial=true the valid rows are created and the others reported by their position.
+
+ROWS = [
+    {"part_id": "P001", "part_qty": 3, "order_date": "2023-06-01T00:00:00", "due_date": "2023-07-01T00:00:00"},
+    {"part_id": "NO-SUCH-PART", "part_qty": 3, "order_date": "2023-06-01T00:00:00", "due_date": "2023-07-01T00:00:00"},
+    {"part_id": "p002", "part_qty": 2.5, "order_date": "2023-06-01T00:00:00", "due_date": "2023-07-01T00:00:00"},
+    {"part_id": "p002", "part_qty": 4, "order_date": "2023-06-01T00:00:00Z", "due_date": "2023-07-01T08:00:00+02:00"},
+    {"part_id": "P003", "part_qty": 1, "order_date": "2023-08-01T00:00:00", "due_date": "2023-07-01T00:00:00"},
+]
+
+
+def order_ids(client):
+    return {row["order_id"] for row in csv.DictReader(io.StringIO(client.get("/orders").text))}
+
+
+def test_invalid_rows_reject_the_upload(client):
+    before = order_ids(client)
+    response = client.post("/orders:bulk", json=ROWS)
+    assert response.status_code == 422, response.text
+    errors = response.json()["detail"]["errors"]
+    assert [error["row"] for error in errors] == [2, 3, 5]
+    assert errors[0]["errors"] == ["part_id does not exist"]
+    assert errors[1]["errors"] == ["part_qty must be a whole number"]
+    assert errors[2]["errors"] == ["order_date must be before due_date"]
+    assert order_ids(client) == before
+
+
+def test_partial_creates_the_valid_rows(client):
+    before = order_ids(client)
+    response = client.post("/orders:bulk", params={"partial": True}, json=ROWS)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert [created["row"] for created in body["created"]] == [1, 4]
+    assert [error["row"] for error in body["errors"]] == [2, 3, 5]
+    created = {created["order_id"] for created in body["created"]}
+    assert order_ids(client) == before | created
+
+    # Part ids are stored the way the part master has them, times with an offset in UTC
+    orders = {row["order_id"]: row for row in csv.DictReader(io.StringIO(client.get("/orders").text))}
+    fourth = orders[body["created"][1]["order_id"]]
+    assert fourth["part_id"] == "P002"
+    assert fourth["due_date"] == "2023-07-01 06:00:00"
+
+
+def test_csv_upload(client):
+    text = "part_id,part_qty,order_date,due_date\nP001,2,2023-06-01,2023-07-01\nP001,x,2023-06-01,2023-07-01\n"
+    response = client.post("/orders:bulk", params={"partial": True}, content=text, headers={"content-type": "text/csv"})
+    assert response.status_code == 200, response.text
+    assert len(response.json()["created"]) == 1
+    assert response.json()["errors"] == [{"row": 2, "errors": ["part_qty must be a whole number"]}]
+
+
+def test_unreadable_upload(client):
+    response = client.post("/orders:bulk", content=b"{not json", headers={"content-type": "application/json"})
+    assert response.status_code == 400
@@ -0,0 +1,47 @@
+from urllib.parse import parse_qs, urlsplit
+
+# The collection endpoints return at most $top rows, in key order, and an @odata.nextLink to the
+# page after the last key as long as there are more rows.
+
+
+def all_pages(client, path, top):
+    pages = []
+    url = f"{path}?$top={top}"
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200, response.text
+        body = response.json()
+        pages.append(body["value"])
+        next_link = body.get("@odata.nextLink")
+        if next_link:
+            parts = urlsplit(next_link)
+            url = f"{parts.path}?{parts.query}"
+        else:
+            url = None
+    return pages
+
+
+def test_next_links_walk_every_row_once(client):
+    everything = client.get("/partmasterrecords", params={"$top": 1000}).json()
+    assert "@odata.nextLink" not in everything
+    pages = all_pages(client, "/partmasterrecords", 40)
+    assert all(len(page) == 40 for page in pages[:-1])
+    assert 0 < len(pages[-1]) <= 40
+    part_ids = [row["part_id"] for page in pages for row in page]
+    assert part_ids == [row["part_id"] for row in everything["value"]]
+    assert part_ids == sorted(part_ids)
+
+
+def test_last_full_page_has_no_next_link(client):
+    count = len(client.get("/routings", params={"$top": 1000}).json()["value"])
+    body = client.get("/routings", params={"$top": count}).json()
+    assert len(body["value"]) == count
+    assert "@odata.nextLink" not in body
+
+
+def test_skiptoken_starts_after_the_key(client):
+    first = client.get("/BOM", params={"$top": 5}).json()
+    second = client.get("/BOM", params={"$top": 5, "$skiptoken": first["value"][-1]["BOM_id"]}).json()
+    assert second["value"][0]["BOM_id"] > first["value"][-1]["BOM_id"]
+    query = parse_qs(urlsplit(second["@odata.nextLink"]).query)
+    assert query == {"$top": ["5"], "$skiptoken": [second["value"][-1]["BOM_id"]]}
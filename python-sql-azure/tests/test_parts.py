@@ -0,0 +1,32 @@
+# DELETE /partmasterrecords/{part_id} refuses parts that a BOM row uses, whatever the case of the id
+
+PART = {"part_name": "Part test", "POM": "make", "UOM": "each", "part_description": "Part test part", "unit_cost": 1, "inventory": 0, "lead_time": 1, "part_last_updated": "2023-06-01T00:00:00"}
+
+
+def create_part(client):
+    response = client.post("/partmasterrecords", json=PART)
+    assert response.status_code == 200, response.text
+    return response.json()["data"]["part_id"]
+
+
+def test_delete_part(client):
+    part_id = create_part(client)
+    response = client.delete(f"/partmasterrecords/{part_id.lower()}")
+    assert response.status_code == 200, response.text
+    assert response.json() == {"message": "Part deleted successfully", "part_id": part_id}
+    assert client.delete(f"/partmasterrecords/{part_id}").status_code == 404
+
+
+def test_delete_unknown_part(client):
+    response = client.delete("/partmasterrecords/NO-SUCH-PART")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Part not found"
+
+
+def test_delete_referenced_part(client):
+    parent_id, child_id = create_part(client), create_part(client)
+    bom = {"part_id": parent_id, "child_id": child_id, "child_qty": 1, "child_leadtime": 1, "BOM_last_updated": "2023-06-01T00:00:00"}
+    assert client.post("/BOM", json=bom).json()["data"]["child_id"] == child_id
+    for part_id in (parent_id, child_id, child_id.lower()):
+        response = client.delete(f"/partmasterrecords/{part_id}")
+        assert response.status_code == 409, response.text
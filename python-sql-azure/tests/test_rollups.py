@@ -0,0 +1,46 @@
+import pytest
+
+# GET /costs/rollup/{part_id} and /leadtimes/{part_id} on a small structure of new parts: the
+# assembly uses 2 of a bought part costing 4, through a BOM row with one routing on WC002 (50 an
+# hour) of 30 minutes setup and 6 minutes run.
+
+PART = {"part_name": "Rollup test", "POM": "make", "UOM": "each", "part_description": "Rollup test part", "inventory": 0, "part_last_updated": "2023-06-01T00:00:00"}
+
+
+def create_part(client, unit_cost, lead_time):
+    response = client.post("/partmasterrecords", json={**PART, "unit_cost": unit_cost, "lead_time": lead_time})
+    assert response.status_code == 200, response.text
+    return response.json()["data"]["part_id"]
+
+
+@pytest.fixture(scope="module")
+def structure(client):
+    assembly_id, part_id = create_part(client, 1, 3), create_part(client, 4, 7)
+    bom = {"part_id": assembly_id, "child_id": part_id, "child_qty": 2, "child_leadtime": 5, "BOM_last_updated": "2023-06-01T00:00:00"}
+    BOM_id = client.post("/BOM", json=bom).json()["data"]["BOM_id"]
+    routing = {"BOM_id": BOM_id, "operations_sequence": 1, "workcentre_id": "WC002", "setup_time": 30, "runtime": 6, "routings_last_update": "2023-06-01T00:00:00"}
+    response = client.post("/routings", json=routing)
+    assert response.status_code == 200, response.text
+    return assembly_id, part_id
+
+
+def test_cost_rollup(client, structure):
+    assembly_id, part_id = structure
+    body = client.get(f"/costs/rollup/{assembly_id}").json()
+    assert body["material_cost"] == pytest.approx(2 * 4)
+    assert body["labour_cost"] == pytest.approx((30 + 6) / 60 * 50)
+    assert body["rolled_cost"] == pytest.approx(8 + 30)
+    assert [child["child_id"] for child in body["children"]] == [part_id]
+    assert client.get(f"/costs/rollup/{part_id}").json()["rolled_cost"] == pytest.approx(4)
+
+
+def test_lead_time_rollup(client, structure):
+    assembly_id, part_id = structure
+    body = client.get(f"/leadtimes/{assembly_id}").json()
+    assert body["cumulative_lead_time"] == 3 + 5
+    assert body["driving_path"] == [{"part_id": assembly_id, "lead_time": 3}, {"part_id": part_id, "lead_time": 5}]
+
+
+def test_unknown_part(client):
+    assert client.get("/costs/rollup/NO-SUCH-PART").status_code == 404
+    assert client.get("/leadtimes/NO-SUCH-PART").status_code == 404
@@ -0,0 +1,46 @@
+import pytest
+
+# POST /scenarios against the showcase data: the scenarios are evaluated in the process pool and
+# compared with the baseline.
+
+
+@pytest.fixture(scope="module")
+def evaluated(client):
+    scenarios = [
+        {"name": "unchanged"},
+        {"name": "double demand", "demand_factor": 2},
+        {"name": "WC001 down", "workcentre_availability": {"WC001": 0}},
+    ]
+    response = client.post("/scenarios", json={"scenarios": scenarios})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return body["baseline"], {scenario["name"]: scenario for scenario in body["scenarios"]}
+
+
+def test_unchanged(evaluated):
+    baseline, scenarios = evaluated
+    assert scenarios["unchanged"]["kpis"] == baseline
+    assert all(change == 0 for section in scenarios["unchanged"]["delta"].values() for change in section.values())
+
+
+def test_demand_factor(evaluated):
+    baseline, scenarios = evaluated
+    delta = scenarios["double demand"]["delta"]
+    assert delta["material"]["planned_qty"] > 0
+    assert delta["capacity"]["required_hours"] > 0
+    assert delta["schedule"]["scheduled_orders"] == 0
+
+
+def test_workcentre_down(evaluated):
+    baseline, scenarios = evaluated
+    kpis = scenarios["WC001 down"]["kpis"]
+    assert kpis["workcentres"]["WC001"]["peak_utilization"] is None
+    assert kpis["schedule"]["blocked_orders"] > 0
+    assert kpis["schedule"]["scheduled_orders"] + kpis["schedule"]["blocked_orders"] == baseline["schedule"]["scheduled_orders"]
+    assert kpis["material"] == baseline["material"]
+
+
+def test_invalid_requests(client):
+    assert client.post("/scenarios", json={"scenarios": [{"name": "x", "workcentre_availability": {"WC001": -1}}]}).status_code == 400
+    assert client.post("/scenarios", json={"scenarios": [], "rule": "fifo"}).status_code == 400
+    assert client.post("/scenarios", json={"scenarios": [], "bucket": "month"}).status_code == 400
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pytest
+
+import scheduler
+from bom_graph import BomLine
+
+# The scheduler on hand-made inputs. 2023-08-07 is a Monday; the calendar works 8 hours a day
+# from 8 o'clock, Monday to Friday.
+
+MONDAY = datetime(2023, 8, 7, 8)
+LINES = [BomLine("B1", "P1", "C1", 1, 0, "active"), BomLine("B2", "P2", "C1", 1, 0, "active")]
+# P1 runs one operation on WC1; P2 runs WC1 and then WC2
+ROUTINGS = [
+    ("R1", "B1", 1, "WC1", 30, 10),
+    ("R2", "B2", 1, "WC1", 0, 60),
+    ("R3", "B2", 2, "WC2", 0, None),
+]
+WORKCENTRES = [("WC1", 6), ("WC2", 2)]
+
+
+@pytest.fixture
+def calendar():
+    return scheduler.WorkingCalendar(hours_per_day=8, days_per_week=5, day_start=8)
+
+
+def run(calendar, orders, rule="edd"):
+    jobs = scheduler.build_jobs(orders, LINES, ROUTINGS, WORKCENTRES, calendar)
+    gantt = scheduler.schedule(jobs, rule)
+    return {job.order_id: job for job in jobs}, scheduler.report(jobs, gantt, calendar)
+
+
+def test_calendar(calendar):
+    moment = datetime(2023, 8, 9, 10, 30)
+    assert calendar.from_working(calendar.to_working(moment)) == moment
+    # Weekends and evenings wait for the next working period
+    assert calendar.to_working(datetime(2023, 8, 12, 12)) == calendar.to_working(datetime(2023, 8, 14, 8))
+    assert calendar.to_working(datetime(2023, 8, 7, 20)) == calendar.to_working(datetime(2023, 8, 8, 8))
+    # Finishing at the end of Friday is not shown as Monday morning
+    end = calendar.to_working(datetime(2023, 8, 14, 8))
+    assert calendar.from_working(end, end=True) == datetime(2023, 8, 11, 16)
+
+
+@pytest.mark.parametrize("rule, first", [("edd", "O2"), ("spt", "O1")])
+def test_dispatching_rules(calendar, rule, first):
+    # O1 needs 40 minutes and is due last, O2 needs 60 minutes and is due first
+    orders = [
+        ("O1", "P1", 1, MONDAY, datetime(2023, 8, 11, 16)),
+        ("O2", "P1", 3, MONDAY, datetime(2023, 8, 7, 16)),
+    ]
+    jobs, body = run(calendar, orders, rule)
+    assert [op["order_id"] for op in body["workcentres"]["WC1"]["operations"]] == [first, {"O1": "O2", "O2": "O1"}[first]]
+    assert jobs[first].start == calendar.to_working(MONDAY)
+    assert body["workcentres"]["WC1"]["busy_hours"] == pytest.approx(100 / 60)
+    assert body["summary"]["late_orders"] == 0
+
+
+def test_sequences_run_one_after_the_other(calendar):
+    # R2 takes 2 * 60 minutes on WC1, then R3 2 * 30 minutes on WC2 (no runtime: 2 units an hour)
+    jobs, body = run(calendar, [("O3", "P2", 2, MONDAY, datetime(2023, 8, 7, 10))])
+    [first] = body["workcentres"]["WC1"]["operations"]
+    [second] = body["workcentres"]["WC2"]["operations"]
+    assert (first["start"], first["finish"]) == ("2023-08-07T08:00:00", "2023-08-07T10:00:00")
+    assert (second["start"], second["finish"]) == ("2023-08-07T10:00:00", "2023-08-07T11:00:00")
+    [order] = body["orders"]
+    assert order["tardiness_hours"] == pytest.approx(1)
+    assert body["summary"]["late_orders"] == 1
+
+
+def test_orders_without_operations(calendar):
+    # C1 has no BOM and so no routings: the order takes no time
+    _, body = run(calendar, [("O4", "C1", 1, MONDAY, datetime(2023, 8, 7, 16))])
+    [order] = body["orders"]
+    assert (order["start"], order["finish"], order["operations"]) == ("2023-08-07T08:00:00", "2023-08-07T08:00:00", 0)
+
+
+def test_schedule_endpoint(client):
+    body = client.get("/schedule", params={"rule": "cr"}).json()
+    assert body["summary"]["orders"] == len(body["orders"])
+    assert all(order["start"] <= order["finish"] for order in body["orders"])
+    assert client.get("/schedule", params={"rule": "fifo"}).status_code == 422
@@ -0,0 +1,69 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import seed
+from backends import SqliteBackend
+
+# python -m seed into an SQLite database of its own, from a copy of the workcentre CSV that the
+# tests change between runs.
+
+CSV_FILE = "ESA Showcase Workcentre.csv"
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    shutil.copy(os.path.join(os.path.dirname(__file__), "..", "..", CSV_FILE), data_dir / CSV_FILE)
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "seed.sqlite3"))
+    return data_dir
+
+
+def run(data_dir, *args):
+    return seed.main(["--backend", "sqlite", "--data-dir", str(data_dir), "--tables", "Workcentre", *args])
+
+
+def workcentres():
+    connection = SqliteBackend(os.environ["SQLITE_PATH"]).connect()
+    try:
+        return dict(connection.execute("SELECT workcentre_id, capacity FROM dbo.Workcentre$").fetchall())
+    finally:
+        connection.close()
+
+
+def edit(data_dir, change):
+    path = data_dir / CSV_FILE
+    lines = path.read_text(encoding="utf-8-sig").splitlines()
+    path.write_text("\n".join(change(lines)) + "\n", encoding="utf-8")
+
+
+def test_load_and_sync(data_dir, capsys):
+    assert run(data_dir) == 0
+    assert "Workcentre$: 4 rows, 4 inserted" in capsys.readouterr().out
+    assert workcentres().keys() == {"WC001", "WC002", "WC003", "WC004"}
+    assert workcentres()["WC002"] == 10
+
+    # WC002 changes, WC004 goes away and a row that is not a valid workcentre is added
+    edit(data_dir, lambda lines: [line.replace(",10,frames/h", ",12,frames/h") for line in lines if not line.startswith("WC004")] + ["WC009,Broken,Not a workcentre,many,pcs/h,1,2022-01-01 00:00:00,active"])
+    assert run(data_dir, "--diff", "--prune", "--dry-run") == 0
+    out, err = capsys.readouterr()
+    assert f"{CSV_FILE} row 4: capacity" in err
+    assert "Workcentre$: 4 rows, 0 inserted, 1 updated, 2 unchanged, 0 deleted, 1 invalid" in out
+    assert "Workcentre$: 1 deleted" in out
+    assert "Dry run, nothing was written" in out
+    assert len(workcentres()) == 4
+
+    assert run(data_dir, "--diff", "--prune") == 0
+    assert workcentres().keys() == {"WC001", "WC002", "WC003"}
+    assert workcentres()["WC002"] == 12
+
+
+def test_strict(data_dir, capsys):
+    edit(data_dir, lambda lines: lines + [lines[1]])
+    assert run(data_dir, "--strict") == 1
+    assert "nothing was written" in capsys.readouterr().err
+    with pytest.raises(sqlite3.OperationalError):
+        workcentres()